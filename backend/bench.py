@@ -0,0 +1,190 @@
+"""Endpoint benchmark suite.
+
+    python bench.py --db /tmp/bench.db --generate small     # build a dataset and run
+    python bench.py --db /tmp/bench.db                      # rerun against it
+    python bench.py --db /tmp/bench.db --update-baseline    # accept the current numbers
+
+Every route is requested through the Flask test client; for each one the
+p50/p95 latency, the X-Query-Count header and the peak Python heap
+(tracemalloc) are recorded and compared with bench_baseline.json. The exit
+status is 1 when a route regresses: more queries than the baseline, or
+latency/memory beyond the tolerance factor.
+"""
+import os
+import sys
+import json
+import time
+import gc
+import argparse
+import datetime
+import statistics
+import tracemalloc
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+LATENCY_TOLERANCE = 1.5     # allowed p95 slowdown factor
+LATENCY_SLACK_MS = 5.0      # absorbs noise on very fast routes
+MEMORY_TOLERANCE = 1.5
+MEMORY_SLACK_KB = 256
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default='/tmp/pestpro_bench.db', help='SQLite file to benchmark against')
+    parser.add_argument('--generate', metavar='SCALE', help='recreate the database at this scale first')
+    parser.add_argument('--runs', type=int, default=20, help='timed requests per route')
+    parser.add_argument('--only', help='comma-separated route names to run')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    return parser.parse_args()
+
+
+def bench_routes(main, app):
+    """name -> (method, url, kwargs factory) for every endpoint worth timing."""
+    with app.app_context():
+        db = main.db
+        today = datetime.date.today()
+        busiest_day = db.session.query(main.Job.job_date).filter(main.Job.job_date >= today)\
+            .group_by(main.Job.job_date).order_by(db.func.count().desc()).limit(1).scalar() or today
+        busiest_tech = db.session.query(main.Job.technician_id).filter(main.Job.technician_id.isnot(None))\
+            .group_by(main.Job.technician_id).order_by(db.func.count().desc()).limit(1).scalar() or 1
+        busiest_customer = db.session.query(main.Job.customer_id)\
+            .group_by(main.Job.customer_id).order_by(db.func.count().desc()).limit(1).scalar() or 1
+        sample_name = db.session.get(main.Customer, busiest_customer).name.split()[-1]
+
+    counter = iter(range(10 ** 9))
+
+    def upload():
+        n = next(counter)
+        rows = [{'name': f'Bench Upload {n}-{i}', 'address': f'{i} Bench St, Cleveland, OH'} for i in range(100)]
+        return {'json': {'customers': rows}}
+
+    week = f'start={busiest_day.isoformat()}&end={(busiest_day + datetime.timedelta(days=7)).isoformat()}'
+    return {
+        'jobs window': ('GET', f'/api/jobs?{week}', dict),
+        'jobs stream': ('GET', f'/api/jobs?{week}&stream=1', dict),
+        'agenda': ('GET', f'/api/agenda/{busiest_day.isoformat()}', dict),
+        'customer detail': ('GET', f'/api/customers/{busiest_customer}', dict),
+        'customer search': ('GET', f'/api/customers/search?q={sample_name}', dict),
+        'ics feed': ('GET', f'/api/calendar/{busiest_tech}/feed.ics', dict),
+        'bulk upload': ('POST', '/api/customers/bulk-upload', upload),
+        'dashboard': ('GET', '/api/dashboard', dict),
+        'reports': ('GET', '/api/reports', dict),
+        'technicians': ('GET', '/api/technicians', dict),
+        'route': ('GET', f'/api/routes/{busiest_tech}/{busiest_day.isoformat()}', dict),
+        'open slots': ('GET', f'/api/schedule/open-slots?start={busiest_day.isoformat()}', dict),
+        'inventory': ('GET', '/api/inventory', dict),
+        'inventory alerts': ('GET', '/api/inventory?status=Low Stock,Out of Stock&limit=50', dict),
+        'reorder': ('GET', '/api/inventory/reorder-suggestions', dict),
+        'marketing': ('GET', '/api/marketing', dict),
+        'export jobs': ('GET', f'/api/export/jobs?{week}', dict),
+        'jobs nearby': ('GET', f'/api/jobs/nearby?customer_id={busiest_customer}&date={busiest_day.isoformat()}', dict),
+        'tech suggest': ('GET', f'/api/technicians/suggest?customer_id={busiest_customer}'
+                                f'&date={busiest_day.isoformat()}&time=10:00', dict),
+    }
+
+
+def measure(client, method, url, make_kwargs, runs):
+    def request():
+        response = client.open(url, method=method, **make_kwargs())
+        response.get_data()
+        response.close()
+        if response.status_code >= 400:
+            raise SystemExit(f'{method} {url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}')
+        return response
+
+    request()  # warm-up: first-hit caches, statement compilation
+    timings, queries = [], 0
+    gc.collect()
+    gc.disable()  # as timeit does; collector pauses otherwise land on random routes
+    try:
+        for _ in range(runs):
+            started = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, int(response.headers.get('X-Query-Count', 0)))
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    request()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        'queries': queries,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def regressions(results, baseline):
+    problems = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if now['queries'] > before['queries']:
+            problems.append(f"{name}: {now['queries']} queries (baseline {before['queries']})")
+        if now['p95_ms'] > before['p95_ms'] * LATENCY_TOLERANCE + LATENCY_SLACK_MS:
+            problems.append(f"{name}: p95 {now['p95_ms']} ms (baseline {before['p95_ms']} ms)")
+        if now['peak_kb'] > before['peak_kb'] * MEMORY_TOLERANCE + MEMORY_SLACK_KB:
+            problems.append(f"{name}: peak {now['peak_kb']} KB (baseline {before['peak_kb']} KB)")
+    return problems
+
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    os.environ.setdefault('METRICS_ENABLED', 'false')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main as pestpro
+
+    if args.generate:
+        if os.path.exists(args.db):
+            os.remove(args.db)
+        app = pestpro.create_app()  # seeds the empty database with the demo data
+        with app.app_context():
+            started = time.perf_counter()
+            counts = pestpro.generate_dataset(**pestpro.DATASET_SCALES[args.generate])
+        print(f'Generated {counts} in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+    else:
+        app = pestpro.create_app()
+
+    routes = bench_routes(pestpro, app)
+    if args.only:
+        wanted = {name.strip() for name in args.only.split(',')}
+        routes = {name: route for name, route in routes.items() if name in wanted}
+
+    client = app.test_client()
+    results = {}
+    for name, (method, url, make_kwargs) in routes.items():
+        results[name] = measure(client, method, url, make_kwargs, args.runs)
+        if not args.json:
+            r = results[name]
+            print(f"{name:<16} p50 {r['p50_ms']:>8.2f} ms  p95 {r['p95_ms']:>8.2f} ms  "
+                  f"{r['queries']:>3} queries  peak {r['peak_kb']:>9.1f} KB")
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}', file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline to compare against; run with --update-baseline.', file=sys.stderr)
+        return 0
+    with open(args.baseline) as f:
+        problems = regressions(results, json.load(f))
+    for problem in problems:
+        print(f'REGRESSION {problem}', file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
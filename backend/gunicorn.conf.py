@@ -0,0 +1,36 @@
+# Production launcher: gunicorn -c gunicorn.conf.py 'main:create_app()'
+import os
+import multiprocessing
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+# Threaded workers: the ICS feeds and SSE-style long requests mostly wait on
+# I/O, so a few processes with several threads each go further than many
+# single-threaded workers. With SQLite keep WEB_CONCURRENCY low; WAL lets
+# readers run alongside the single writer.
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# The reference cache is per process by default, and a commit only drops the
+# entries in the worker that made it. With several workers, share one cache
+# file on this host instead (set CACHE_URL to redis://... across hosts).
+if workers > 1:
+    os.environ.setdefault('CACHE_URL', 'sqlite:///' + os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'reference-cache.db'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = 200
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # Migrate once in the master, then drop its pooled connections so the
+    # forked workers never share a database connection.
+    from main import create_app, db, reference_cache
+    app = create_app()
+    reference_cache.clear()  # a shared cache file outlives the previous run
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
@@ -1,46 +1,295 @@
 import os
+import re
+import io
+import csv
+import json
+import base64
 import datetime
-from flask import Flask, jsonify, request, Response
+import time
+import bisect
+import itertools
+import heapq
+import sqlite3
+import functools
+import collections
+import random
+import math
+import threading
+import urllib.parse
+import urllib.request
+import gzip
+import zlib
+import atexit
+import smtplib
+import shutil
+import tempfile
+import uuid
+from email.message import EmailMessage
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import click
+from flask import Flask, Blueprint, current_app, jsonify, request, Response, g, has_request_context, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, tuple_, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
 from flask_cors import CORS
 from dotenv import load_dotenv
-from ics import Calendar, Event
+from dateutil.rrule import rrulestr
+from itsdangerous import URLSafeSerializer, BadSignature
+
+try:
+    import numpy as np
+except ImportError:  # route planning is unavailable without NumPy
+    np = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack output is unavailable
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # CSV exports only
+    pa = pq = None
 
 # --- APP INITIALIZATION ---
+# Routes, hooks and CLI commands live on the `api` blueprint; create_app()
+# builds the Flask app around it and binds the database from the final
+# config, so each app can point at a database of its own.
 load_dotenv()
-app = Flask(__name__)
+api = Blueprint('api', __name__, cli_group=None)
+
+def engine_options(url):
+    """Pool settings for the configured database. SQLite only gets pre-ping;
+    its pragmas are applied per connection below."""
+    options = {"pool_pre_ping": True}
+    if not url.startswith('sqlite'):
+        options.update(
+            pool_size=int(os.getenv('DB_POOL_SIZE', '10')),
+            max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '20')),
+            pool_timeout=int(os.getenv('DB_POOL_TIMEOUT', '30')),
+            pool_recycle=int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        )
+    return options
+
+def default_config():
+    return {
+        'SECRET_KEY': os.getenv('SECRET_KEY', 'a-fallback-secret-key'),
+        'SQLALCHEMY_DATABASE_URI': os.getenv('DATABASE_URL', 'sqlite:///pestpro.db'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        # Optional read replica (e.g. a Postgres hot standby) for read-only routes.
+        'READ_DATABASE_URL': os.getenv('READ_DATABASE_URL'),
+    }
+
+class RoutingSession(FlaskSession):
+    """Sends reads to the replica engine inside routes marked @read_replica;
+    flushes, and everything outside those routes, use the primary."""
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_request_context()
+                and g.get('use_replica') and 'replica' in self._db.engines):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+def read_replica(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+# --- SQLITE TUNING ---
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",       # readers don't block the writer
+    "synchronous": "NORMAL",     # safe with WAL, far fewer fsyncs
+    "busy_timeout": os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'),
+    "mmap_size": os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)),
+    "cache_size": "-20000",      # ~20 MB page cache per connection
+}
+
+@event.listens_for(Engine, "connect")
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+# --- INSTRUMENTATION ---
+# Every response carries X-Query-Count so N+1 regressions show up in the
+# browser's network tab instead of in production latency. With
+# METRICS_ENABLED, per-route latency, statement counts and DB time are also
+# collected (per worker process) and served from /api/metrics in the
+# Prometheus text format; statements slower than SLOW_QUERY_MS are logged.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
 
-# --- CORS SETUP ---
-CORS(app, origins=["http://localhost:5173"], supports_credentials=True)
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
 
-# --- DATABASE CONFIGURATION ---
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'a-fallback-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///pestpro.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+    def render(self, name, labels):
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}       # (method, route, status) -> Histogram
+        self.queries = {}       # (method, route) -> Histogram
+        self.db_seconds = {}    # (method, route) -> float
+        self.slow_queries = 0
+        self.collectors = []    # callables yielding extra exposition lines
+
+    def record_request(self, method, route, status, seconds, sql):
+        with self.lock:
+            self.latency.setdefault((method, route, status), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault((method, route), Histogram(QUERY_COUNT_BUCKETS)).observe(sql['count'])
+            self.db_seconds[(method, route)] = self.db_seconds.get((method, route), 0.0) + sql['seconds']
+
+    def render(self):
+        with self.lock:
+            lines = ["# HELP pestpro_http_request_duration_seconds Request latency by route.",
+                     "# TYPE pestpro_http_request_duration_seconds histogram"]
+            for (method, route, status), hist in sorted(self.latency.items()):
+                lines += hist.render("pestpro_http_request_duration_seconds",
+                                     f'method="{method}",route="{route}",status="{status}"')
+            lines += ["# HELP pestpro_db_statements_per_request SQL statements issued per request.",
+                      "# TYPE pestpro_db_statements_per_request histogram"]
+            for (method, route), hist in sorted(self.queries.items()):
+                lines += hist.render("pestpro_db_statements_per_request", f'method="{method}",route="{route}"')
+            lines += ["# HELP pestpro_db_seconds_total Time spent in SQL statements.",
+                      "# TYPE pestpro_db_seconds_total counter"]
+            lines += [f'pestpro_db_seconds_total{{method="{m}",route="{r}"}} {v:.6f}'
+                      for (m, r), v in sorted(self.db_seconds.items())]
+            lines += ["# HELP pestpro_db_slow_queries_total Statements slower than SLOW_QUERY_MS.",
+                      "# TYPE pestpro_db_slow_queries_total counter",
+                      f"pestpro_db_slow_queries_total {self.slow_queries}"]
+        for collector in self.collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        sql = g.setdefault('sql', {'count': 0, 'seconds': 0.0})
+        sql['count'] += 1
+    if METRICS_ENABLED:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def time_query(conn, cursor, statement, parameters, context, executemany):
+    if not METRICS_ENABLED or not conn.info.get('query_started'):
+        return
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    if has_request_context() and 'sql' in g:
+        g.sql['seconds'] += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        with metrics.lock:
+            metrics.slow_queries += 1
+        route = request.url_rule.rule if has_request_context() and request.url_rule else '-'
+        current_app.logger.warning("Slow query (%.1f ms) on %s: %s | params=%.200r",
+                           elapsed * 1000, route, statement, parameters)
+
+@api.before_app_request
+def start_request_timer():
+    g.sql = {'count': 0, 'seconds': 0.0}
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+
+@api.after_app_request
+def add_query_count_header(response):
+    sql = g.get('sql', {'count': 0})
+    response.headers['X-Query-Count'] = str(sql['count'])
+    if METRICS_ENABLED and 'request_started' in g:
+        # Recorded when the body is done, so streamed responses are timed
+        # (and their statements counted) to the last byte.
+        started, method = g.request_started, request.method
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = response.status_code
+        response.call_on_close(lambda: metrics.record_request(
+            method, route, status, time.perf_counter() - started, sql))
+    return response
+
+@api.route('/api/metrics')
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # --- MODELS ---
+class SyncTracked:
+    # Maintained by the change feed (see DELTA SYNC) on every ORM write.
+    updated_at = db.Column(db.DateTime, nullable=True)
+    row_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     role = db.Column(db.String(50), nullable=False)
 
-class Customer(db.Model):
+class Customer(SyncTracked, db.Model):
+    __table_args__ = (
+        db.Index('ix_customer_name_address', 'name', 'address'),
+        db.Index('ix_customer_dedupe_key', 'dedupe_key'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     address = db.Column(db.String(200), nullable=True)
     phone = db.Column(db.String(20), nullable=True)
     email = db.Column(db.String(120), nullable=True)
+    segment = db.Column(db.String(20), nullable=True)  # 'Residential' / 'Commercial'; null counts as residential
+    # Normalized "name|address" for duplicate checks; see CUSTOMER DEDUPLICATION
+    dedupe_key = db.Column(db.String(300), nullable=True)
 
-class Property(db.Model):
+class Property(SyncTracked, db.Model):
+    __table_args__ = (
+        db.Index('ix_property_customer_primary', 'customer_id', 'is_primary'),
+        db.Index('ix_property_grid_cell', 'grid_cell'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     label = db.Column(db.String(100), nullable=True)
     address = db.Column(db.String(200), nullable=False)
     notes = db.Column(db.Text, nullable=True)
     is_primary = db.Column(db.Boolean, default=False)
+    # Cached coordinates for the address (client-supplied or geocoded once)
+    lat = db.Column(db.Float, nullable=True)
+    lng = db.Column(db.Float, nullable=True)
+    # Spatial grid index over (lat, lng); see TERRITORIES / SPATIAL INDEX
+    grid_cell = db.Column(db.Integer, nullable=True)
 
-class Contact(db.Model):
+class Contact(SyncTracked, db.Model):
+    __table_args__ = (
+        db.Index('ix_contact_customer_primary', 'customer_id', 'is_primary'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -49,7 +298,16 @@ class Contact(db.Model):
     title = db.Column(db.String(100), nullable=True)
     is_primary = db.Column(db.Boolean, default=False)
 
-class Job(db.Model):
+class Job(SyncTracked, db.Model):
+    __table_args__ = (
+        db.Index('ix_job_date_time', 'job_date', 'job_time'),             # agenda, schedule window
+        db.Index('ix_job_tech_status_date', 'technician_id', 'status', 'job_date'),  # ICS feeds
+        db.Index('ix_job_customer_date', 'customer_id', 'job_date'),       # customer detail
+        db.Index('ix_job_tech_date_time', 'technician_id', 'job_date', 'job_time'),  # conflicts, routes
+        db.Index('ix_job_plan_occurrence', 'plan_id', 'occurrence_date', unique=True),
+        # Archived jobs keep their ids, so SQLite must never hand one out again
+        {'sqlite_autoincrement': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     technician_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
@@ -62,8 +320,81 @@ class Job(db.Model):
     status = db.Column(db.String(50), default='Scheduled')
     job_date = db.Column(db.Date, nullable=False)
     job_time = db.Column(db.Time, nullable=True)
+    price = db.Column(db.Float, nullable=True)  # falls back to DEFAULT_JOB_PRICE in revenue figures
+    duration_minutes = db.Column(db.Integer, nullable=False, default=60, server_default='60')
+    # Set when the job is a materialized occurrence of a ServicePlan
+    plan_id = db.Column(db.Integer, db.ForeignKey('service_plan.id'), nullable=True)
+    occurrence_date = db.Column(db.Date, nullable=True)
+
+class JobArchive(db.Model):
+    # Closed jobs moved out of `job` by archive_jobs(): same columns and ids,
+    # read-only from then on.
+    __table_args__ = (
+        db.Index('ix_job_archive_customer_date', 'customer_id', 'job_date'),
+        db.Index('ix_job_archive_date_time', 'job_date', 'job_time'),
+        db.Index('ix_job_archive_tech_date', 'technician_id', 'job_date'),
+        db.Index('ix_job_archive_plan_occurrence', 'plan_id', 'occurrence_date'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    technician_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    property_id = db.Column(db.Integer, db.ForeignKey('property.id'), nullable=True)
+    contact_id = db.Column(db.Integer, db.ForeignKey('contact.id'), nullable=True)
+    description = db.Column(db.String(500))
+    notes = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(50))
+    job_date = db.Column(db.Date, nullable=False)
+    job_time = db.Column(db.Time, nullable=True)
+    price = db.Column(db.Float, nullable=True)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=60)
+    plan_id = db.Column(db.Integer, db.ForeignKey('service_plan.id'), nullable=True)
+    occurrence_date = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    row_version = db.Column(db.Integer, nullable=False, default=1)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class ServicePlan(db.Model):
+    # A recurring contract. Occurrences are expanded from `rrule` on demand;
+    # a Job row only exists once an occurrence is edited or completed.
+    __table_args__ = (
+        db.Index('ix_service_plan_customer', 'customer_id'),
+        db.Index('ix_service_plan_tech_active', 'technician_id', 'active'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    property_id = db.Column(db.Integer, db.ForeignKey('property.id'), nullable=True)
+    contact_id = db.Column(db.Integer, db.ForeignKey('contact.id'), nullable=True)
+    technician_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    description = db.Column(db.String(500), nullable=False)
+    notes = db.Column(db.Text, nullable=True)
+    rrule = db.Column(db.String(500), nullable=False)   # e.g. FREQ=MONTHLY;INTERVAL=3;COUNT=20
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=True)        # last occurrence; null = open-ended
+    job_time = db.Column(db.Time, nullable=True)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=60)
+    price = db.Column(db.Float, nullable=True)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+
+class Territory(db.Model):
+    # A technician's service zone: a radius around a centre, or a polygon
+    # given as JSON [[lat, lng], ...].
+    __table_args__ = (
+        db.Index('ix_territory_technician', 'technician_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    technician_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    center_lat = db.Column(db.Float, nullable=True)
+    center_lng = db.Column(db.Float, nullable=True)
+    radius_km = db.Column(db.Float, nullable=True)
+    polygon = db.Column(db.Text, nullable=True)
+    active = db.Column(db.Boolean, nullable=False, default=True)
 
 class Inventory(db.Model):
+    __table_args__ = (
+        db.Index('ix_inventory_status_expiration', 'stock_status', 'expirationDate'),  # alerts, status filter
+        db.Index('ix_inventory_expiration', 'expirationDate'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     category = db.Column(db.String(100), nullable=True)
@@ -75,138 +406,3343 @@ class Inventory(db.Model):
     supplier = db.Column(db.String(100), nullable=True)
     lastOrdered = db.Column(db.Date, nullable=True)
     expirationDate = db.Column(db.Date, nullable=True)
+    # Derived from currentStock/minStock; kept in step by the stock ledger
+    stock_status = db.Column(db.String(20), nullable=False, default='In Stock', server_default='In Stock')
+
+class StockMovement(db.Model):
+    # Append-only stock ledger; quantity is signed (usage is negative).
+    __table_args__ = (
+        db.Index('ix_stock_movement_item_created', 'inventory_id', 'created_at'),
+        db.Index('ix_stock_movement_kind_created', 'kind', 'created_at'),
+        db.Index('ix_stock_movement_job', 'job_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # opening, receipt, usage, reversal, adjustment
+    job_id = db.Column(db.Integer, nullable=True)    # no FK: ledger rows outlive the job row
+    note = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+class JobMaterial(db.Model):
+    # Products a job uses; posted to the ledger when the job is completed.
+    __table_args__ = (
+        db.UniqueConstraint('job_id', 'inventory_id', name='uq_job_material'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id'), nullable=False)
+    inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+
+class MarketingCampaign(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(150), nullable=False)
+    type = db.Column(db.String(50))
+    audience = db.Column(db.String(50))
+    status = db.Column(db.String(50), default='Draft')
+    sent = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0, server_default='0')
+    opened = db.Column(db.Integer, default=0)
+    clicked = db.Column(db.Integer, default=0)
+    revenue = db.Column(db.Float, default=0.0)
+    createdDate = db.Column(db.Date)
+    content_subject = db.Column(db.String(200))
+    content_body = db.Column(db.Text)
+
+class CampaignRecipient(db.Model):
+    # One row per resolved address; the sender works through the queued ones.
+    __table_args__ = (
+        db.UniqueConstraint('campaign_id', 'address', name='uq_campaign_recipient_address'),
+        db.Index('ix_campaign_recipient_status', 'campaign_id', 'status', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('marketing_campaign.id'), nullable=False)
+    customer_id = db.Column(db.Integer, nullable=True)
+    address = db.Column(db.String(120), nullable=False)   # email or phone, normalized
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, sending, sent, failed
+    claim = db.Column(db.String(32), nullable=True)        # the sender batch that took the row
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.String(200), nullable=True)
+
+class ChangeLog(db.Model):
+    # id is the delta-sync token; AUTOINCREMENT so ids are never reused after pruning
+    __table_args__ = (
+        db.Index('ix_change_log_entity_id', 'entity', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)    # job, customer, property, contact
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)        # insert, update, delete
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+class Task(db.Model):
+    # A background operation run by the task runner; params/result are JSON.
+    __table_args__ = (
+        db.Index('ix_task_status_created', 'status', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed, cancelled
+    params = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(200), nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False)  # heartbeat
+
+class JobDailyStat(db.Model):
+    # Rollup of jobs per (day, technician, status); technician_id 0 = unassigned.
+    day = db.Column(db.Date, primary_key=True)
+    technician_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(50), primary_key=True)
+    job_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class RowCount(db.Model):
+    # Live row count of a counted table (see COUNTED_MODELS), kept in step on flush.
+    table_name = db.Column(db.String(50), primary_key=True)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+
+class SchemaVersion(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200))
+    applied_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class FeedVersion(db.Model):
+    # Bumped whenever one of the technician's jobs (or the customer/property
+    # shown on them) changes; drives the ICS feed cache and its ETag.
+    technician_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+DEFAULT_JOB_MINUTES = 60
+
+# --- REFERENCE DATA CACHE ---
+# Users, the technician list, territories and customer summaries are read by
+# nearly every page and job list but rarely change, so they are cached as plain dicts:
+# in-process with TTL + LRU eviction by default, or in a store shared by all
+# workers when CACHE_URL is set (redis://... with the redis module, or
+# sqlite:////path/cache.db as a single-host stand-in). After each commit
+# exactly the users/customers the transaction touched are dropped; writes
+# that bypass the ORM call invalidate_reference_data() themselves. Those
+# drops only reach the workers that share the store, so gunicorn.conf.py
+# points multi-worker deploys at a SQLite cache file unless CACHE_URL is set.
+CACHE_URL = os.getenv('CACHE_URL')
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', '300'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+
+class LocalCache:
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()  # key -> (expires_at, value), oldest use first
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        now, found = time.monotonic(), {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] <= now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, mapping):
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            for key, value in mapping.items():
+                self.entries[key] = (expires, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class SqliteCache:
+    """Cache table in a SQLite file that every worker on the host opens; a
+    stand-in for a cache server in development and single-host deploys.
+    Expired rows are pruned by the first write after each TTL period."""
+    def __init__(self, path, ttl=CACHE_TTL_SECONDS):
+        self.path, self.ttl = path, ttl
+        self.local = threading.local()
+        self.next_prune = 0.0
+        self.connection().execute("CREATE TABLE IF NOT EXISTS cache "
+                                  "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+
+    def connection(self):
+        if getattr(self.local, 'conn', None) is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return self.local.conn
+
+    def get_many(self, keys):
+        found = {}
+        for chunk in iter_chunks(keys, IN_BATCH_SIZE):
+            rows = self.connection().execute(
+                f"SELECT key, value FROM cache WHERE expires_at > ? AND key IN ({','.join('?' * len(chunk))})",
+                [time.time(), *chunk])
+            found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def set_many(self, mapping):
+        now = time.time()
+        conn = self.connection()
+        conn.executemany("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                         [(k, json.dumps(v), now + self.ttl) for k, v in mapping.items()])
+        if now >= self.next_prune:
+            self.next_prune = now + self.ttl
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+    def delete(self, keys):
+        self.connection().executemany("DELETE FROM cache WHERE key = ?", [(k,) for k in keys])
+
+    def clear(self):
+        self.connection().execute("DELETE FROM cache")
+
+class RedisCache:
+    PREFIX = 'pestpro:'
+
+    def __init__(self, url, ttl=CACHE_TTL_SECONDS):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        values = self.client.mget([self.PREFIX + k for k in keys]) if keys else []
+        return {k: json.loads(v) for k, v in zip(keys, values) if v is not None}
+
+    def set_many(self, mapping):
+        pipe = self.client.pipeline()
+        for key, value in mapping.items():
+            pipe.setex(self.PREFIX + key, self.ttl, json.dumps(value))
+        pipe.execute()
+
+    def delete(self, keys):
+        if keys:
+            self.client.delete(*[self.PREFIX + k for k in keys])
+
+    def clear(self):
+        for key in self.client.scan_iter(self.PREFIX + '*'):
+            self.client.delete(key)
+
+def cache_backend(url):
+    if not url:
+        return LocalCache()
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisCache(url)
+    if url.startswith('sqlite:///'):
+        return SqliteCache(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+class ReferenceCache:
+    """Read-through front for the backend with hit/miss counts per namespace
+    (the part of the key before ':'). Cached values are shared; don't mutate them."""
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+
+    def get_many(self, namespace, ids, loader):
+        """{id: value} for ids, calling loader(missing_ids) -> {id: value} for the misses."""
+        keys = {i: f"{namespace}:{i}" for i in set(ids) if i is not None}
+        found = self.backend.get_many(list(keys.values()))
+        result = {i: found[key] for i, key in keys.items() if key in found}
+        missing = [i for i in keys if i not in result]
+        self.hits[namespace] += len(result)
+        self.misses[namespace] += len(missing)
+        if missing:
+            loaded = loader(missing)
+            self.backend.set_many({keys[i]: value for i, value in loaded.items()})
+            result.update(loaded)
+        return result
+
+    def get(self, key, loader):
+        namespace = key.split(':', 1)[0]
+        found = self.backend.get_many([key])
+        if key in found:
+            self.hits[namespace] += 1
+            return found[key]
+        self.misses[namespace] += 1
+        value = loader()
+        self.backend.set_many({key: value})
+        return value
+
+    def invalidate(self, keys):
+        if keys:
+            self.backend.delete(list(keys))
+
+    def clear(self):
+        self.backend.clear()
+
+    def metric_lines(self):
+        lines = ["# HELP pestpro_cache_requests_total Reference cache lookups by namespace and result.",
+                 "# TYPE pestpro_cache_requests_total counter"]
+        for result, counts in (("hit", self.hits), ("miss", self.misses)):
+            lines += [f'pestpro_cache_requests_total{{namespace="{ns}",result="{result}"}} {n}'
+                      for ns, n in sorted(counts.items())]
+        return lines
+
+reference_cache = ReferenceCache(cache_backend(CACHE_URL))
+metrics.collectors.append(reference_cache.metric_lines)
+
+def user_summary(u: User):
+    return {"id": u.id, "email": u.email, "role": u.role}
+
+def customer_summary(c: Customer):
+    return {"id": c.id, "name": c.name, "address": c.address, "phone": c.phone, "email": c.email}
+
+def cached_users(ids):
+    return reference_cache.get_many('user', ids, lambda missing: {
+        u.id: user_summary(u) for u in load_by_ids(User, missing).values()})
+
+def cached_customers(ids):
+    return reference_cache.get_many('customer', ids, lambda missing: {
+        c.id: customer_summary(c) for c in load_by_ids(Customer, missing).values()})
+
+def cached_technicians():
+    return reference_cache.get('technicians', lambda: [
+        {"id": tech.id, "title": tech.email.split('@')[0].capitalize()}
+        for tech in User.query.filter_by(role='Technician').all()])
+
+def invalidate_reference_data(user_ids=(), customer_ids=(), territory_ids=()):
+    keys = {f"customer:{i}" for i in customer_ids}
+    if user_ids:
+        keys |= {f"user:{i}" for i in user_ids} | {'users', 'technicians'}
+    if territory_ids:
+        keys.add('territories')
+    reference_cache.invalidate(keys)
+
+@event.listens_for(Session, "after_flush")
+def collect_reference_changes(session, flush_context):
+    changed = session.info.setdefault('reference_changes', (set(), set(), set()))
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            changed[0].add(obj.id)
+        elif isinstance(obj, Customer) and obj not in session.new:
+            changed[1].add(obj.id)
+        elif isinstance(obj, Territory):
+            changed[2].add(obj.id)
+
+@event.listens_for(Session, "after_commit")
+def invalidate_reference_changes(session):
+    user_ids, customer_ids, territory_ids = session.info.pop('reference_changes', (set(), set(), set()))
+    if user_ids or customer_ids or territory_ids:
+        invalidate_reference_data(user_ids, customer_ids, territory_ids)
+
+@event.listens_for(Session, "after_rollback")
+def discard_reference_changes(session):
+    session.info.pop('reference_changes', None)
+
+# --- HELPERS / SERIALIZERS ---
+def serialize_property(p: Property):
+    return {
+        "id": p.id,
+        "label": p.label,
+        "address": p.address,
+        "notes": p.notes,
+        "is_primary": bool(p.is_primary),
+        "lat": p.lat,
+        "lng": p.lng,
+    }
+
+def serialize_customer(c: Customer):
+    return {"id": c.id, "name": c.name, "address": c.address, "phone": c.phone, "email": c.email,
+            "segment": c.segment}
+
+def serialize_contact(c: Contact):
+    return {
+        "id": c.id,
+        "name": c.name,
+        "phone": c.phone,
+        "email": c.email,
+        "title": c.title,
+        "is_primary": bool(c.is_primary),
+    }
+
+# SQLite caps bound parameters per statement, so IN lists are sent in slices.
+IN_BATCH_SIZE = 500
+
+def load_by_ids(model, ids):
+    """Fetch rows of `model` for the given ids in IN-batches, keyed by id."""
+    ids = list({i for i in ids if i is not None})
+    found = {}
+    for start in range(0, len(ids), IN_BATCH_SIZE):
+        chunk = ids[start:start + IN_BATCH_SIZE]
+        for row in model.query.filter(model.id.in_(chunk)).all():
+            found[row.id] = row
+    return found
+
+def build_job_payload(job: Job, customer, technician, prop, contact):
+    # customer/technician are the cached summary dicts
+    start_datetime = datetime.datetime.combine(
+        job.job_date, job.job_time if job.job_time else datetime.time(9, 0)
+    )
+    end_datetime = start_datetime + datetime.timedelta(minutes=job.duration_minutes or DEFAULT_JOB_MINUTES)
+    payload = {
+        "id": job.id,
+        "title": f"{customer['name']} - {job.description}",
+        "start": start_datetime.isoformat(),
+        "end": end_datetime.isoformat(),
+        "duration_minutes": job.duration_minutes,
+        "description": job.description,
+        "notes": job.notes,
+        "status": job.status,
+        "job_date": job.job_date.isoformat(),
+        "job_time": job.job_time.strftime('%H:%M') if job.job_time else None,
+        "customer": dict(customer),
+        "technician_id": job.technician_id,
+        "resourceId": job.technician_id,
+        "price": job.price,
+        "technician_name": technician['email'].split('@')[0].capitalize() if technician else "Unassigned",
+        "color": 'green' if job.status == 'Completed' else 'blue',
+    }
+
+    if isinstance(job, JobArchive):
+        payload["archived"] = True
+        payload["editable"] = False
+    if prop:
+        payload["property"] = serialize_property(prop)
+    if contact:
+        payload["contact"] = serialize_contact(contact)
+    if job.plan_id:
+        payload["plan_id"] = job.plan_id
+        payload["occurrence_date"] = job.occurrence_date.isoformat()
+        if job.id is None:
+            payload["id"] = occurrence_id(job.plan_id, job.occurrence_date)
+            payload["virtual"] = True
+
+    return payload
+
+def serialize_jobs(jobs):
+    """Serialize many jobs with one IN-batched query per related table
+    instead of four lookups per job; customers and technicians usually come
+    from the reference cache."""
+    customers = cached_customers(j.customer_id for j in jobs)
+    technicians = cached_users(j.technician_id for j in jobs)
+    props = load_by_ids(Property, (j.property_id for j in jobs))
+    contacts = load_by_ids(Contact, (j.contact_id for j in jobs))
+    return [
+        build_job_payload(
+            job,
+            customers[job.customer_id],
+            technicians.get(job.technician_id),
+            props.get(job.property_id),
+            contacts.get(job.contact_id),
+        )
+        for job in jobs
+    ]
+
+def format_job(job: Job):
+    return serialize_jobs([job])[0]
+
+def parse_date_param(value):
+    """Accept YYYY-MM-DD or a full ISO datetime (as sent by FullCalendar)."""
+    return datetime.date.fromisoformat(value[:10])
+
+# --- JOB WINDOW / KEYSET PAGINATION ---
+JOBS_PAGE_SIZE = 500
+JOBS_MAX_PAGE_SIZE = 2000
+JOB_WINDOW_PARAMS = ('start', 'end', 'technician_id', 'status', 'limit', 'cursor')
+CUSTOMER_JOBS_PAGE_SIZE = 50
+
+# Jobs without a time sort first within their day.
+job_sort_time = db.func.coalesce(Job.job_time, datetime.time(0, 0))
+
+def encode_job_cursor(job_date, job_time, job_id):
+    raw = f"{job_date.isoformat()}|{job_time.isoformat()}|{job_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_job_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    date_str, time_str, job_id = raw.split('|')
+    return datetime.date.fromisoformat(date_str), datetime.time.fromisoformat(time_str), int(job_id)
+
+def parse_page_limit(value, default):
+    """A ?limit= page size; ValueError unless it is a positive integer."""
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"limit must be a positive integer, got {value!r}")
+    if limit < 1:
+        raise ValueError(f"limit must be a positive integer, got {value!r}")
+    return limit
+
+def query_job_window(args):
+    """Jobs in [start, end) matching the technician/status filters, ordered by
+    (job_date, job_time, id) and paged with a keyset cursor on that tuple.
+    Returns (jobs, next_cursor)."""
+    limit = min(parse_page_limit(args.get('limit'), JOBS_PAGE_SIZE), JOBS_MAX_PAGE_SIZE)
+    jobs = job_window_query(Job, args).limit(limit + 1).all()
+    if reaches_archive(parse_date_param(args['start']) if args.get('start') else None):
+        jobs = sorted(jobs + job_window_query(JobArchive, args).limit(limit + 1).all(), key=job_sort_key)
+
+    # Service plan occurrences join the page when the window is bounded.
+    # They sort as if their id were -plan_id, which keeps the cursor total.
+    if args.get('start') and args.get('end') and (not args.get('status') or 'Scheduled' in args['status'].split(',')):
+        start, end = parse_date_param(args['start']), parse_date_param(args['end'])
+        tech_ids = [int(t) for t in args['technician_id'].split(',')] if args.get('technician_id') else None
+        occurrences = expand_plans(active_plans(start, end, tech_ids), start, end)
+        if args.get('cursor'):
+            after = decode_job_cursor(args['cursor'])
+            occurrences = [o for o in occurrences if job_sort_key(o) > after]
+        jobs = sorted(jobs + occurrences, key=job_sort_key)
+
+    next_cursor = None
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        next_cursor = encode_job_cursor(*job_sort_key(jobs[-1]))
+    return jobs, next_cursor
+
+def job_window_query(model, args):
+    """The filtered, cursor-positioned window query on Job or JobArchive."""
+    sort_time = job_sort_time if model is Job else db.func.coalesce(model.job_time, datetime.time(0, 0))
+    query = model.query
+    if args.get('start'):
+        query = query.filter(model.job_date >= parse_date_param(args['start']))
+    if args.get('end'):
+        query = query.filter(model.job_date < parse_date_param(args['end']))
+    if args.get('technician_id'):
+        tech_ids = [int(t) for t in args['technician_id'].split(',')]
+        query = query.filter(model.technician_id.in_(tech_ids))
+    if args.get('status'):
+        query = query.filter(model.status.in_(args['status'].split(',')))
+    if args.get('cursor'):
+        query = query.filter(
+            tuple_(model.job_date, sort_time, model.id) > tuple_(*decode_job_cursor(args['cursor']))
+        )
+    return query.order_by(model.job_date, sort_time, model.id)
+
+def job_sort_key(job):
+    return job.job_date, job.job_time or datetime.time(0, 0), job.id if job.id is not None else -job.plan_id
+
+def customer_job_history(customer_id, cursor=None, limit=CUSTOMER_JOBS_PAGE_SIZE):
+    """One page of a customer's jobs, newest first, with a keyset cursor.
+    The archive is only read once the page reaches back past its cutoff."""
+    def page(model):
+        sort_time = job_sort_time if model is Job else db.func.coalesce(model.job_time, datetime.time(0, 0))
+        query = model.query.filter(model.customer_id == customer_id)
+        if cursor:
+            query = query.filter(tuple_(model.job_date, sort_time, model.id) < tuple_(*decode_job_cursor(cursor)))
+        return query.order_by(model.job_date.desc(), sort_time.desc(), model.id.desc()).limit(limit + 1).all()
+
+    jobs = page(Job)
+    if len(jobs) <= limit or jobs[limit].job_date < archive_cutoff():
+        jobs = sorted(jobs + page(JobArchive), key=job_sort_key, reverse=True)
+    next_cursor = None
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        next_cursor = encode_job_cursor(*job_sort_key(jobs[-1]))
+    return jobs, next_cursor
+
+# --- SERVICE PLANS (RECURRING JOBS) ---
+# Occurrences are expanded only for the window being read. An occurrence
+# becomes a Job (plan_id, occurrence_date) the first time it is edited or
+# completed; until then it is served as a transient Job with no id.
+PLAN_FEED_LOOKBACK_DAYS = 30
+PLAN_FEED_HORIZON_DAYS = 365
+
+event.listen(ServicePlan.technician_id, 'set', lambda *args: None, active_history=True)
+
+def occurrence_id(plan_id, day):
+    return f"plan-{plan_id}-{day.isoformat()}"
+
+def plan_rule(rule, start_date):
+    return rrulestr(rule, dtstart=datetime.datetime.combine(start_date, datetime.time(0, 0)))
+
+def plan_end_date(rule, start_date):
+    """Date of the last occurrence, or None for an open-ended rule."""
+    parsed = plan_rule(rule, start_date)
+    if not re.search(r'\b(COUNT|UNTIL)=', rule.upper()):
+        return None
+    last = None
+    for last in parsed:
+        pass
+    return last.date() if last else start_date
+
+def plan_occurrence_dates(plan, start, end):
+    """Occurrence dates of `plan` in [start, end)."""
+    window = plan_rule(plan.rrule, plan.start_date).between(
+        datetime.datetime.combine(start, datetime.time(0, 0)),
+        datetime.datetime.combine(end, datetime.time(0, 0)), inc=True)
+    return [d.date() for d in window if d.date() < end]
+
+def active_plans(start, end, technician_ids=None):
+    query = ServicePlan.query.filter(
+        ServicePlan.active.is_(True), ServicePlan.start_date < end,
+        db.or_(ServicePlan.end_date.is_(None), ServicePlan.end_date >= start))
+    if technician_ids is not None:
+        query = query.filter(ServicePlan.technician_id.in_(technician_ids))
+    return query.all()
+
+def occurrence_job(plan, day):
+    return Job(
+        customer_id=plan.customer_id, technician_id=plan.technician_id,
+        property_id=plan.property_id, contact_id=plan.contact_id,
+        description=plan.description, notes=plan.notes, status='Scheduled',
+        job_date=day, job_time=plan.job_time, duration_minutes=plan.duration_minutes,
+        price=plan.price, plan_id=plan.id, occurrence_date=day,
+    )
+
+def expand_plans(plans, start, end):
+    """Transient jobs for the not-yet-materialized occurrences in [start, end)."""
+    if not plans:
+        return []
+    materialized = set()
+    for model in (Job, JobArchive) if reaches_archive(start) else (Job,):
+        materialized.update(db.session.query(model.plan_id, model.occurrence_date).filter(
+            model.plan_id.in_([p.id for p in plans]),
+            model.occurrence_date >= start, model.occurrence_date < end).all())
+    return [
+        occurrence_job(plan, day)
+        for plan in plans
+        for day in plan_occurrence_dates(plan, start, end)
+        if (plan.id, day) not in materialized
+    ]
+
+def materialize_occurrence(plan, day):
+    """The Job for an occurrence, creating it from the plan if needed."""
+    job = Job.query.filter_by(plan_id=plan.id, occurrence_date=day).first()
+    if job is None:
+        job = occurrence_job(plan, day)
+        db.session.add(job)
+    return job
+
+def serialize_plan(plan: ServicePlan):
+    return {
+        "id": plan.id, "customer_id": plan.customer_id, "property_id": plan.property_id,
+        "contact_id": plan.contact_id, "technician_id": plan.technician_id,
+        "description": plan.description, "notes": plan.notes, "rrule": plan.rrule,
+        "start_date": plan.start_date.isoformat(),
+        "end_date": plan.end_date.isoformat() if plan.end_date else None,
+        "job_time": plan.job_time.strftime('%H:%M') if plan.job_time else None,
+        "duration_minutes": plan.duration_minutes, "price": plan.price, "active": plan.active,
+    }
+
+def apply_plan_fields(plan, data):
+    for field in ('customer_id', 'property_id', 'contact_id', 'technician_id', 'description', 'notes', 'price'):
+        if field in data:
+            setattr(plan, field, data[field])
+    if 'duration_minutes' in data:
+        plan.duration_minutes = int(data['duration_minutes'])
+    if 'job_time' in data:
+        plan.job_time = datetime.time.fromisoformat(data['job_time']) if data['job_time'] else None
+    if 'start_date' in data:
+        plan.start_date = datetime.date.fromisoformat(data['start_date'])
+    if 'rrule' in data:
+        plan.rrule = data['rrule'].strip()
+    if not plan.description or not plan.rrule or not plan.start_date or not plan.customer_id:
+        raise ValueError("customer_id, description, rrule and start_date are required")
+    plan.end_date = plan_end_date(plan.rrule, plan.start_date)  # also validates the rule
+
+# --- ICS FEEDS ---
+# Feeds are rendered with a small line writer rather than the ics object
+# model, cached per (technician, horizon, day) and validated against the
+# technician's FeedVersion so polls of an unchanged feed cost one query.
+ICS_DEFAULT_HORIZON_DAYS = int(os.getenv('ICS_HORIZON_DAYS', '0')) or None
+ICS_CACHE_MAX_ENTRIES = 1024
+
+_ics_cache = {}
+_ics_cache_lock = threading.Lock()
+
+def bump_feed_versions(connection, technician_ids):
+    now = datetime.datetime.utcnow()
+    table = FeedVersion.__table__
+    for tech_id in technician_ids:
+        result = connection.execute(
+            table.update().where(table.c.technician_id == tech_id)
+            .values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(technician_id=tech_id, version=1, updated_at=now))
+
+def _attr_values(obj, attr):
+    """Current value plus any value replaced since the last flush."""
+    history = inspect(obj).attrs[attr].history
+    return [getattr(obj, attr), *history.deleted]
+
+@event.listens_for(Session, "after_flush")
+def invalidate_feeds_on_flush(session, flush_context):
+    tech_ids = set()
+    customer_ids, property_ids = set(), set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Job, ServicePlan)):
+            tech_ids.update(_attr_values(obj, 'technician_id'))
+        elif isinstance(obj, Customer) and obj not in session.new:
+            customer_ids.add(obj.id)
+        elif isinstance(obj, Property) and obj not in session.new:
+            property_ids.add(obj.id)
+    if customer_ids or property_ids:
+        linked = db.select(Job.technician_id).distinct().where(
+            db.or_(Job.customer_id.in_(customer_ids), Job.property_id.in_(property_ids))
+        )
+        tech_ids.update(session.connection().execute(linked).scalars())
+        linked_plans = db.select(ServicePlan.technician_id).distinct().where(
+            db.or_(ServicePlan.customer_id.in_(customer_ids), ServicePlan.property_id.in_(property_ids))
+        )
+        tech_ids.update(session.connection().execute(linked_plans).scalars())
+    tech_ids.discard(None)
+    if tech_ids:
+        bump_feed_versions(session.connection(), sorted(tech_ids))
+
+def ics_escape(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+def ics_line(name, value):
+    """One content line, folded at 75 octets as RFC 5545 requires."""
+    line = f"{name}:{value}".encode('utf-8')
+    parts = []
+    while len(line) > 75:
+        cut = 75 if not parts else 74
+        while cut and (line[cut] & 0xC0) == 0x80:  # don't split a UTF-8 sequence
+            cut -= 1
+        parts.append(line[:cut])
+        line = line[cut:]
+    parts.append(line)
+    return b"\r\n ".join(parts).decode('utf-8') + "\r\n"
+
+def ics_datetime(value):
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+def job_uid(job):
+    # Plan occurrences keep one UID whether or not they have been materialized.
+    if job.plan_id:
+        return f"{occurrence_id(job.plan_id, job.occurrence_date)}@pestpro"
+    return f"job-{job.id}@pestpro"
+
+def iter_ics_feed(rows):
+    """Yield the feed as text chunks from (Job, customer_name, customer_address,
+    customer_phone, property_address) rows."""
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//PestPro//Technician Feed//EN\r\n"
+    stamp = ics_datetime(datetime.datetime.utcnow())
+    for job, cust_name, cust_address, cust_phone, prop_address in rows:
+        start_time = datetime.datetime.combine(job.job_date, job.job_time if job.job_time else datetime.time(9, 0))
+        end_time = start_time + datetime.timedelta(minutes=job.duration_minutes or DEFAULT_JOB_MINUTES)
+        loc_address = prop_address if prop_address else cust_address
+        description = (
+            f"Customer: {cust_name}\n"
+            f"Address: {loc_address}\n"
+            f"Phone: {cust_phone}\n"
+            f"Notes: {job.notes or 'N/A'}"
+        )
+        yield (
+            "BEGIN:VEVENT\r\n"
+            + ics_line("UID", job_uid(job))
+            + ics_line("DTSTAMP", stamp)
+            + ics_line("DTSTART", ics_datetime(start_time))
+            + ics_line("DTEND", ics_datetime(end_time))
+            + ics_line("SUMMARY", ics_escape(f"Job: {job.description}"))
+            + ics_line("DESCRIPTION", ics_escape(description))
+            + ics_line("LOCATION", ics_escape(loc_address))
+            + "END:VEVENT\r\n"
+        )
+    yield "END:VCALENDAR\r\n"
+
+def feed_rows_query(technician_id, horizon_days):
+    query = db.session.query(Job, Customer.name, Customer.address, Customer.phone, Property.address)\
+        .join(Customer, Customer.id == Job.customer_id)\
+        .outerjoin(Property, Property.id == Job.property_id)\
+        .filter(Job.technician_id == technician_id, Job.status.notin_(('Completed', 'Cancelled')))
+    if horizon_days:
+        query = query.filter(Job.job_date <= datetime.date.today() + datetime.timedelta(days=horizon_days))
+    return query.order_by(Job.job_date, Job.job_time)
+
+def feed_occurrence_rows(technician_id, horizon_days):
+    """Feed rows for the technician's unmaterialized plan occurrences."""
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=PLAN_FEED_LOOKBACK_DAYS)
+    end = today + datetime.timedelta(days=(horizon_days or PLAN_FEED_HORIZON_DAYS) + 1)
+    occurrences = expand_plans(active_plans(start, end, [technician_id]), start, end)
+    customers = load_by_ids(Customer, (o.customer_id for o in occurrences))
+    props = load_by_ids(Property, (o.property_id for o in occurrences))
+    rows = []
+    for job in occurrences:
+        customer, prop = customers[job.customer_id], props.get(job.property_id)
+        rows.append((job, customer.name, customer.address, customer.phone, prop.address if prop else None))
+    return sorted(rows, key=feed_sort_key)
+
+def feed_sort_key(row):
+    return row[0].job_date, row[0].job_time or datetime.time(0, 0)
+
+def iter_feed(technician_id, horizon_days, key, version):
+    """Render a feed chunk by chunk, caching the whole body at the end."""
+    chunks = []
+    rows = heapq.merge(feed_rows_query(technician_id, horizon_days).yield_per(500),
+                       feed_occurrence_rows(technician_id, horizon_days), key=feed_sort_key)
+    for chunk in iter_ics_feed(rows):
+        chunks.append(chunk)
+        yield chunk
+    store_feed(key, version, ''.join(chunks))
+
+def store_feed(key, version, body):
+    with _ics_cache_lock:
+        if len(_ics_cache) >= ICS_CACHE_MAX_ENTRIES:
+            _ics_cache.pop(next(iter(_ics_cache)))
+        _ics_cache[key] = (version, body)
+
+# --- JOB ROLLUPS ---
+# JobDailyStat is kept in step with Job inside the same flush, so the
+# dashboard and reports read a few pre-aggregated rows instead of counting
+# the job table. RowCount does the same for the customer total. `flask
+# rebuild-rollups` recomputes both from scratch.
+DEFAULT_JOB_PRICE = float(os.getenv('DEFAULT_JOB_PRICE', '150'))
+ROLLUP_ATTRS = ('job_date', 'technician_id', 'status', 'price')
+
+# Load the previous value on assignment, so flush hooks always find it in
+# the attribute history even when the job was expired after a commit.
+for _attr in (Job.job_date, Job.technician_id, Job.status, Job.price):
+    event.listen(_attr, 'set', lambda *args: None, active_history=True)
+
+def rollup_key(job_date, technician_id, status, price):
+    return (job_date, technician_id or 0, status or 'Scheduled'), price if price is not None else DEFAULT_JOB_PRICE
+
+def _previous_values(obj, attrs):
+    values = []
+    for attr in attrs:
+        history = inspect(obj).attrs[attr].history
+        values.append(history.deleted[0] if history.deleted else getattr(obj, attr))
+    return values
+
+def apply_rollup_deltas(connection, deltas):
+    """deltas: {(day, technician_id, status): [count_delta, revenue_delta]}"""
+    table = JobDailyStat.__table__
+    for (day, tech_id, status), (count, revenue) in deltas.items():
+        if not count and not revenue:
+            continue
+        match = (table.c.day == day) & (table.c.technician_id == tech_id) & (table.c.status == status)
+        result = connection.execute(table.update().where(match).values(
+            job_count=table.c.job_count + count, revenue=table.c.revenue + revenue))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(
+                day=day, technician_id=tech_id, status=status, job_count=count, revenue=revenue))
+
+def add_rollup_delta(deltas, values, sign):
+    key, price = rollup_key(*values)
+    entry = deltas.setdefault(key, [0, 0.0])
+    entry[0] += sign
+    entry[1] += sign * price
+
+@event.listens_for(Session, "after_flush")
+def update_rollups_on_flush(session, flush_context):
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, Job):
+            add_rollup_delta(deltas, [getattr(obj, a) for a in ROLLUP_ATTRS], +1)
+    for obj in session.deleted:
+        if isinstance(obj, Job):
+            add_rollup_delta(deltas, _previous_values(obj, ROLLUP_ATTRS), -1)
+    for obj in session.dirty:
+        if isinstance(obj, Job) and obj not in session.deleted:
+            old = _previous_values(obj, ROLLUP_ATTRS)
+            new = [getattr(obj, a) for a in ROLLUP_ATTRS]
+            if old != new:
+                add_rollup_delta(deltas, old, -1)
+                add_rollup_delta(deltas, new, +1)
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+COUNTED_MODELS = (Customer,)
+
+def apply_row_count_deltas(connection, deltas):
+    """deltas: {table_name: row_count_delta}"""
+    table = RowCount.__table__
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        result = connection.execute(table.update().where(table.c.table_name == name)
+                                    .values(row_count=table.c.row_count + delta))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(table_name=name, row_count=delta))
+
+@event.listens_for(Session, "after_flush")
+def update_row_counts_on_flush(session, flush_context):
+    deltas = {}
+    for objects, sign in ((session.new, +1), (session.deleted, -1)):
+        for obj in objects:
+            if isinstance(obj, COUNTED_MODELS):
+                name = obj.__table__.name
+                deltas[name] = deltas.get(name, 0) + sign
+    if deltas:
+        apply_row_count_deltas(session.connection(), deltas)
+
+def rebuild_row_counts(connection):
+    table = RowCount.__table__
+    connection.execute(table.delete())
+    connection.execute(table.insert(), [
+        {'table_name': model.__table__.name,
+         'row_count': connection.execute(db.select(db.func.count()).select_from(model.__table__)).scalar()}
+        for model in COUNTED_MODELS])
+
+def row_count(model):
+    return db.session.query(RowCount.row_count).filter(RowCount.table_name == model.__table__.name).scalar() or 0
+
+def rebuild_rollups(connection, models=(Job, JobArchive)):
+    """Recount JobDailyStat from the live and archived jobs. Migrations that
+    run before job_archive exists pass models=(Job,)."""
+    table = JobDailyStat.__table__
+    jobs = db.union_all(*(
+        db.select(
+            model.job_date.label('day'),
+            db.func.coalesce(model.technician_id, 0).label('technician_id'),
+            db.func.coalesce(model.status, 'Scheduled').label('status'),
+            db.func.coalesce(model.price, DEFAULT_JOB_PRICE).label('price'),
+        ) for model in models
+    )).subquery()
+    connection.execute(table.delete())
+    connection.execute(table.insert().from_select(
+        ['day', 'technician_id', 'status', 'job_count', 'revenue'],
+        db.select(jobs.c.day, jobs.c.technician_id, jobs.c.status, db.func.count(), db.func.sum(jobs.c.price))
+        .group_by(jobs.c.day, jobs.c.technician_id, jobs.c.status)
+    ))
+
+def status_distribution():
+    counts = dict(db.session.query(JobDailyStat.status, db.func.sum(JobDailyStat.job_count))
+                  .group_by(JobDailyStat.status).all())
+    statuses = ['Completed', 'Scheduled'] + sorted(s for s in counts if s not in ('Completed', 'Scheduled'))
+    return [{'name': status, 'value': int(counts.get(status) or 0)} for status in statuses]
+
+def revenue_trend(months=6):
+    """Completed-job revenue for the last `months` calendar months, oldest first."""
+    today = datetime.date.today()
+    buckets = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        buckets.append((year, month))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    buckets.reverse()
+    first_day = datetime.date(buckets[0][0], buckets[0][1], 1)
+    totals = dict.fromkeys(buckets, 0.0)
+    rows = db.session.query(JobDailyStat.day, db.func.sum(JobDailyStat.revenue))\
+        .filter(JobDailyStat.status == 'Completed', JobDailyStat.day >= first_day)\
+        .group_by(JobDailyStat.day).all()
+    for day, revenue in rows:
+        if (day.year, day.month) in totals:
+            totals[(day.year, day.month)] += revenue or 0.0
+    return [{'name': datetime.date(y, m, 1).strftime('%b'), 'revenue': round(totals[(y, m)], 2)}
+            for y, m in buckets]
+
+# --- JOB ARCHIVE ---
+# Closed jobs older than ARCHIVE_AFTER_DAYS are moved to job_archive in
+# batched passes (`flask archive-jobs`, or every ARCHIVE_INTERVAL_HOURS in a
+# background thread), so the live table only holds recent and open work.
+# Every archived job is dated before archive_cutoff(), so reads whose range
+# starts after it never touch the archive. Rollups keep counting archived
+# jobs; their materials are dropped, as the stock ledger keeps the usage.
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_INTERVAL_HOURS = float(os.getenv('ARCHIVE_INTERVAL_HOURS', '0'))  # 0 = only via the CLI
+ARCHIVE_STATUSES = ('Completed', 'Cancelled')
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_PAUSE_SECONDS = 0.05  # lets request writers in between batches
+ARCHIVED_COLUMNS = [c.name for c in Job.__table__.columns]
+
+def archive_cutoff():
+    return datetime.date.today() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+
+def reaches_archive(start):
+    """Whether a read from `start` on (None = unbounded) can include archived jobs."""
+    return start is None or start < archive_cutoff()
+
+def archive_jobs(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move closed jobs dated more than `days` ago, one id range per
+    transaction, logging each one as a 'delete' in the change log. Returns
+    the number of jobs archived."""
+    cutoff = datetime.date.today() - datetime.timedelta(days=days)
+    live, archive, materials = Job.__table__, JobArchive.__table__, JobMaterial.__table__
+    with db.engine.connect() as conn:
+        newest = conn.execute(db.select(db.func.max(live.c.id))).scalar() or 0
+    moved = 0
+    for low in range(0, newest, batch_size):
+        high = min(low + batch_size, newest)  # ids in (low, high]
+        with db.engine.begin() as conn:
+            # Starting with the INSERT takes the write lock, so concurrent passes serialize
+            count = conn.execute(archive.insert().from_select(
+                ARCHIVED_COLUMNS + ['archived_at'],
+                db.select(*(live.c[name] for name in ARCHIVED_COLUMNS), db.literal(datetime.datetime.utcnow()))
+                .where(live.c.id > low, live.c.id <= high, live.c.job_date < cutoff,
+                       live.c.status.in_(ARCHIVE_STATUSES))
+            )).rowcount
+            if count:
+                archived = db.select(archive.c.id).where(archive.c.id > low, archive.c.id <= high)
+                leaving = conn.execute(db.select(live.c.id, live.c.technician_id).where(
+                    live.c.id > low, live.c.id <= high, live.c.id.in_(archived))).all()
+                conn.execute(materials.delete().where(materials.c.job_id.in_(archived)))
+                conn.execute(live.delete().where(live.c.id > low, live.c.id <= high, live.c.id.in_(archived)))
+                # Core SQL skips the flush hooks: sync clients see the jobs leave the live
+                # set, and the feeds that listed them are re-rendered
+                record_changes(conn, 'job', [job_id for job_id, _ in leaving], 'delete')
+                tech_ids = sorted({tech_id for _, tech_id in leaving if tech_id is not None})
+                if tech_ids:
+                    bump_feed_versions(conn, tech_ids)
+        if count:
+            moved += count
+            time.sleep(ARCHIVE_PAUSE_SECONDS)
+    return moved
+
+def run_archiver(app, interval_hours):
+    while True:
+        try:
+            with app.app_context():
+                moved = archive_jobs()
+            if moved:
+                app.logger.info("Archived %d jobs", moved)
+        except Exception:
+            app.logger.exception("Job archival failed")
+        time.sleep(interval_hours * 3600)
+
+_archiver = None
+_archiver_lock = threading.Lock()
+
+@api.before_app_request
+def start_archiver():
+    # Started from a request rather than create_app(), which also runs in
+    # the gunicorn master before it forks.
+    global _archiver
+    if not ARCHIVE_INTERVAL_HOURS or _archiver is not None:
+        return
+    with _archiver_lock:
+        if _archiver is None:
+            _archiver = threading.Thread(target=run_archiver,
+                                         args=(current_app._get_current_object(), ARCHIVE_INTERVAL_HOURS),
+                                         daemon=True, name='job-archiver')
+            _archiver.start()
+
+# --- INVENTORY LEDGER ---
+# Stock only moves through StockMovement rows. Each batch of movements is
+# applied to Inventory.currentStock in the same transaction and the stored
+# stock_status is recomputed in SQL, so status filters and dashboard alerts
+# are index lookups. Whenever a job's status or materials change, its usage
+# in the ledger is brought in line with them: the materials of a Completed
+# job are posted as usage (including ones added after completion), and
+# reopening it, or removing materials, posts reversals.
+ALERT_STATUSES = ('Out of Stock', 'Low Stock')
+MANUAL_MOVEMENT_KINDS = ('receipt', 'adjustment')
+USAGE_KINDS = ('usage', 'reversal')
+USAGE_WINDOW_DAYS = 30
+REORDER_LEAD_DAYS = int(os.getenv('REORDER_LEAD_DAYS', '14'))
+
+def stock_status_of(current, minimum):
+    if (current or 0) <= 0:
+        return 'Out of Stock'
+    if current <= (minimum or 0):
+        return 'Low Stock'
+    return 'In Stock'
+
+def stock_status_sql(current, minimum):
+    """stock_status_of() as a SQL expression."""
+    return db.case((current <= 0, 'Out of Stock'),
+                   (current <= db.func.coalesce(minimum, 0), 'Low Stock'), else_='In Stock')
+
+@event.listens_for(Inventory, 'before_insert')
+@event.listens_for(Inventory, 'before_update')
+def set_stock_status(mapper, connection, item):
+    item.stock_status = stock_status_of(item.currentStock, item.minStock)
+
+@event.listens_for(Inventory, 'after_insert')
+def open_item_ledger(mapper, connection, item):
+    if item.currentStock:
+        connection.execute(StockMovement.__table__.insert().values(
+            inventory_id=item.id, quantity=item.currentStock, kind='opening',
+            created_at=datetime.datetime.utcnow()))
+
+def apply_stock_movements(connection, movements):
+    """Append movements ({inventory_id, quantity, kind, job_id?, note?}) and
+    move each item's balance and status by the net quantity."""
+    now = datetime.datetime.utcnow()
+    rows = [{'job_id': None, 'note': None, 'created_at': now, **m} for m in movements]
+    connection.execute(StockMovement.__table__.insert(), rows)
+    deltas = {}
+    for m in rows:
+        deltas[m['inventory_id']] = deltas.get(m['inventory_id'], 0) + m['quantity']
+    table = Inventory.__table__
+    stock = db.func.coalesce(table.c.currentStock, 0) + db.bindparam('delta')
+    params = [{'item_id': item_id, 'delta': delta} for item_id, delta in deltas.items() if delta]
+    if params:
+        connection.execute(table.update().where(table.c.id == db.bindparam('item_id')).values(
+            currentStock=stock, stock_status=stock_status_sql(stock, table.c.minStock)), params)
+
+def open_stock_ledger(connection):
+    """Opening movements for items with stock but no ledger yet, and a fresh
+    stock_status for every item (for rows written outside the ORM)."""
+    table, ledger = Inventory.__table__, StockMovement.__table__
+    connection.execute(ledger.insert().from_select(
+        ['inventory_id', 'quantity', 'kind', 'created_at'],
+        db.select(table.c.id, table.c.currentStock, db.literal('opening'), db.literal(datetime.datetime.utcnow()))
+        .where(table.c.currentStock != 0, table.c.id.notin_(db.select(ledger.c.inventory_id)))
+    ))
+    connection.execute(table.update().values(
+        stock_status=stock_status_sql(db.func.coalesce(table.c.currentStock, 0), table.c.minStock)))
+
+@event.listens_for(Session, "after_flush")
+def post_job_usage_on_flush(session, flush_context):
+    job_ids = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, JobMaterial):
+            job_ids.add(obj.job_id)
+        elif isinstance(obj, Job) and obj not in session.deleted:
+            was_completed = obj not in session.new and _previous_values(obj, ['status'])[0] == 'Completed'
+            if was_completed != (obj.status == 'Completed'):
+                job_ids.add(obj.id)
+    job_ids -= {obj.id for obj in session.deleted if isinstance(obj, Job)}
+    if job_ids:
+        post_job_usage(session.connection(), job_ids)
+
+def post_job_usage(connection, job_ids):
+    """Post the movements that make each job's net usage in the ledger equal
+    its materials if it is Completed, and zero otherwise."""
+    wanted, posted = {}, {}  # (job_id, inventory_id) -> quantity
+    ledger = StockMovement.__table__
+    for chunk in iter_chunks(sorted(job_ids), IN_BATCH_SIZE):
+        wanted.update(((job_id, item_id), quantity) for job_id, item_id, quantity in connection.execute(
+            db.select(JobMaterial.job_id, JobMaterial.inventory_id, JobMaterial.quantity)
+            .join(Job, Job.id == JobMaterial.job_id)
+            .where(JobMaterial.job_id.in_(chunk), Job.status == 'Completed')))
+        posted.update(((job_id, item_id), -quantity) for job_id, item_id, quantity in connection.execute(
+            db.select(ledger.c.job_id, ledger.c.inventory_id, db.func.sum(ledger.c.quantity))
+            .where(ledger.c.job_id.in_(chunk), ledger.c.kind.in_(USAGE_KINDS))
+            .group_by(ledger.c.job_id, ledger.c.inventory_id)))
+    movements = []
+    for job_id, item_id in sorted(wanted.keys() | posted.keys()):
+        owed = wanted.get((job_id, item_id), 0) - posted.get((job_id, item_id), 0)
+        if owed:
+            movements.append({'inventory_id': item_id, 'quantity': -owed, 'job_id': job_id,
+                              'kind': 'usage' if owed > 0 else 'reversal'})
+    if movements:
+        apply_stock_movements(connection, movements)
+
+def set_job_materials(job, materials):
+    """Replace a job's materials with [{inventory_id, quantity}, ...]."""
+    wanted = {}
+    for m in materials or []:
+        quantity = int(m['quantity'])
+        if quantity <= 0:
+            raise ValueError("Material quantity must be positive")
+        wanted[int(m['inventory_id'])] = wanted.get(int(m['inventory_id']), 0) + quantity
+    missing = set(wanted) - set(load_by_ids(Inventory, wanted))
+    if missing:
+        raise ValueError(f"Unknown inventory item(s): {sorted(missing)}")
+    if job.id is None:
+        db.session.flush()
+    existing = {m.inventory_id: m for m in JobMaterial.query.filter_by(job_id=job.id)}
+    for item_id, row in existing.items():
+        if item_id not in wanted:
+            db.session.delete(row)
+    for item_id, quantity in wanted.items():
+        if item_id in existing:
+            existing[item_id].quantity = quantity
+        else:
+            db.session.add(JobMaterial(job_id=job.id, inventory_id=item_id, quantity=quantity))
+
+def job_materials(job):
+    return [{"inventory_id": m.inventory_id, "quantity": m.quantity}
+            for m in JobMaterial.query.filter_by(job_id=job.id).order_by(JobMaterial.inventory_id)]
+
+def serialize_movement(m: StockMovement):
+    return {
+        "id": m.id, "inventory_id": m.inventory_id, "quantity": m.quantity, "kind": m.kind,
+        "job_id": m.job_id, "note": m.note, "created_at": m.created_at.isoformat(),
+    }
+
+def reorder_suggestions(lead_days=REORDER_LEAD_DAYS):
+    """Items that are low/out of stock or will run out within `lead_days` at
+    their recent usage rate, with the quantity needed to get back to maxStock."""
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=USAGE_WINDOW_DAYS)
+    used = dict(db.session.query(StockMovement.inventory_id, -db.func.sum(StockMovement.quantity))
+                .filter(StockMovement.kind.in_(USAGE_KINDS), StockMovement.created_at >= since)
+                .group_by(StockMovement.inventory_id).all())
+    items = Inventory.query.filter(db.or_(Inventory.stock_status.in_(ALERT_STATUSES),
+                                          Inventory.id.in_([i for i, n in used.items() if n > 0]))).all()
+    suggestions = []
+    for item in items:
+        on_hand = max(item.currentStock or 0, 0)
+        daily = max(used.get(item.id) or 0, 0) / USAGE_WINDOW_DAYS
+        if item.stock_status == 'In Stock' and on_hand >= daily * lead_days:
+            continue
+        target = max(item.maxStock or 0, math.ceil(daily * lead_days) + (item.minStock or 0))
+        quantity = target - on_hand
+        if quantity <= 0:
+            continue
+        suggestions.append({
+            "item": serialize_inventory(item),
+            "dailyUsage": round(daily, 2),
+            "daysOfCover": round(on_hand / daily, 1) if daily else None,
+            "suggestedQuantity": quantity,
+            "estimatedCost": round(quantity * (item.unitCost or 0), 2),
+        })
+    severity = {status: n for n, status in enumerate(ALERT_STATUSES)}
+    suggestions.sort(key=lambda s: (severity.get(s["item"]["status"], len(severity)),
+                                    s["daysOfCover"] if s["daysOfCover"] is not None else 0))
+    return suggestions
+
+# --- CAMPAIGN DELIVERY ---
+# Sending a campaign resolves its audience into CampaignRecipient rows (in
+# customer-id batches, deduplicated by address), then a background driver
+# feeds the queued rows through a rate-limited worker pool to the configured
+# transport and marks them sent/failed a batch at a time. Starting a send
+# moves the campaign to 'Sending' with a conditional UPDATE, and each batch
+# is claimed with one (queued -> sending), so across worker processes only
+# one request starts a send and no recipient is handed to two senders. Opens and clicks
+# arrive on signed tracking URLs and are buffered in EngagementCounter,
+# which folds them into one UPDATE per campaign every few seconds.
+CAMPAIGN_TRANSPORT = os.getenv('CAMPAIGN_TRANSPORT', 'file')
+CAMPAIGN_OUTBOX = os.getenv('CAMPAIGN_OUTBOX')  # default: <instance>/outbox
+CAMPAIGN_WORKERS = int(os.getenv('CAMPAIGN_WORKERS', '4'))
+CAMPAIGN_RATE_PER_SEC = float(os.getenv('CAMPAIGN_RATE_PER_SEC', '20'))
+CAMPAIGN_SEND_BATCH = 200
+CAMPAIGN_CLAIM_TIMEOUT_SECONDS = int(os.getenv('CAMPAIGN_CLAIM_TIMEOUT_SECONDS', '600'))
+CAMPAIGN_RETRY_STATUSES = ('Failed', 'Partially Sent')  # finished with failed sends
+CAMPAIGN_LANDING_URL = os.getenv('CAMPAIGN_LANDING_URL', 'https://pestpro.com/')
+ENGAGEMENT_FLUSH_SECONDS = float(os.getenv('ENGAGEMENT_FLUSH_SECONDS', '5'))
+TRACKING_PIXEL = base64.b64decode('R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7')
+
+def tracking_signer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='campaign-tracking')
+
+def normalize_address(channel, value):
+    if not value:
+        return None
+    if channel == 'sms':
+        digits = re.sub(r'\D', '', value)
+        return digits if len(digits) >= 10 else None
+    value = value.strip().lower()
+    return value if '@' in value else None
+
+def campaign_channel(campaign):
+    return 'sms' if (campaign.type or '').upper() == 'SMS' else 'email'
+
+def resolve_audience(campaign, batch_size=IN_BATCH_SIZE):
+    """Yield lists of recipient rows for the campaign's audience. Each
+    customer is reached through their primary contact, falling back to the
+    customer's own email/phone."""
+    channel = campaign_channel(campaign)
+    query = db.session.query(Customer.id, Customer.email, Customer.phone)
+    if campaign.audience == 'Commercial':
+        query = query.filter(Customer.segment == 'Commercial')
+    elif campaign.audience == 'Residential':
+        query = query.filter(db.or_(Customer.segment.is_(None), Customer.segment == 'Residential'))
+    seen, last_id = set(), 0
+    while True:
+        rows = query.filter(Customer.id > last_id).order_by(Customer.id).limit(batch_size).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        primary = {cid: (email, phone) for cid, email, phone in db.session.query(
+            Contact.customer_id, Contact.email, Contact.phone
+        ).filter(Contact.customer_id.in_([r.id for r in rows]), Contact.is_primary.is_(True))}
+        batch = []
+        for customer_id, email, phone in rows:
+            contact_email, contact_phone = primary.get(customer_id, (None, None))
+            raw = (contact_phone or phone) if channel == 'sms' else (contact_email or email)
+            address = normalize_address(channel, raw)
+            if address and address not in seen:
+                seen.add(address)
+                batch.append({'campaign_id': campaign.id, 'customer_id': customer_id,
+                              'address': address, 'status': 'queued'})
+        if batch:
+            yield batch
+
+def tracking_urls(base_url, campaign_id, recipient_id):
+    token = tracking_signer().dumps([campaign_id, recipient_id])
+    return (f"{base_url}/api/marketing/track/open/{token}",
+            f"{base_url}/api/marketing/track/click/{token}")
+
+def compose_message(campaign, recipient, base_url):
+    open_url, click_url = tracking_urls(base_url, campaign.id, recipient.id)
+    body = campaign.content_body or ''
+    return {
+        "channel": campaign_channel(campaign), "to": recipient.address,
+        "subject": campaign.content_subject or campaign.name,
+        "text": f"{body}\n\n{click_url}",
+        "html": f'<p>{body}</p><p><a href="{click_url}">Learn more</a></p>'
+                f'<img src="{open_url}" width="1" height="1" alt="">',
+    }
+
+class FileTransport:
+    """Appends each message as a JSON line to <outbox>/campaign-<id>.jsonl;
+    the stand-in for development and tests."""
+    def __init__(self, outbox=CAMPAIGN_OUTBOX):
+        self.outbox = outbox or os.path.join(current_app.instance_path, 'outbox')
+        self.lock = threading.Lock()
+
+    def send(self, campaign_id, message):
+        os.makedirs(self.outbox, exist_ok=True)
+        line = json.dumps(message) + "\n"
+        with self.lock, open(os.path.join(self.outbox, f"campaign-{campaign_id}.jsonl"), 'a') as f:
+            f.write(line)
+
+class SmtpTransport:
+    """Email over SMTP_HOST[:SMTP_PORT], one connection per worker thread."""
+    def __init__(self):
+        self.host = os.getenv('SMTP_HOST', 'localhost')
+        self.port = int(os.getenv('SMTP_PORT', '587'))
+        self.user, self.password = os.getenv('SMTP_USER'), os.getenv('SMTP_PASSWORD')
+        self.sender = os.getenv('SMTP_FROM', 'PestPro <no-reply@pestpro.com>')
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, 'smtp', None) is None:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+            if self.user:
+                smtp.starttls()
+                smtp.login(self.user, self.password)
+            self.local.smtp = smtp
+        return self.local.smtp
+
+    def send(self, campaign_id, message):
+        if message['channel'] != 'email':
+            raise ValueError("SMTP transport only delivers email")
+        msg = EmailMessage()
+        msg['From'], msg['To'], msg['Subject'] = self.sender, message['to'], message['subject']
+        msg.set_content(message['text'])
+        msg.add_alternative(message['html'], subtype='html')
+        try:
+            self.connection().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.local.smtp = None
+            self.connection().send_message(msg)
+
+TRANSPORTS = {'file': FileTransport, 'smtp': SmtpTransport}
+
+class RateLimiter:
+    """Token bucket shared by the send workers."""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class CampaignSender:
+    def __init__(self, transport, workers=CAMPAIGN_WORKERS, rate=CAMPAIGN_RATE_PER_SEC):
+        self.transport = transport
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='campaign-send')
+        self.limiter = RateLimiter(rate)
+        self.active = set()
+        self.lock = threading.Lock()
+
+    def start(self, campaign_id, base_url):
+        """Send in the background; False if this campaign is already sending."""
+        with self.lock:
+            if campaign_id in self.active:
+                return False
+            self.active.add(campaign_id)
+        threading.Thread(target=self.run, args=(current_app._get_current_object(), campaign_id, base_url),
+                         daemon=True, name=f'campaign-{campaign_id}').start()
+        return True
+
+    def deliver(self, campaign_id, message):
+        self.limiter.acquire()
+        self.transport.send(campaign_id, message)
+
+    def run(self, app, campaign_id, base_url):
+        try:
+            with app.app_context():
+                self.send_queued(campaign_id, base_url)
+        except Exception:
+            app.logger.exception("Campaign %s send failed", campaign_id)
+        finally:
+            with self.lock:
+                self.active.discard(campaign_id)
+
+    def send_queued(self, campaign_id, base_url):
+        campaign = db.session.get(MarketingCampaign, campaign_id)
+        while True:
+            batch = claim_recipients(campaign_id)
+            if not batch:
+                break
+            futures = {self.pool.submit(self.deliver, campaign_id, compose_message(campaign, r, base_url)): r.id
+                       for r in batch}
+            sent, failed = [], []
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is None:
+                    sent.append(futures[future])
+                else:
+                    failed.append({'recipient_id': futures[future], 'error': str(error)[:200]})
+            db.session.rollback()  # end the read transaction before writing
+            record_send_results(campaign_id, sent, failed)
+        counts = recipient_counts(campaign_id)
+        db.session.rollback()
+        if counts.get('sending'):  # another sender still holds a batch; it finishes the campaign
+            return counts
+        status = campaign_final_status(counts)
+        table = MarketingCampaign.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == campaign_id, table.c.status == 'Sending')
+                         .values(status=status))
+        current_app.logger.info("Campaign %s %s: %d sent, %d failed", campaign_id, status.lower(),
+                        counts.get('sent', 0), counts.get('failed', 0))
+        return counts
+
+def claim_recipients(campaign_id, limit=CAMPAIGN_SEND_BATCH):
+    """Take up to `limit` queued recipients for this sender and return them.
+    The single UPDATE re-checks the status of every row it claims, so two
+    senders racing for the same rows split them instead of sharing them."""
+    token = uuid.uuid4().hex
+    table = CampaignRecipient.__table__
+    queued = db.select(table.c.id).where(table.c.campaign_id == campaign_id, table.c.status == 'queued')\
+        .order_by(table.c.id).limit(limit)
+    with db.engine.begin() as conn:
+        claimed = conn.execute(table.update().where(table.c.id.in_(queued), table.c.status == 'queued')
+                               .values(status='sending', claim=token,
+                                       claimed_at=datetime.datetime.utcnow())).rowcount
+    if not claimed:
+        return []
+    return CampaignRecipient.query.filter(
+        CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.status == 'sending',
+        CampaignRecipient.claim == token,
+    ).order_by(CampaignRecipient.id).all()
+
+def release_stale_claims(campaign_id, timeout=CAMPAIGN_CLAIM_TIMEOUT_SECONDS):
+    """Requeue recipients claimed more than `timeout` seconds ago, whose
+    sender must have died. Returns None, leaving everything alone, if a
+    claim is still fresh (a sender is working), else how many came back."""
+    table = CampaignRecipient.__table__
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=timeout)
+    with db.engine.begin() as conn:
+        live = conn.execute(db.select(table.c.id).where(
+            table.c.campaign_id == campaign_id, table.c.status == 'sending', table.c.claimed_at >= cutoff
+        ).limit(1)).first()
+        if live:
+            return None
+        return conn.execute(table.update().where(table.c.campaign_id == campaign_id, table.c.status == 'sending')
+                            .values(status='queued', claim=None, claimed_at=None)).rowcount
+
+def start_campaign_send(campaign_id, from_statuses):
+    """Move the campaign to 'Sending' if it is still in one of `from_statuses`.
+    False means another request (in any worker) got there first."""
+    table = MarketingCampaign.__table__
+    with db.engine.begin() as conn:
+        return conn.execute(table.update().where(table.c.id == campaign_id, table.c.status.in_(from_statuses))
+                            .values(status='Sending')).rowcount == 1
+
+def recipient_counts(campaign_id):
+    return dict(db.session.query(CampaignRecipient.status, db.func.count(CampaignRecipient.id))
+                .filter_by(campaign_id=campaign_id).group_by(CampaignRecipient.status).all())
+
+def campaign_final_status(counts):
+    """'Completed' only when nothing failed; failed sends can be retried."""
+    if not counts.get('failed'):
+        return 'Completed'
+    return 'Partially Sent' if counts.get('sent') else 'Failed'
+
+def requeue_failed_recipients(campaign_id):
+    """Put failed recipients back in the queue for a retry. Returns how many."""
+    recipients, campaigns = CampaignRecipient.__table__, MarketingCampaign.__table__
+    with db.engine.begin() as conn:
+        count = conn.execute(recipients.update().where(recipients.c.campaign_id == campaign_id,
+                                                       recipients.c.status == 'failed')
+                             .values(status='queued', error=None)).rowcount
+        if count:
+            conn.execute(campaigns.update().where(campaigns.c.id == campaign_id).values(failed=0))
+    return count
+
+def record_send_results(campaign_id, sent, failed):
+    now = datetime.datetime.utcnow()
+    recipients, campaigns = CampaignRecipient.__table__, MarketingCampaign.__table__
+    with db.engine.begin() as conn:
+        for chunk in iter_chunks(sent, IN_BATCH_SIZE):
+            conn.execute(recipients.update().where(recipients.c.id.in_(chunk)).values(status='sent', sent_at=now))
+        if failed:
+            conn.execute(recipients.update().where(recipients.c.id == db.bindparam('recipient_id'))
+                         .values(status='failed', error=db.bindparam('error')), failed)
+        if sent or failed:
+            conn.execute(campaigns.update().where(campaigns.c.id == campaign_id)
+                         .values(sent=db.func.coalesce(campaigns.c.sent, 0) + len(sent),
+                                 failed=db.func.coalesce(campaigns.c.failed, 0) + len(failed)))
+
+def queue_campaign(campaign):
+    """Resolve the audience into recipient rows, once, in one transaction.
+    Returns the number of recipients queued by this call."""
+    if db.session.query(CampaignRecipient.id).filter_by(campaign_id=campaign.id).first():
+        return 0
+    queued = 0
+    with db.engine.begin() as conn:
+        for batch in resolve_audience(campaign):
+            conn.execute(CampaignRecipient.__table__.insert(), batch)
+            queued += len(batch)
+    return queued
+
+class EngagementCounter:
+    """Write-combining open/click counter. record() only touches memory; a
+    daemon thread (or an explicit flush()) applies the accumulated deltas as
+    one UPDATE per campaign."""
+    FIELDS = ('opened', 'clicked')
+
+    def __init__(self, interval=ENGAGEMENT_FLUSH_SECONDS):
+        self.interval = interval
+        self.pending = {}  # campaign_id -> {field: count}
+        self.lock = threading.Lock()
+        self.flusher = None
+        self.app = None  # the app whose database the deltas belong to
+
+    def record(self, campaign_id, field):
+        with self.lock:
+            self.app = current_app._get_current_object()
+            counts = self.pending.setdefault(campaign_id, dict.fromkeys(self.FIELDS, 0))
+            counts[field] += 1
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.run, daemon=True, name='engagement-flush')
+                self.flusher.start()
+
+    def pending_events(self):
+        with self.lock:
+            return sum(sum(c.values()) for c in self.pending.values())
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        table = MarketingCampaign.__table__
+        params = [{'campaign_id': cid, **counts} for cid, counts in pending.items()]
+        try:
+            with self.app.app_context(), db.engine.begin() as conn:
+                conn.execute(table.update().where(table.c.id == db.bindparam('campaign_id')).values(
+                    {f: db.func.coalesce(table.c[f], 0) + db.bindparam(f) for f in self.FIELDS}), params)
+        except Exception:
+            with self.lock:  # put the deltas back for the next attempt
+                for cid, counts in pending.items():
+                    merged = self.pending.setdefault(cid, dict.fromkeys(self.FIELDS, 0))
+                    for f in self.FIELDS:
+                        merged[f] += counts[f]
+            raise
+        return len(params)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception("Engagement flush failed")
+
+engagement = EngagementCounter()
+atexit.register(lambda: engagement.flush())
+
+_campaign_sender = None
+
+def campaign_sender():
+    global _campaign_sender
+    if _campaign_sender is None:
+        _campaign_sender = CampaignSender(TRANSPORTS[CAMPAIGN_TRANSPORT]())
+    return _campaign_sender
+
+metrics.collectors.append(lambda: [
+    "# HELP pestpro_campaign_engagement_pending Open/click events waiting to be flushed.",
+    "# TYPE pestpro_campaign_engagement_pending gauge",
+    f"pestpro_campaign_engagement_pending {engagement.pending_events()}",
+])
+
+# --- DELTA SYNC / CHANGE FEED ---
+# Every ORM insert/update/delete of a Job, Customer, Property or Contact
+# bumps its row_version/updated_at and appends a ChangeLog row in the same
+# flush. A ChangeLog id is the sync token: /api/changes?since=<token>
+# returns what changed after it, and /api/changes/stream pushes the same
+# thing as Server-Sent Events by polling the log. A client that has seen a
+# token must never see a lower one commit later, so ids have to commit in
+# id order: SQLite's single writer guarantees it, and on PostgreSQL each
+# transaction takes CHANGE_LOG_LOCK_ID (an advisory lock held to commit)
+# before writing the log. Other backends don't serve the feed. Bulk SQL that
+# bypasses the ORM calls record_changes() itself.
+CHANGE_ENTITIES = {'job': Job, 'customer': Customer, 'property': Property, 'contact': Contact}
+CHANGE_PAGE_SIZE = 500
+CHANGE_POLL_SECONDS = float(os.getenv('CHANGE_POLL_SECONDS', '1'))
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', '30'))
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = float(os.getenv('SSE_MAX_SECONDS', '300'))  # clients reconnect with Last-Event-ID
+SSE_RETRY_MS = 3000
+CHANGE_LOG_LOCK_ID = 0x5059_4E43  # pg_advisory_xact_lock key serializing ChangeLog writers
+CHANGE_FEED_DIALECTS = ('sqlite', 'postgresql')
+
+_ENTITY_NAMES = {model: name for name, model in CHANGE_ENTITIES.items()}
+
+def _touch_row(mapper, connection, target):
+    state = inspect(target)
+    if state.persistent:
+        # before_update also fires for rows that were only marked dirty
+        if not state.session.is_modified(target, include_collections=False):
+            return
+        target.row_version = (target.row_version or 0) + 1
+    target.updated_at = datetime.datetime.utcnow()
+
+for _model in CHANGE_ENTITIES.values():
+    event.listen(_model, 'before_insert', _touch_row)
+    event.listen(_model, 'before_update', _touch_row)
+
+def _write_change_log(connection, changes):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(db.text("SELECT pg_advisory_xact_lock(:key)"), {'key': CHANGE_LOG_LOCK_ID})
+    now = datetime.datetime.utcnow()
+    connection.execute(ChangeLog.__table__.insert(), [
+        {'entity': entity, 'entity_id': entity_id, 'op': op, 'changed_at': now} for entity, entity_id, op in changes])
+
+def record_changes(connection, entity, ids, op):
+    """Log changes made with core SQL (which the flush hook never sees)."""
+    changes = [(entity, i, op) for i in ids]
+    if changes:
+        _write_change_log(connection, changes)
+
+@event.listens_for(Session, "after_flush")
+def log_changes_on_flush(session, flush_context):
+    changes = []
+    for op, objs in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objs:
+            entity = _ENTITY_NAMES.get(type(obj))
+            if entity is None:
+                continue
+            if op == 'update' and (obj in session.deleted or not session.is_modified(obj, include_collections=False)):
+                continue
+            changes.append((entity, obj.id, op))
+    if changes:
+        _write_change_log(session.connection(), changes)
+
+def change_feed_unavailable():
+    """A 501 response where the backend can't commit log ids in order."""
+    if db.engine.dialect.name in CHANGE_FEED_DIALECTS:
+        return None
+    return jsonify({"error": f"The change feed is not available on {db.engine.dialect.name}"}), 501
+
+def head_token():
+    return db.session.query(db.func.max(ChangeLog.id)).scalar() or 0
+
+def serialize_changed_rows(entity, ids):
+    """{id: (row_version, payload)} for the rows that still exist."""
+    rows = load_by_ids(CHANGE_ENTITIES[entity], ids)
+    if entity == 'job':
+        jobs = list(rows.values())
+        payloads = serialize_jobs(jobs)
+    elif entity == 'customer':
+        payloads = [serialize_customer(c) for c in rows.values()]
+    else:
+        serialize = serialize_property if entity == 'property' else serialize_contact
+        payloads = [{**serialize(r), "customer_id": r.customer_id} for r in rows.values()]
+    return {row.id: (row.row_version, payload) for row, payload in zip(rows.values(), payloads)}
+
+def read_changes(since, entities, limit=CHANGE_PAGE_SIZE):
+    """(changes, next_token, more) for up to `limit` log rows after `since`,
+    collapsed to one entry per row carrying its current data."""
+    log = ChangeLog.query.filter(ChangeLog.id > since, ChangeLog.entity.in_(entities))\
+        .order_by(ChangeLog.id).limit(limit + 1).all()
+    more = len(log) > limit
+    log = log[:limit]
+    if not log:
+        return [], since, False
+    ops = {}  # (entity, id) -> (first op, last op), ordered by last change
+    for entry in log:
+        key = (entry.entity, entry.entity_id)
+        first = ops.pop(key, (entry.op,))[0]
+        ops[key] = (first, entry.op)
+    current = {entity: serialize_changed_rows(entity, [i for e, i in ops if e == entity])
+               for entity in {e for e, _ in ops}}
+    changes = []
+    for (entity, entity_id), (first, last) in ops.items():
+        row = current[entity].get(entity_id)
+        if row is None or last == 'delete':
+            changes.append({"entity": entity, "id": entity_id, "op": "delete", "version": None, "data": None})
+        else:
+            changes.append({"entity": entity, "id": entity_id, "op": "insert" if first == 'insert' else "update",
+                            "version": row[0], "data": row[1]})
+    return changes, log[-1].id, more
+
+def parse_change_entities(value, default):
+    entities = [e for e in (value or default).split(',') if e]
+    unknown = set(entities) - set(CHANGE_ENTITIES)
+    if unknown:
+        raise ValueError(f"Unknown entities: {', '.join(sorted(unknown))}")
+    return entities
+
+def token_expired(since):
+    """True when rows after `since` may already have been pruned."""
+    oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+    return since > 0 and oldest is not None and since < oldest - 1
+
+def prune_change_log(days=CHANGE_LOG_RETENTION_DAYS):
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    with db.engine.begin() as conn:
+        return conn.execute(ChangeLog.__table__.delete().where(ChangeLog.changed_at < cutoff)).rowcount
+
+# --- BULK CUSTOMER IMPORT ---
+IMPORT_CHUNK_SIZE = IN_BATCH_SIZE
+IMPORT_MAX_ERRORS = 1000
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+def iter_chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_import_rows(mimetype, stream):
+    """Yield raw customer rows from an upload body: dicts, or undecoded
+    NDJSON lines that are parsed (and reported) per row."""
+    if mimetype == 'text/csv':
+        text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+        yield from csv.DictReader(text)
+    elif mimetype in NDJSON_MIMETYPES:
+        for line in io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8'):
+            if line.strip():
+                yield line
+    else:
+        data = json.loads(stream.read() or b'{}')
+        yield from data.get('customers', [])
+
+def import_customer_chunk(rows, seen):
+    """Insert one chunk of customer rows. Duplicates are detected with a
+    single dedupe_key lookup against the database plus the `seen` key set,
+    which carries keys across chunks of the same upload. Keys are
+    normalized, so "ACME Pest Co., 123 Main Street" matches an existing
+    "Acme Pest, 123 Main St"."""
+    errors, valid = [], []
+    for raw in rows:
+        try:
+            cust_data = json.loads(raw) if isinstance(raw, str) else raw
+        except ValueError as e:
+            errors.append({"error": f"Invalid JSON: {e}", "data": raw.strip()})
+            continue
+        if not isinstance(cust_data, dict) or not cust_data.get('name'):
+            errors.append({"error": "Missing name", "data": cust_data})
+            continue
+        valid.append(cust_data)
+
+    keys = [customer_dedupe_key(c['name'], c.get('address')) for c in valid]
+    existing = set(db.session.execute(
+        db.select(Customer.dedupe_key).where(Customer.dedupe_key.in_(set(keys)))).scalars()) if keys else set()
+
+    to_insert = []
+    skipped = 0
+    for cust_data, key in zip(valid, keys):
+        if key in existing or key in seen:
+            skipped += 1
+            continue
+        seen.add(key)
+        to_insert.append({
+            "name": cust_data['name'], "address": cust_data.get('address'), "dedupe_key": key,
+            "phone": cust_data.get('phone'), "email": cust_data.get('email'),
+            "updated_at": datetime.datetime.utcnow(),
+        })
+
+    try:
+        if to_insert:
+            ids = db.session.execute(db.insert(Customer).returning(Customer.id), to_insert).scalars().all()
+            record_changes(db.session.connection(), 'customer', ids, 'insert')
+            apply_row_count_deltas(db.session.connection(), {'customer': len(ids)})
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        for row in to_insert:
+            seen.discard(row['dedupe_key'])
+        errors.append({"error": f"Chunk insert failed: {e}"})
+        to_insert = []
+
+    return {"rows": len(rows), "added": len(to_insert), "skipped": skipped, "errors": errors}
+
+def run_customer_import(rows, report=None):
+    """Import rows chunk by chunk, calling report(processed, added) after
+    each one. Returns the upload summary."""
+    seen = set()
+    chunks = []
+    errors = []
+    error_count = added_count = skipped_count = processed = 0
+    for chunk_no, chunk in enumerate(iter_chunks(rows, IMPORT_CHUNK_SIZE), 1):
+        result = import_customer_chunk(chunk, seen)
+        chunk_errors = result.pop("errors")
+        chunks.append({"chunk": chunk_no, **result, "errors": len(chunk_errors)})
+        processed += result["rows"]
+        added_count += result["added"]
+        skipped_count += result["skipped"]
+        error_count += len(chunk_errors)
+        errors.extend(chunk_errors[:IMPORT_MAX_ERRORS - len(errors)])
+        if report:
+            report(processed, added_count)
+    return {
+        "message": f"Processed {processed} records. Added {added_count} new customers. Skipped {skipped_count} duplicates.",
+        "processed": processed,
+        "added": added_count,
+        "skipped": skipped_count,
+        "errorCount": error_count,
+        "chunks": chunks,
+        "errors": errors
+    }
+
+# --- BACKGROUND TASKS ---
+# Heavy operations run on a small in-process thread pool instead of in the
+# request. Each run is a Task row (status, progress, result) that clients
+# poll at /api/tasks/<id>. Handlers report progress through a TaskContext,
+# which is also where a requested cancellation surfaces. While a handler
+# runs, a heartbeat thread touches the row every TASK_HEARTBEAT_SECONDS
+# (progress reports count too), so a running task whose process died is
+# reported as failed once it has been silent for TASK_STALE_SECONDS. Queued
+# tasks are only waiting for a worker and never expire.
+TASK_WORKERS = int(os.getenv('TASK_WORKERS', '1'))  # SQLite has a single writer anyway
+TASK_PROGRESS_SECONDS = 1.0
+TASK_HEARTBEAT_SECONDS = float(os.getenv('TASK_HEARTBEAT_SECONDS', '30'))
+TASK_STALE_SECONDS = int(os.getenv('TASK_STALE_SECONDS', '900'))
+TASK_SPOOL_DIR = os.getenv('TASK_SPOOL_DIR') or tempfile.gettempdir()
+TASK_ACTIVE_STATUSES = ('queued', 'running')
+TASK_HANDLERS = {}
+
+def task_handler(kind):
+    """Register fn(ctx, **params) -> JSON-able result as the handler for `kind`."""
+    def register(fn):
+        TASK_HANDLERS[kind] = fn
+        return fn
+    return register
+
+class TaskCancelled(Exception):
+    pass
+
+class TaskContext:
+    def __init__(self, task_id):
+        self.task_id = task_id
+        self.last_report = 0.0
+        self.done = None  # latest count, written with the final status too
+
+    def progress(self, done, total=None, message=None, force=False):
+        """Record progress (at most once per TASK_PROGRESS_SECONDS unless
+        forced) and raise TaskCancelled if a cancel was requested. Call it
+        between transactions: it writes on a connection of its own."""
+        self.done = done
+        now = time.monotonic()
+        if not force and now - self.last_report < TASK_PROGRESS_SECONDS:
+            return
+        self.last_report = now
+        values = {'progress': done, 'updated_at': datetime.datetime.utcnow()}
+        if total is not None:
+            values['total'] = total
+        if message is not None:
+            values['message'] = message[:200]
+        table = Task.__table__
+        with db.engine.begin() as conn:
+            cancel = conn.execute(table.update().where(table.c.id == self.task_id).values(**values)
+                                  .returning(table.c.cancel_requested)).scalar()
+        if cancel:
+            raise TaskCancelled()
+
+class TaskRunner:
+    def __init__(self, workers=TASK_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='task')
+        self.running = 0
+        self.lock = threading.Lock()
+
+    def submit(self, kind, params=None):
+        """Create the Task row and queue it. A 'spool' param names a file
+        that is deleted once the task is over."""
+        now = datetime.datetime.utcnow()
+        task = Task(kind=kind, status='queued', params=json.dumps(params or {}), created_at=now, updated_at=now)
+        db.session.add(task)
+        db.session.commit()
+        self.pool.submit(self.run, current_app._get_current_object(), task.id)
+        return task
+
+    def run(self, app, task_id):
+        with self.lock:
+            self.running += 1
+        try:
+            with app.app_context():
+                self.execute(task_id)
+        except Exception:
+            app.logger.exception("Task %s crashed", task_id)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def execute(self, task_id):
+        table = Task.__table__
+        with db.engine.begin() as conn:
+            started = conn.execute(table.update().where(table.c.id == task_id, table.c.status == 'queued').values(
+                status='running', started_at=datetime.datetime.utcnow(), updated_at=datetime.datetime.utcnow())).rowcount
+            kind, params = conn.execute(db.select(table.c.kind, table.c.params).where(table.c.id == task_id)).one()
+        params = json.loads(params or '{}')
+        status, result, error = 'succeeded', None, None
+        ctx = TaskContext(task_id)
+        stop = threading.Event()
+        try:
+            if not started:  # cancelled while queued
+                return
+            threading.Thread(target=self.heartbeat, args=(current_app._get_current_object(), task_id, stop),
+                             daemon=True, name=f'task-{task_id}-heartbeat').start()
+            result = TASK_HANDLERS[kind](ctx, **params)
+        except TaskCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            current_app.logger.exception("Task %s (%s) failed", task_id, kind)
+            status, error = 'failed', str(e)[:1000]
+        finally:
+            stop.set()
+            db.session.rollback()
+            if params.get('spool') and os.path.exists(params['spool']):
+                os.remove(params['spool'])
+        now = datetime.datetime.utcnow()
+        values = dict(status=status, result=json.dumps(result) if result is not None else None, error=error,
+                      finished_at=now, updated_at=now)
+        if ctx.done is not None:
+            values['progress'] = ctx.done
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == task_id).values(**values))
+
+    def heartbeat(self, app, task_id, stop):
+        """Touch the task's updated_at until `stop` is set, so handlers that
+        report no progress (or hold one long transaction) aren't taken for dead."""
+        table = Task.__table__
+        while not stop.wait(TASK_HEARTBEAT_SECONDS):
+            try:
+                with app.app_context(), db.engine.begin() as conn:
+                    conn.execute(table.update().where(table.c.id == task_id, table.c.status == 'running')
+                                 .values(updated_at=datetime.datetime.utcnow()))
+            except Exception:  # e.g. the handler holds SQLite's write lock; try again next beat
+                app.logger.warning("Task %s heartbeat failed", task_id, exc_info=True)
+
+_task_runner = None
+
+def task_runner():
+    global _task_runner
+    if _task_runner is None:
+        _task_runner = TaskRunner()
+    return _task_runner
+
+def wants_async():
+    """?async=1 or `Prefer: respond-async` asks for a task instead of an inline run."""
+    return (request.args.get('async', '').lower() in ('1', 'true', 'yes')
+            or 'respond-async' in request.headers.get('Prefer', ''))
+
+def spool_request_body(prefix):
+    """Copy the request body to a file the task can read after the request ends."""
+    fd, path = tempfile.mkstemp(prefix=prefix, dir=TASK_SPOOL_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        shutil.copyfileobj(request.stream, f)
+    return path
+
+def expire_stale_task(task):
+    """Mark a running task failed if its heartbeat stopped; True if it was."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=TASK_STALE_SECONDS)
+    if task.status != 'running' or task.updated_at >= cutoff:
+        return False
+    task.status, task.error = 'failed', f"Interrupted: no progress for {TASK_STALE_SECONDS}s"
+    task.finished_at = datetime.datetime.utcnow()
+    db.session.commit()
+    return True
+
+def serialize_task(t: Task):
+    return {
+        "id": t.id,
+        "kind": t.kind,
+        "status": t.status,
+        "progress": t.progress,
+        "total": t.total,
+        "percent": round(100 * t.progress / t.total, 1) if t.total else None,
+        "message": t.message,
+        "result": json.loads(t.result) if t.result else None,
+        "error": t.error,
+        "cancel_requested": t.cancel_requested,
+        "created_at": t.created_at.isoformat(),
+        "started_at": t.started_at.isoformat() if t.started_at else None,
+        "finished_at": t.finished_at.isoformat() if t.finished_at else None,
+    }
+
+def task_accepted(task):
+    response = jsonify({"task": serialize_task(task)})
+    response.headers['Location'] = f"/api/tasks/{task.id}"
+    return response, 202
+
+@task_handler('customer-import')
+def import_customers_task(ctx, spool, mimetype):
+    with open(spool, 'rb') as f:
+        return run_customer_import(iter_import_rows(mimetype, f),
+                                   lambda processed, added: ctx.progress(processed, message=f"{added} added"))
+
+@task_handler('rebuild-rollups')
+def rebuild_rollups_task(ctx):
+    with db.engine.begin() as conn:
+        rebuild_rollups(conn)
+        rebuild_row_counts(conn)
+        rows = conn.execute(db.select(db.func.count()).select_from(JobDailyStat.__table__)).scalar()
+    return {"rollup_rows": rows}
+
+@task_handler('regenerate-feeds')
+def regenerate_feeds_task(ctx, horizon_days=None):
+    """Re-render every technician's feed into this process's feed cache."""
+    tech_ids = [u.id for u in User.query.filter_by(role='Technician').order_by(User.id)]
+    for n, tech_id in enumerate(tech_ids):
+        ctx.progress(n, len(tech_ids), f"Technician {tech_id}")
+        feed_version = db.session.get(FeedVersion, tech_id)
+        key = (tech_id, horizon_days, datetime.date.today())
+        for _ in iter_feed(tech_id, horizon_days, key, feed_version.version if feed_version else 0):
+            pass
+        db.session.rollback()
+    return {"technicians": len(tech_ids)}
+
+metrics.collectors.append(lambda: [
+    "# HELP pestpro_tasks_running Background tasks executing in this process.",
+    "# TYPE pestpro_tasks_running gauge",
+    f"pestpro_tasks_running {_task_runner.running if _task_runner else 0}",
+])
+
+# --- CUSTOMER SEARCH ---
+# On SQLite, customer_search is an FTS5 index over each customer's own
+# fields plus their property addresses and contact names. Triggers on the
+# three tables keep it in sync, so ORM writes and bulk inserts alike are
+# covered. Other databases fall back to prefix LIKE matching.
+CUSTOMER_SEARCH_LIMIT = 10
+CUSTOMER_SEARCH_MAX_LIMIT = 50
+
+_phone_digits = "replace(replace(replace(replace(replace(coalesce(c.phone, ''), '-', ''), ' ', ''), '(', ''), ')', ''), '.', '')"
+_search_insert = f"""
+    INSERT INTO customer_search (rowid, name, address, phone, email, properties, contacts)
+    SELECT c.id, c.name, coalesce(c.address, ''), coalesce(c.phone, '') || ' ' || {_phone_digits},
+           coalesce(c.email, ''),
+           coalesce((SELECT group_concat(p.address, ' ') FROM property p WHERE p.customer_id = c.id), ''),
+           coalesce((SELECT group_concat(ct.name, ' ') FROM contact ct WHERE ct.customer_id = c.id), '')
+    FROM customer c"""
+_search_refresh = "DELETE FROM customer_search WHERE rowid = {cid}; " + _search_insert + " WHERE c.id = {cid};"
+CUSTOMER_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5("
+    "name, address, phone, email, properties, contacts, tokenize='unicode61')",
+    f"CREATE TRIGGER IF NOT EXISTS customer_search_ai AFTER INSERT ON customer BEGIN {_search_refresh.format(cid='NEW.id')} END",
+    f"CREATE TRIGGER IF NOT EXISTS customer_search_au AFTER UPDATE ON customer BEGIN {_search_refresh.format(cid='NEW.id')} END",
+    "CREATE TRIGGER IF NOT EXISTS customer_search_ad AFTER DELETE ON customer BEGIN "
+    "DELETE FROM customer_search WHERE rowid = OLD.id; END",
+]
+for _child in ('property', 'contact'):
+    CUSTOMER_SEARCH_DDL += [
+        f"CREATE TRIGGER IF NOT EXISTS customer_search_{_child}_ai AFTER INSERT ON {_child} BEGIN "
+        f"{_search_refresh.format(cid='NEW.customer_id')} END",
+        f"CREATE TRIGGER IF NOT EXISTS customer_search_{_child}_au AFTER UPDATE ON {_child} BEGIN "
+        f"{_search_refresh.format(cid='OLD.customer_id')} {_search_refresh.format(cid='NEW.customer_id')} END",
+        f"CREATE TRIGGER IF NOT EXISTS customer_search_{_child}_ad AFTER DELETE ON {_child} BEGIN "
+        f"{_search_refresh.format(cid='OLD.customer_id')} END",
+    ]
+
+def create_search_index(conn):
+    """Create and backfill the FTS index. Returns False where FTS5 is unavailable."""
+    if conn.dialect.name != 'sqlite':
+        return False
+    try:
+        for ddl in CUSTOMER_SEARCH_DDL:
+            conn.exec_driver_sql(ddl)
+    except Exception as e:
+        if 'fts5' not in str(e):
+            raise
+        return False
+    conn.exec_driver_sql("DELETE FROM customer_search")
+    conn.exec_driver_sql(_search_insert)
+    return True
+
+def drop_search_index(conn):
+    if conn.dialect.name == 'sqlite':
+        triggers = conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                        "AND name LIKE 'customer_search_%'").scalars().all()
+        for name in triggers:
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+        conn.exec_driver_sql("DROP TABLE IF EXISTS customer_search")
+
+_search_index_ready = {}  # engine -> bool
+
+def search_index_available():
+    engine = db.engine
+    if engine not in _search_index_ready:
+        _search_index_ready[engine] = inspect(engine).has_table('customer_search')
+    return _search_index_ready[engine]
+
+def fts_prefix_query(q):
+    """'123 main st' -> '"123"* "main"* "st"*' (every term, as a prefix)."""
+    return ' '.join(f'"{term}"*' for term in re.findall(r'\w+', q.lower()))
+
+def search_customers(q, limit):
+    match = fts_prefix_query(q)
+    if not match:
+        return []
+    if search_index_available():
+        rank = db.text("bm25(customer_search, 10.0, 4.0, 3.0, 3.0, 2.0, 2.0)")
+        ids = [row[0] for row in db.session.execute(
+            db.text(f"SELECT rowid FROM customer_search WHERE customer_search MATCH :match "
+                    f"ORDER BY {rank.text} LIMIT :limit"),
+            {"match": match, "limit": limit})]
+        found = load_by_ids(Customer, ids)
+        return [found[i] for i in ids if i in found]
+    pattern = q.strip() + '%'
+    return Customer.query.filter(db.or_(
+        Customer.name.ilike(pattern), Customer.address.ilike(pattern),
+        Customer.phone.ilike(pattern), Customer.email.ilike(pattern),
+    )).order_by(Customer.name).limit(limit).all()
+
+# --- CUSTOMER DEDUPLICATION ---
+# Names, addresses and phones are normalized ("123 Main Street, Apt. 4" ->
+# "123 main st #4"), then customers are grouped by blocking keys (phone,
+# email, house number + street, name tokens). Only pairs that share a block
+# are scored, so the work grows with the block sizes rather than with n².
+# Scoring is the cosine similarity of character-trigram vectors, computed
+# per block as one matrix product over trigrams extracted once per
+# customer. Blocks larger than DEDUPE_MAX_BLOCK are skipped: a shared
+# placeholder phone or a common surname says little. Every customer also
+# stores dedupe_key, its normalized (name, address), which bulk import
+# looks up through ix_customer_dedupe_key.
+DEDUPE_MAX_BLOCK = int(os.getenv('DEDUPE_MAX_BLOCK', '200'))
+DEDUPE_MIN_SCORE = 0.85
+DEDUPE_DEFAULT_LIMIT = 100
+DEDUPE_MAX_LIMIT = 1000
+DEDUPE_WEIGHTS = {'name': 0.5, 'address': 0.5}
+DEDUPE_EXACT_BONUS = 0.15  # per matching phone or email, capped at 1.0
+
+ADDRESS_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'av': 'ave', 'road': 'rd', 'drive': 'dr', 'boulevard': 'blvd',
+    'lane': 'ln', 'court': 'ct', 'place': 'pl', 'circle': 'cir', 'terrace': 'ter', 'parkway': 'pkwy',
+    'highway': 'hwy', 'square': 'sq', 'trail': 'trl', 'way': 'way',
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'northeast': 'ne', 'northwest': 'nw', 'southeast': 'se', 'southwest': 'sw',
+    'apartment': '#', 'apt': '#', 'suite': '#', 'ste': '#', 'unit': '#',
+}
+NAME_NOISE = {'inc', 'llc', 'ltd', 'co', 'corp', 'corporation', 'company', 'the', 'and',
+              'mr', 'mrs', 'ms', 'dr'}
+
+def _words(value):
+    return re.findall(r"[a-z0-9#]+", (value or '').lower().replace("'", ''))
+
+def normalize_name(value):
+    return ' '.join(w for w in _words(value.replace('&', ' ') if value else value) if w not in NAME_NOISE)
+
+def normalize_street_address(value):
+    return re.sub(r'# (\w)', r'#\1', ' '.join(ADDRESS_ABBREVIATIONS.get(w, w) for w in _words(value)))
+
+def customer_dedupe_key(name, address):
+    """'ACME Pest Co.', '12 Oak Avenue' -> 'acme pest|12 oak ave'."""
+    return f"{normalize_name(name)}|{normalize_street_address(address)}"[:300]
+
+def _set_dedupe_key(mapper, connection, target):
+    target.dedupe_key = customer_dedupe_key(target.name, target.address)
+
+event.listen(Customer, 'before_insert', _set_dedupe_key)
+event.listen(Customer, 'before_update', _set_dedupe_key)
+
+def normalize_phone(value):
+    digits = re.sub(r'\D', '', value or '')
+    digits = digits[1:] if len(digits) == 11 and digits.startswith('1') else digits
+    return digits if len(digits) == 10 else ''
+
+def blocking_keys(name, address, phone, email):
+    keys = []
+    if phone:
+        keys.append(f"p:{phone}")
+    if email:
+        keys.append(f"e:{email}")
+    words = address.split()
+    if len(words) >= 2 and words[0].isdigit():
+        keys.append(f"a:{words[0]}:{words[1][:4]}")
+    tokens = sorted(t for t in name.split() if len(t) > 1)
+    if len(tokens) >= 2:
+        keys.append(f"n:{tokens[0][:4]}:{tokens[-1][:4]}")
+    return keys
+
+class TrigramVectors:
+    """Character-trigram ids for a list of texts, extracted once per text and
+    shared by every block the text's record falls in."""
+    def __init__(self, texts):
+        self.texts = texts
+        self.vocab = {}
+        self.grams = {}
+
+    def ids(self, n):
+        grams = self.grams.get(n)
+        if grams is None:
+            padded = f"  {self.texts[n]} " if self.texts[n] else ''
+            grams = self.grams[n] = np.fromiter(
+                (self.vocab.setdefault(padded[i:i + 3], len(self.vocab)) for i in range(len(padded) - 2)),
+                dtype=np.int64)
+        return grams
+
+    def matrix(self, rows):
+        """L2-normalized trigram counts, one row per text index in `rows`."""
+        grams = [self.ids(n) for n in rows]
+        cols, inverse = np.unique(np.concatenate(grams), return_inverse=True)
+        width = max(len(cols), 1)
+        cells = np.repeat(np.arange(len(rows)), [len(g) for g in grams]) * width + inverse
+        matrix = np.bincount(cells, minlength=len(rows) * width).reshape(len(rows), width).astype(float)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+def score_block(members, names, addresses, min_score):
+    """Yield (score, i, j, reasons) for the pairs in one block above min_score;
+    members are (index, name, address, phone, email) tuples and names and
+    addresses the TrigramVectors of those fields."""
+    k = len(members)
+    rows = [m[0] for m in members]
+    names = names.matrix(rows)
+    addresses = addresses.matrix(rows)
+    name_sim = names @ names.T
+    address_sim = addresses @ addresses.T
+    has_address = np.array([bool(m[2]) for m in members])
+    both_addresses = has_address[:, None] & has_address[None, :]
+    # Without two addresses to compare, the name alone decides
+    score = np.where(both_addresses,
+                     DEDUPE_WEIGHTS['name'] * name_sim + DEDUPE_WEIGHTS['address'] * address_sim, name_sim)
+    for column in (3, 4):
+        values = np.array([m[column] or f"-{n}" for n, m in enumerate(members)])
+        score = score + DEDUPE_EXACT_BONUS * (values[:, None] == values[None, :])
+    score = np.minimum(score, 1.0)
+    upper = np.triu(np.ones((k, k), dtype=bool), 1)
+    for i, j in zip(*np.nonzero(upper & (score >= min_score))):
+        a, b = members[i], members[j]
+        reasons = [label for label, matched in (
+            ('phone', a[3] and a[3] == b[3]), ('email', a[4] and a[4] == b[4]),
+            ('name', name_sim[i, j] >= 0.9), ('address', both_addresses[i, j] and address_sim[i, j] >= 0.9)) if matched]
+        yield float(score[i, j]), a[0], b[0], reasons
+
+def find_duplicate_customers(min_score=DEDUPE_MIN_SCORE, limit=DEDUPE_DEFAULT_LIMIT, report=None):
+    """Ranked candidate pairs [{score, reasons, customers}] across all
+    customers. report(blocks_done, blocks_total) is called as blocks finish."""
+    ids, records, blocks = [], [], {}
+    query = db.select(Customer.id, Customer.name, Customer.address, Customer.phone, Customer.email).order_by(Customer.id)
+    for cid, name, address, phone, email in db.session.execute(query.execution_options(yield_per=2000)):
+        # Sorted name tokens, so "Doe, Jane" scores as "Jane Doe"
+        record = (len(ids), ' '.join(sorted(normalize_name(name).split())), normalize_street_address(address),
+                  normalize_phone(phone),
+                  (email or '').strip().lower())
+        ids.append(cid)
+        records.append(record)
+        for key in blocking_keys(*record[1:]):
+            blocks.setdefault(key, []).append(record[0])
+
+    candidates = [members for members in blocks.values() if 1 < len(members) <= DEDUPE_MAX_BLOCK]
+    names = TrigramVectors([r[1] for r in records])
+    addresses = TrigramVectors([r[2] for r in records])
+    best = {}  # (i, j) -> (score, reasons); a pair can share several blocks
+    for n, members in enumerate(candidates, 1):
+        for score, i, j, reasons in score_block([records[m] for m in members], names, addresses, min_score):
+            if score > best.get((i, j), (0.0,))[0]:
+                best[(i, j)] = (score, reasons)
+        if report:
+            report(n, len(candidates))
+    ranked = heapq.nlargest(limit, best.items(), key=lambda item: (item[1][0], -item[0][0], -item[0][1]))
+
+    found = load_by_ids(Customer, sorted({ids[i] for (i, j), _ in ranked} | {ids[j] for (i, j), _ in ranked}))
+    return [{"score": round(score, 3), "reasons": reasons,
+             "customers": [serialize_customer(found[ids[i]]), serialize_customer(found[ids[j]])]}
+            for (i, j), (score, reasons) in ranked]
+
+# Tables whose customer_id moves to the surviving customer on a merge.
+# Job, Property and Contact also carry sync versions and change-log entries.
+MERGE_TABLES = (Job, JobArchive, Property, Contact, ServicePlan)
+
+def merge_customers(survivor_id, duplicate_ids):
+    """Fold the duplicates into the survivor in the current transaction: one
+    UPDATE per table repoints their rows, the survivor's blank fields are
+    filled from them, and the duplicate customers are deleted. Returns
+    {table: rows moved}."""
+    connection = db.session.connection()
+    now = datetime.datetime.utcnow()
+    survivor = db.session.get(Customer, survivor_id)
+    duplicates = sorted(load_by_ids(Customer, duplicate_ids).values(), key=lambda c: c.id)
+    if survivor is None or len(duplicates) != len(set(duplicate_ids)):
+        raise LookupError("Customer not found")
+    duplicate_ids = [c.id for c in duplicates]
+
+    # Technicians whose feeds show these customers' jobs or plan occurrences;
+    # once the rows are repointed the flush hook can no longer find them
+    tech_ids = {t for model in (Job, ServicePlan) for (t,) in db.session.query(model.technician_id).distinct()
+                .filter(model.customer_id.in_(duplicate_ids), model.technician_id.isnot(None))}
+    survivor_has_primary = {
+        model: db.session.query(model.id).filter_by(customer_id=survivor_id, is_primary=True).first() is not None
+        for model in (Property, Contact)}
+
+    moved = {}
+    for model in MERGE_TABLES:
+        table = model.__table__
+        values = {'customer_id': survivor_id}
+        if model in CHANGE_ENTITIES.values():
+            values.update(row_version=table.c.row_version + 1, updated_at=now)
+        if survivor_has_primary.get(model):
+            values['is_primary'] = False
+        statement = table.update().where(table.c.customer_id.in_(duplicate_ids)).values(**values)
+        if model in _ENTITY_NAMES:
+            ids = connection.execute(statement.returning(table.c.id)).scalars().all()
+            record_changes(connection, _ENTITY_NAMES[model], sorted(ids), 'update')
+            moved[table.name] = len(ids)
+        else:
+            moved[table.name] = connection.execute(statement).rowcount
+
+    for field in ('address', 'phone', 'email', 'segment'):
+        fill = next((getattr(c, field) for c in duplicates if getattr(c, field)), None)
+        if fill and not getattr(survivor, field):
+            setattr(survivor, field, fill)
+    for duplicate in duplicates:
+        db.session.delete(duplicate)
+    db.session.flush()
+    if tech_ids:
+        bump_feed_versions(connection, sorted(tech_ids))
+    return moved
+
+@task_handler('find-duplicates')
+def find_duplicates_task(ctx, min_score=DEDUPE_MIN_SCORE, limit=DEDUPE_DEFAULT_LIMIT):
+    return find_duplicate_customers(min_score, limit, lambda done, total: ctx.progress(done, total))
+
+# --- ROUTE PLANNING ---
+# Visit order for a technician's day: haversine distance matrix in NumPy,
+# nearest-neighbour construction, then 2-opt with each pass vectorized over
+# the second edge. Coordinates live on Property; missing ones are geocoded
+# through GEOCODER_URL (Nominatim-style ?q=...&format=json) when configured.
+GEOCODER_URL = os.getenv('GEOCODER_URL')
+ROUTE_SPEED_KMH = 40.0
+EARTH_RADIUS_KM = 6371.0
+
+def geocode_address(address):
+    if not GEOCODER_URL or not address:
+        return None
+    url = f"{GEOCODER_URL}?{urllib.parse.urlencode({'q': address, 'format': 'json', 'limit': 1})}"
+    req = urllib.request.Request(url, headers={'User-Agent': 'PestPro route planner'})
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            results = json.load(resp)
+    except (OSError, ValueError):
+        return None
+    if not results:
+        return None
+    return float(results[0]['lat']), float(results[0]['lon'])
+
+def ensure_coordinates(props):
+    """Geocode properties that have no cached coordinates yet."""
+    changed = False
+    for prop in props:
+        if prop.lat is None or prop.lng is None:
+            coords = geocode_address(prop.address)
+            if coords:
+                prop.lat, prop.lng = coords
+                changed = True
+    if changed:
+        db.session.commit()
+
+def distance_matrix_km(coords):
+    """Pairwise haversine distances for an (n, 2) array of (lat, lng) degrees."""
+    lat, lng = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def path_length(dist, route):
+    return float(dist[route[:-1], route[1:]].sum()) if len(route) > 1 else 0.0
+
+def plan_route(dist, start=0):
+    """Open path over every node of `dist` beginning at `start`."""
+    n = len(dist)
+    route = [start]
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[start] = False
+    for _ in range(n - 1):
+        candidates = np.where(unvisited, dist[route[-1]], np.inf)
+        nxt = int(np.argmin(candidates))
+        route.append(nxt)
+        unvisited[nxt] = False
+    route = np.array(route)
+
+    # 2-opt: reversing route[i..j] swaps edges (a,b),(c,d) for (a,c),(b,d).
+    # The path is open, so when j is the last stop there is no (c,d) edge.
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = route[i - 1], route[i]
+            js = np.arange(i + 1, n)
+            c = route[js]
+            d_next = np.append(route[js[:-1] + 1], -1)
+            has_next = d_next >= 0
+            removed = dist[a, b] + np.where(has_next, dist[c, d_next], 0.0)
+            added = dist[a, c] + np.where(has_next, dist[b, d_next], 0.0)
+            gain = removed - added
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                j = js[best]
+                route[i:j + 1] = route[i:j + 1][::-1].copy()
+                improved = True
+    return route
+
+def route_speed(args):
+    """The ?speed_kmh travel speed; zero or negative speeds have no meaningful arrivals."""
+    speed = args.get('speed_kmh', ROUTE_SPEED_KMH, type=float)
+    if not speed > 0:
+        raise ValueError("speed_kmh must be greater than 0")
+    return speed
+
+def route_for_technician(technician_id, day, args):
+    started = time.perf_counter()
+    speed = route_speed(args)
+    jobs = Job.query.filter(Job.technician_id == technician_id, Job.job_date == day,
+                            Job.status != 'Cancelled').order_by(job_sort_time, Job.id).all()
+    # Jobs without a property are routed to the customer's primary property.
+    primaries = {p.customer_id: p for p in Property.query.filter(
+        Property.customer_id.in_({j.customer_id for j in jobs if not j.property_id}),
+        Property.is_primary.is_(True)).all()} if any(not j.property_id for j in jobs) else {}
+    props = load_by_ids(Property, (j.property_id for j in jobs))
+    job_props = {j.id: props.get(j.property_id) or primaries.get(j.customer_id) for j in jobs}
+    ensure_coordinates({p for p in job_props.values() if p})
+
+    located = [j for j in jobs if job_props[j.id] and job_props[j.id].lat is not None]
+    unlocated = [j.id for j in jobs if j not in located]
+    points = [(job_props[j.id].lat, job_props[j.id].lng) for j in located]
+    depot = args.get('start_lat', type=float), args.get('start_lng', type=float)
+    has_depot = None not in depot
+    if has_depot:
+        points.insert(0, depot)
+
+    order, total_km, original_km, dist = [], 0.0, 0.0, None
+    if points:
+        dist = distance_matrix_km(np.array(points, dtype=float))
+        route = plan_route(dist, start=0)
+        original_km = path_length(dist, np.arange(len(points)))
+        total_km = path_length(dist, route)
+        order = [int(i) for i in route]
+
+    service_minutes = args.get('service_minutes', type=int)  # overrides each job's own duration
+    clock = datetime.datetime.combine(day, datetime.time.fromisoformat(args.get('day_start', '08:00')))
+    stops, prev = [], None
+    for idx in order:
+        leg_km = float(dist[prev, idx]) if prev is not None else 0.0
+        prev = idx
+        if has_depot and idx == 0:
+            continue
+        job = located[idx - 1 if has_depot else idx]
+        clock += datetime.timedelta(hours=leg_km / speed) if stops or has_depot else datetime.timedelta(0)
+        prop = job_props[job.id]
+        stops.append({
+            "job_id": job.id, "property_id": prop.id, "address": prop.address,
+            "lat": prop.lat, "lng": prop.lng, "leg_km": round(leg_km, 2),
+            "arrival": clock.strftime('%H:%M'), "overflows_day": clock.date() != day, "job": job,
+        })
+        clock += datetime.timedelta(minutes=service_minutes or job.duration_minutes or DEFAULT_JOB_MINUTES)
+
+    return {
+        "technician_id": technician_id,
+        "date": day.isoformat(),
+        "stops": stops,
+        "unlocated": unlocated,
+        "total_km": round(total_km, 2),
+        "original_km": round(original_km, 2),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+def apply_route_times(plan):
+    """Rewrite job_time to the planned arrival times (rounded to 5 minutes).
+    Stops that would spill past midnight keep their current time."""
+    for stop in plan["stops"]:
+        if stop["overflows_day"]:
+            continue
+        hh, mm = map(int, stop["arrival"].split(':'))
+        stop["job"].job_time = datetime.time(hh, mm - mm % 5)
+    db.session.commit()
+
+def route_response(plan):
+    plan["stops"] = [{k: v for k, v in stop.items() if k != "job"} for stop in plan["stops"]]
+    return plan
+
+# --- TERRITORIES / SPATIAL INDEX ---
+# Property coordinates are bucketed into a fixed lat/lng grid: grid_cell is
+# row * GRID_COLUMNS + column for GRID_CELL_DEG cells, kept in step on every
+# ORM write. An area query turns its bounding box into one BETWEEN range of
+# cells per grid row, answered from ix_property_grid_cell, and then checks
+# the exact distance of the few candidates. Territories are a handful of
+# rows, so they are matched in Python from the reference cache.
+GRID_CELL_DEG = 0.02  # ~2.2 km of latitude
+GRID_COLUMNS = int(round(360 / GRID_CELL_DEG))
+KM_PER_DEG_LAT = EARTH_RADIUS_KM * math.pi / 180
+NEARBY_DEFAULT_RADIUS_KM = 5.0
+NEARBY_MAX_RADIUS_KM = 100.0
+NEARBY_MAX_DAYS = 31
+SUGGEST_RADIUS_KM = float(os.getenv('SUGGEST_RADIUS_KM', '5'))
+
+def grid_cell(lat, lng):
+    if lat is None or lng is None:
+        return None
+    return int((lat + 90) / GRID_CELL_DEG) * GRID_COLUMNS + int((lng + 180) / GRID_CELL_DEG)
+
+def grid_cell_expression(table):
+    """grid_cell() in SQL for backfills; CAST truncates like int() on the positive offsets."""
+    return (db.cast((table.c.lat + 90) / GRID_CELL_DEG, db.Integer) * GRID_COLUMNS
+            + db.cast((table.c.lng + 180) / GRID_CELL_DEG, db.Integer))
+
+def _set_grid_cell(mapper, connection, target):
+    target.grid_cell = grid_cell(target.lat, target.lng)
+
+event.listen(Property, 'before_insert', _set_grid_cell)
+event.listen(Property, 'before_update', _set_grid_cell)
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    dlat, dlng = math.radians(lat2 - lat1), math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+def radius_box(lat, lng, radius_km):
+    """(lat_min, lat_max, lng_min, lng_max) enclosing the circle."""
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlng = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lng - dlng, lng + dlng
+
+def grid_ranges(box):
+    """[(first cell, last cell)] for each grid row the box overlaps."""
+    lat_min, lat_max, lng_min, lng_max = box
+    first_row = int((max(lat_min, -90.0) + 90) / GRID_CELL_DEG)
+    last_row = int((min(lat_max, 90.0) + 90) / GRID_CELL_DEG)
+    first_col = int((max(lng_min, -180.0) + 180) / GRID_CELL_DEG)
+    last_col = min(int((min(lng_max, 180.0) + 180) / GRID_CELL_DEG), GRID_COLUMNS - 1)
+    return [(row * GRID_COLUMNS + first_col, row * GRID_COLUMNS + last_col) for row in range(first_row, last_row + 1)]
+
+def located_jobs(box, start, end, technician_id=None):
+    """(job, lat, lng) for the open jobs in [start, end) located in the box's
+    grid cells, by their property or else their customer's primary one."""
+    in_box = db.or_(*(Property.grid_cell.between(lo, hi) for lo, hi in grid_ranges(box)))
+    found = []
+    for on in (Property.id == Job.property_id,
+               db.and_(Job.property_id.is_(None), Property.customer_id == Job.customer_id, Property.is_primary.is_(True))):
+        query = db.session.query(Job, Property.lat, Property.lng).join(Property, on)\
+            .filter(in_box, Job.job_date >= start, Job.job_date < end, Job.status != 'Cancelled')
+        if technician_id is not None:
+            query = query.filter(Job.technician_id == technician_id)
+        found += query.all()
+    return found
+
+def nearby_jobs(lat, lng, radius_km, start, end, technician_id=None):
+    """[(distance_km, job)] within radius_km of the point, nearest first."""
+    found = []
+    for job, job_lat, job_lng in located_jobs(radius_box(lat, lng, radius_km), start, end, technician_id):
+        distance = haversine_km(lat, lng, job_lat, job_lng)
+        if distance <= radius_km:
+            found.append((distance, job))
+    found.sort(key=lambda f: (f[0], f[1].id))
+    return found
+
+def resolve_point(values):
+    """(lat, lng) from lat/lng, a property_id, or a customer_id's primary
+    property (geocoded on first use). LookupError when there is none."""
+    if values.get('lat') is not None and values.get('lng') is not None:
+        return float(values['lat']), float(values['lng'])
+    prop = None
+    if values.get('property_id'):
+        prop = db.session.get(Property, int(values['property_id']))
+    elif values.get('customer_id'):
+        prop = Property.query.filter_by(customer_id=int(values['customer_id']), is_primary=True).first()
+    if prop is None:
+        raise LookupError("No property to locate")
+    ensure_coordinates([prop])
+    if prop.lat is None or prop.lng is None:
+        raise LookupError("Property has no coordinates")
+    return prop.lat, prop.lng
+
+def parse_day_range(args):
+    """[start, end) from ?date= or ?start=&end=, defaulting to today."""
+    start = datetime.date.fromisoformat(args.get('date') or args.get('start') or datetime.date.today().isoformat())
+    end = datetime.date.fromisoformat(args['end']) if args.get('end') and not args.get('date') \
+        else start + datetime.timedelta(days=1)
+    if not start < end <= start + datetime.timedelta(days=NEARBY_MAX_DAYS):
+        raise ValueError(f"range must be 1 to {NEARBY_MAX_DAYS} days")
+    return start, end
+
+def serialize_territory(t: Territory):
+    return {
+        "id": t.id,
+        "name": t.name,
+        "technician_id": t.technician_id,
+        "center_lat": t.center_lat,
+        "center_lng": t.center_lng,
+        "radius_km": t.radius_km,
+        "polygon": json.loads(t.polygon) if t.polygon else None,
+        "active": t.active,
+    }
+
+def cached_territories():
+    return reference_cache.get('territories', lambda: [
+        serialize_territory(t) for t in Territory.query.filter_by(active=True).order_by(Territory.id)])
+
+def apply_territory(territory, data):
+    """Update a Territory from a request body; ValueError when it is invalid."""
+    territory.name = (data.get('name', territory.name) or '').strip()
+    if not territory.name:
+        raise ValueError("name is required")
+    if 'technician_id' in data:
+        territory.technician_id = int(data['technician_id']) if data['technician_id'] is not None else None
+        if territory.technician_id is not None and db.session.get(User, territory.technician_id) is None:
+            raise ValueError("technician not found")
+    if 'active' in data:
+        territory.active = bool(data['active'])
+    if data.get('polygon') is not None:
+        points = [[float(lat), float(lng)] for lat, lng in data['polygon']]
+        if len(points) < 3:
+            raise ValueError("polygon needs at least 3 [lat, lng] points")
+        if any(not (-90 <= lat <= 90 and -180 <= lng <= 180) for lat, lng in points):
+            raise ValueError("polygon point out of range")
+        territory.polygon = json.dumps(points)
+        territory.center_lat = territory.center_lng = territory.radius_km = None
+    elif any(data.get(k) is not None for k in ('center_lat', 'center_lng', 'radius_km')):
+        lat, lng, radius = float(data['center_lat']), float(data['center_lng']), float(data['radius_km'])
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or radius <= 0:
+            raise ValueError("center out of range or radius_km not positive")
+        territory.center_lat, territory.center_lng, territory.radius_km = lat, lng, radius
+        territory.polygon = None
+    if territory.polygon is None and territory.radius_km is None:
+        raise ValueError("give a polygon or center_lat, center_lng and radius_km")
+
+def territory_box(t):
+    if t['polygon']:
+        lats, lngs = zip(*t['polygon'])
+        return min(lats), max(lats), min(lngs), max(lngs)
+    return radius_box(t['center_lat'], t['center_lng'], t['radius_km'])
+
+def point_in_polygon(lat, lng, polygon):
+    """Even-odd ray casting, treating lat/lng as planar (fine at city scale)."""
+    inside = False
+    for (lat1, lng1), (lat2, lng2) in zip(polygon, polygon[1:] + polygon[:1]):
+        if (lat1 > lat) != (lat2 > lat) and lng < lng1 + (lat - lat1) * (lng2 - lng1) / (lat2 - lat1):
+            inside = not inside
+    return inside
+
+def territory_contains(t, lat, lng):
+    if t['polygon']:
+        return point_in_polygon(lat, lng, t['polygon'])
+    return haversine_km(t['center_lat'], t['center_lng'], lat, lng) <= t['radius_km']
+
+def territory_jobs(t, start, end):
+    """Open jobs in [start, end) located inside the territory."""
+    jobs = [job for job, lat, lng in located_jobs(territory_box(t), start, end) if territory_contains(t, lat, lng)]
+    return sorted(jobs, key=job_sort_key)
+
+def suggest_technicians(lat, lng, day, job_time=None, duration_minutes=None):
+    """Every technician ranked for a job at (lat, lng) on `day`: free at
+    job_time first, then those whose territory covers the point, then by
+    their jobs that day within SUGGEST_RADIUS_KM, then by lightest load."""
+    technicians = cached_technicians()
+    next_day = day + datetime.timedelta(days=1)
+    covering = {}
+    for t in cached_territories():
+        if t['technician_id'] is not None and territory_contains(t, lat, lng):
+            covering.setdefault(t['technician_id'], []).append(t['name'])
+    nearby = {}
+    for distance, job in nearby_jobs(lat, lng, SUGGEST_RADIUS_KM, day, next_day):
+        if job.technician_id is not None:
+            nearby.setdefault(job.technician_id, []).append(distance)
+    booked = {}
+    rows = db.session.query(Job.technician_id, Job.id, Job.job_time, Job.duration_minutes)\
+        .filter(Job.job_date == day, Job.technician_id.isnot(None), Job.status != 'Cancelled')
+    for tech_id, job_id, t, d in rows:
+        booked.setdefault(tech_id, []).append((*job_interval(t, d), job_id))
+    for o in expand_plans(active_plans(day, next_day, [t['id'] for t in technicians]), day, next_day):
+        booked.setdefault(o.technician_id, []).append(
+            (*job_interval(o.job_time, o.duration_minutes), occurrence_id(o.plan_id, o.job_date)))
+
+    suggestions = []
+    for tech in technicians:
+        intervals = booked.get(tech['id'], [])
+        distances = nearby.get(tech['id'], [])
+        available = None
+        if job_time is not None:
+            available = not DayIntervals(intervals).conflicts(*job_interval(job_time, duration_minutes))
+        suggestions.append({
+            "technician_id": tech['id'],
+            "title": tech['title'],
+            "territories": covering.get(tech['id'], []),
+            "nearby_jobs": len(distances),
+            "nearest_job_km": round(min(distances), 2) if distances else None,
+            "jobs_that_day": len(intervals),
+            "booked_minutes": sum(end - start for start, end, _ in intervals),
+            "available": available,
+        })
+    suggestions.sort(key=lambda s: (s['available'] is False, not s['territories'], -s['nearby_jobs'],
+                                    s['booked_minutes'], s['technician_id']))
+    return suggestions
+
+def auto_assign_technician(customer_id, property_id, day, job_time, duration_minutes):
+    """The best free suggestion for a new job, or None when the job can't be
+    located or nobody is free."""
+    try:
+        lat, lng = resolve_point({'property_id': property_id, 'customer_id': customer_id})
+    except LookupError:
+        return None
+    ranked = suggest_technicians(lat, lng, day, job_time, duration_minutes)
+    return next((s for s in ranked if s['available'] is not False), None)
+
+# --- SCHEDULING CONFLICTS / OPEN SLOTS ---
+# A technician's day is loaded through ix_job_tech_date_time into a
+# DayIntervals, which answers overlap queries with a bisect over the sorted
+# starts and a running max of the ends.
+UNTIMED_JOB_START = datetime.time(9, 0)  # where untimed jobs show on the calendar
+OPEN_SLOTS_MAX_DAYS = 62
+SCHEDULE_FIELDS = ('start', 'job_date', 'job_time', 'duration_minutes', 'technician_id', 'status')
+
+def minutes_of(t):
+    return t.hour * 60 + t.minute
+
+def job_interval(job_time, duration_minutes):
+    start = minutes_of(job_time or UNTIMED_JOB_START)
+    return start, start + (duration_minutes or DEFAULT_JOB_MINUTES)
+
+class DayIntervals:
+    def __init__(self, intervals):
+        """intervals: iterable of (start_minute, end_minute, job id or occurrence id)."""
+        self.intervals = sorted(intervals, key=lambda i: (i[0], i[1]))
+        self.starts = [i[0] for i in self.intervals]
+        self.max_end = list(itertools.accumulate((i[1] for i in self.intervals), max))
+
+    def conflicts(self, start, end, exclude_id=None):
+        """Ids of bookings overlapping [start, end)."""
+        found = []
+        i = bisect.bisect_left(self.starts, end) - 1
+        while i >= 0 and self.max_end[i] > start:
+            s, e, job_id = self.intervals[i]
+            if e > start and job_id != exclude_id:
+                found.append(job_id)
+            i -= 1
+        return found[::-1]
+
+    def gaps(self, day_start, day_end):
+        """Free [start, end) ranges between day_start and day_end."""
+        cursor = day_start
+        for s, e, _ in self.intervals:
+            if s > cursor:
+                yield cursor, min(s, day_end)
+            cursor = max(cursor, e)
+            if cursor >= day_end:
+                return
+        if cursor < day_end:
+            yield cursor, day_end
+
+def day_intervals(technician_id, day):
+    rows = db.session.query(Job.id, Job.job_time, Job.duration_minutes)\
+        .filter(Job.technician_id == technician_id, Job.job_date == day, Job.status != 'Cancelled').all()
+    next_day = day + datetime.timedelta(days=1)
+    occurrences = expand_plans(active_plans(day, next_day, [technician_id]), day, next_day)
+    return DayIntervals(
+        [(*job_interval(t, d), job_id) for job_id, t, d in rows]
+        + [(*job_interval(o.job_time, o.duration_minutes), occurrence_id(o.plan_id, o.job_date)) for o in occurrences]
+    )
+
+def find_conflicts(job):
+    if not job.technician_id or job.status == 'Cancelled':
+        return []
+    start, end = job_interval(job.job_time, job.duration_minutes)
+    return day_intervals(job.technician_id, job.job_date).conflicts(start, end, exclude_id=job.id)
+
+def conflict_response(conflicts):
+    jobs = Job.query.filter(Job.id.in_([c for c in conflicts if isinstance(c, int)])).all()
+    for ref in conflicts:
+        if isinstance(ref, str):  # plan-<id>-<date>
+            _, plan_id, day = ref.split('-', 2)
+            jobs.append(occurrence_job(db.session.get(ServicePlan, int(plan_id)), datetime.date.fromisoformat(day)))
+    jobs.sort(key=lambda j: j.job_time or datetime.time(0, 0))
+    return jsonify({
+        "error": "Technician is already booked at that time",
+        "conflicts": [{"id": j.id or occurrence_id(j.plan_id, j.occurrence_date), "description": j.description,
+                       "job_time": j.job_time.strftime('%H:%M') if j.job_time else None,
+                       "duration_minutes": j.duration_minutes} for j in jobs],
+    }), 409
+
+def find_open_slots(duration, start_day, end_day, count, technician_ids, day_start, day_end, step):
+    """The first `count` free (day, start, technician) slots of `duration`
+    minutes, in time order, taking the earliest fitting start in each gap."""
+    rows = db.session.query(Job.technician_id, Job.job_date, Job.id, Job.job_time, Job.duration_minutes)\
+        .filter(Job.technician_id.in_(technician_ids), Job.job_date >= start_day,
+                Job.job_date < end_day, Job.status != 'Cancelled').all()
+    booked = {}
+    for tech_id, day, job_id, t, d in rows:
+        booked.setdefault((tech_id, day), []).append((*job_interval(t, d), job_id))
+    for o in expand_plans(active_plans(start_day, end_day, technician_ids), start_day, end_day):
+        booked.setdefault((o.technician_id, o.job_date), []).append(
+            (*job_interval(o.job_time, o.duration_minutes), occurrence_id(o.plan_id, o.job_date)))
+
+    now = datetime.datetime.now()
+    slots = []
+    day = start_day
+    while day < end_day and len(slots) < count:
+        earliest = day_start
+        if day == now.date():
+            earliest = max(day_start, minutes_of(now.time()) + 1)
+        found = []
+        for tech_id in technician_ids:
+            for gap_start, gap_end in DayIntervals(booked.get((tech_id, day), ())).gaps(earliest, day_end):
+                slot = -(-gap_start // step) * step  # round up to the step grid
+                if slot + duration <= gap_end:
+                    found.append((slot, tech_id))
+        for slot, tech_id in sorted(found)[:count - len(slots)]:
+            slots.append({
+                "technician_id": tech_id,
+                "date": day.isoformat(),
+                "start": f"{slot // 60:02d}:{slot % 60:02d}",
+                "end": f"{(slot + duration) // 60:02d}:{(slot + duration) % 60:02d}",
+            })
+        day += datetime.timedelta(days=1)
+    return slots
+
+# --- BATCH JOB OPERATIONS ---
+# /api/jobs/batch applies many reschedule/reassign/status changes in one
+# transaction. Each operation selects its jobs by id or by filter and writes
+# the changed ones with one UPDATE per IN-slice. Core SQL skips the flush
+# hooks, so the rollups, feed versions, change log and stock usage are
+# maintained here from each job's values before and after the batch. A
+# filter also selects the service plan occurrences in its date range; they
+# are materialized first, so the operation moves them like any other job.
+BATCH_MAX_OPERATIONS = 500
+BATCH_MAX_JOBS = 5000
+BATCH_SET_FIELDS = ('job_date', 'technician_id', 'status')
+BATCH_COLUMNS = ('id', 'job_date', 'job_time', 'duration_minutes', 'technician_id', 'status', 'price')
+
+def parse_batch_operation(op):
+    """(selector, values, shift) for one operation, where values are the
+    fields to set and shift moves the job date by that many days."""
+    if not isinstance(op, dict):
+        raise ValueError("must be an object")
+    if ('ids' in op) == ('filter' in op):
+        raise ValueError("needs exactly one of 'ids' or 'filter'")
+    if 'ids' in op:
+        selector = {'ids': sorted({int(i) for i in op['ids']})}
+        if not selector['ids']:
+            raise ValueError("'ids' is empty")
+    else:
+        criteria = op['filter'] or {}
+        selector = {}
+        if 'technician_id' in criteria:
+            selector['technician_id'] = int(criteria['technician_id']) if criteria['technician_id'] is not None else None
+        if 'customer_id' in criteria:
+            selector['customer_id'] = int(criteria['customer_id'])
+        for key in ('job_date', 'start', 'end'):
+            if criteria.get(key):
+                selector[key] = datetime.date.fromisoformat(criteria[key])
+        if criteria.get('status'):
+            status = criteria['status']
+            selector['status'] = status.split(',') if isinstance(status, str) else list(status)
+        if not selector.keys() & {'technician_id', 'customer_id', 'job_date', 'start', 'end'}:
+            raise ValueError("filter needs a technician_id, customer_id or date criterion")
+
+    changes = op.get('set') or {}
+    unknown = set(changes) - set(BATCH_SET_FIELDS)
+    if unknown:
+        raise ValueError(f"cannot set {', '.join(sorted(unknown))}")
+    values = {}
+    if 'job_date' in changes:
+        values['job_date'] = datetime.date.fromisoformat(changes['job_date'])
+    if 'technician_id' in changes:
+        values['technician_id'] = int(changes['technician_id']) if changes['technician_id'] is not None else None
+    if 'status' in changes:
+        if not changes['status']:
+            raise ValueError("status cannot be empty")
+        values['status'] = str(changes['status'])
+    shift = int(op.get('shift_days') or 0)
+    if shift and 'job_date' in values:
+        raise ValueError("use either set.job_date or shift_days")
+    if not values and not shift:
+        raise ValueError("nothing to change")
+    return selector, values, shift
+
+def materialize_batch_occurrences(selector):
+    """Turn the plan occurrences a filter selects into jobs; returns how many.
+    Without a bounded date range the occurrences can't be enumerated, so such
+    a filter is refused when an active plan would match it."""
+    if 'ids' in selector or ('status' in selector and 'Scheduled' not in selector['status']):
+        return 0
+    start, end = selector.get('start'), selector.get('end')
+    if 'job_date' in selector:
+        day = selector['job_date']
+        start, end = max(day, start or day), min(day + datetime.timedelta(days=1), end or datetime.date.max)
+    query = ServicePlan.query.filter(ServicePlan.active.is_(True))
+    if 'technician_id' in selector:
+        query = query.filter(ServicePlan.technician_id == selector['technician_id'] if selector['technician_id'] is not None
+                             else ServicePlan.technician_id.is_(None))
+    if 'customer_id' in selector:
+        query = query.filter(ServicePlan.customer_id == selector['customer_id'])
+    if end is not None:
+        query = query.filter(ServicePlan.start_date < end)
+    if start is not None:
+        query = query.filter(db.or_(ServicePlan.end_date.is_(None), ServicePlan.end_date >= start))
+    if start is None or end is None:
+        if query.first():
+            raise ValueError("filter matches recurring service plans; bound it with job_date or start and end")
+        return 0
+    occurrences = expand_plans(query.all(), start, end) if start < end else []
+    if len(occurrences) > BATCH_MAX_JOBS:
+        raise ValueError(f"matches more than {BATCH_MAX_JOBS} jobs")
+    if occurrences:
+        db.session.add_all(occurrences)
+        db.session.flush()  # the flush hooks account for the new jobs
+    return len(occurrences)
+
+def batch_targets(selector):
+    """Current rows (as dicts of BATCH_COLUMNS) matched by a selector."""
+    query = db.select(*(getattr(Job, c) for c in BATCH_COLUMNS))
+    if 'ids' in selector:
+        rows = []
+        for start in range(0, len(selector['ids']), IN_BATCH_SIZE):
+            rows += db.session.execute(query.where(Job.id.in_(selector['ids'][start:start + IN_BATCH_SIZE]))).all()
+    else:
+        if 'technician_id' in selector:
+            query = query.where(Job.technician_id == selector['technician_id'] if selector['technician_id'] is not None
+                                else Job.technician_id.is_(None))
+        if 'customer_id' in selector:
+            query = query.where(Job.customer_id == selector['customer_id'])
+        if 'job_date' in selector:
+            query = query.where(Job.job_date == selector['job_date'])
+        if 'start' in selector:
+            query = query.where(Job.job_date >= selector['start'])
+        if 'end' in selector:
+            query = query.where(Job.job_date < selector['end'])
+        if 'status' in selector:
+            query = query.where(Job.status.in_(selector['status']))
+        rows = db.session.execute(query.order_by(Job.id).limit(BATCH_MAX_JOBS + 1)).all()
+    if len(rows) > BATCH_MAX_JOBS:
+        raise ValueError(f"matches more than {BATCH_MAX_JOBS} jobs")
+    return [row._asdict() for row in rows]
+
+def update_batch_rows(connection, rows, values, shift):
+    """Write `values` (and the date shift) to the given rows, bumping their
+    row versions, with one UPDATE per IN-slice."""
+    table = Job.__table__
+    updates = dict(values, row_version=table.c.row_version + 1, updated_at=datetime.datetime.utcnow())
+    if shift:
+        delta = datetime.timedelta(days=shift)
+        days = {row['job_date'] for row in rows}
+        updates['job_date'] = db.case({day: day + delta for day in days}, value=table.c.job_date)
+    ids = [row['id'] for row in rows]
+    for start in range(0, len(ids), IN_BATCH_SIZE):
+        connection.execute(table.update().where(table.c.id.in_(ids[start:start + IN_BATCH_SIZE])).values(**updates))
+
+def batch_conflicts(moved):
+    """[{id, conflicts}] for moved jobs that overlap another booking on
+    their technician's new day, read after the batch's own updates."""
+    moved = [r for r in moved if r['technician_id'] is not None and r['status'] != 'Cancelled']
+    if not moved:
+        return []
+    tech_ids = sorted({r['technician_id'] for r in moved})
+    first = min(r['job_date'] for r in moved)
+    end = max(r['job_date'] for r in moved) + datetime.timedelta(days=1)
+    rows = db.session.query(Job.technician_id, Job.job_date, Job.id, Job.job_time, Job.duration_minutes)\
+        .filter(Job.technician_id.in_(tech_ids), Job.job_date >= first, Job.job_date < end,
+                Job.status != 'Cancelled').all()
+    booked = {}
+    for tech_id, day, job_id, t, d in rows:
+        booked.setdefault((tech_id, day), []).append((*job_interval(t, d), job_id))
+    for o in expand_plans(active_plans(first, end, tech_ids), first, end):
+        booked.setdefault((o.technician_id, o.job_date), []).append(
+            (*job_interval(o.job_time, o.duration_minutes), occurrence_id(o.plan_id, o.job_date)))
+    days = {}
+    found = []
+    for r in moved:
+        key = (r['technician_id'], r['job_date'])
+        if key not in days:
+            days[key] = DayIntervals(booked.get(key, ()))
+        start, end_minute = job_interval(r['job_time'], r['duration_minutes'])
+        overlaps = days[key].conflicts(start, end_minute, exclude_id=r['id'])
+        if overlaps:
+            found.append({"id": r['id'], "conflicts": overlaps})
+    return found
+
+def apply_job_batch(operations):
+    """Run parsed operations in the current transaction. Returns (per
+    operation counts, {id: before}, {id: after}) for the jobs that changed."""
+    connection = db.session.connection()
+    before, after, counts = {}, {}, []
+    for selector, values, shift in operations:
+        materialize_batch_occurrences(selector)
+        rows = batch_targets(selector)
+        changed = []
+        for row in rows:
+            new = dict(row, **values)
+            if shift:
+                new['job_date'] = row['job_date'] + datetime.timedelta(days=shift)
+            if new != row:
+                before.setdefault(row['id'], row)
+                after[row['id']] = new
+                changed.append(row)
+        if changed:
+            update_batch_rows(connection, changed, values, shift)
+        counts.append({"matched": len(rows), "updated": len(changed)})
+
+    deltas, completion_changed, tech_ids = {}, [], set()
+    for job_id, old in before.items():
+        new = after[job_id]
+        add_rollup_delta(deltas, [old[a] for a in ROLLUP_ATTRS], -1)
+        add_rollup_delta(deltas, [new[a] for a in ROLLUP_ATTRS], +1)
+        if (old['status'] == 'Completed') != (new['status'] == 'Completed'):
+            completion_changed.append(job_id)
+        tech_ids.update((old['technician_id'], new['technician_id']))
+    tech_ids.discard(None)
+    apply_rollup_deltas(connection, deltas)
+    if completion_changed:
+        post_job_usage(connection, completion_changed)
+    if tech_ids:
+        bump_feed_versions(connection, sorted(tech_ids))
+    record_changes(connection, 'job', sorted(after), 'update')
+    return counts, before, after
+
+def rescheduled_jobs(before, after):
+    """Rows whose booking moved: new day or technician, or no longer cancelled."""
+    return [new for job_id, new in after.items()
+            if (new['job_date'], new['technician_id']) != (before[job_id]['job_date'], before[job_id]['technician_id'])
+            or before[job_id]['status'] == 'Cancelled']
+
+# --- STREAMING JSON ---
+# Opt-in (?stream=1) for the big list endpoints: rows are read from a
+# server-side cursor in batches and encoded as they go, producing the same
+# bytes jsonify() would for the full list.
+STREAM_BATCH_SIZE = 500
+
+def wants_stream():
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+def iter_query_batches(query, size=STREAM_BATCH_SIZE):
+    return iter_chunks(query.yield_per(size), size)
+
+def stream_json_array(batches):
+    """Stream an iterable of lists of rows as one JSON array."""
+    provider = current_app.json
+    pretty = provider.compact is False or (provider.compact is None and current_app.debug)
+    dump_args = {"indent": 2} if pretty else {"separators": (",", ":")}
+    separator, opening, closing = (",\n", "[\n", "\n]\n") if pretty else (",", "[", "]\n")
+
+    def encode(row):
+        text = provider.dumps(row, **dump_args)
+        return text.replace("\n", "\n  ") if pretty else text
+
+    def generate():
+        first = True
+        for batch in batches:
+            if not batch:
+                continue
+            prefix = opening if first else separator
+            if pretty:
+                prefix += "  "
+            yield prefix + (separator + "  " if pretty else separator).join(encode(row) for row in batch)
+            first = False
+        yield "[]\n" if first else closing
+
+    return Response(stream_with_context(generate()), mimetype=provider.mimetype)
+
+# --- EXPORTS ---
+# /api/export/<entity> streams flat rows (no nested payloads) as CSV or,
+# with pyarrow installed, Parquet. Rows come from a server-side cursor on a
+# connection of the export's own in EXPORT_BATCH_SIZE batches; each batch
+# becomes one CSV chunk or one Parquet row group, so memory stays flat
+# however many rows are exported.
+EXPORT_BATCH_SIZE = 5000
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# name -> type, per entity, in output order
+EXPORT_COLUMNS = {
+    'jobs': [
+        ('id', 'int'), ('job_date', 'date'), ('job_time', 'time'), ('status', 'str'), ('description', 'str'),
+        ('customer_id', 'int'), ('customer_name', 'str'), ('technician_id', 'int'), ('technician_email', 'str'),
+        ('property_id', 'int'), ('property_address', 'str'), ('price', 'float'), ('duration_minutes', 'int'),
+        ('plan_id', 'int'), ('archived', 'bool'),
+    ],
+    'customers': [
+        ('id', 'int'), ('name', 'str'), ('address', 'str'), ('phone', 'str'), ('email', 'str'),
+        ('segment', 'str'), ('updated_at', 'datetime'),
+    ],
+    'inventory': [
+        ('id', 'int'), ('name', 'str'), ('category', 'str'), ('currentStock', 'int'), ('minStock', 'int'),
+        ('maxStock', 'int'), ('unitCost', 'float'), ('sellingPrice', 'float'), ('supplier', 'str'),
+        ('lastOrdered', 'date'), ('expirationDate', 'date'), ('stock_status', 'str'),
+    ],
+}
+
+def export_jobs_statement(args):
+    """Jobs in [start, end) for the technician/status/customer filters, by
+    date; archived jobs are included when the range reaches them."""
+    start = parse_date_param(args['start']) if args.get('start') else None
+    selects = []
+    for model in (Job, JobArchive) if reaches_archive(start) else (Job,):
+        query = db.select(
+            model.id.label('id'), model.job_date, model.job_time, model.status, model.description,
+            model.customer_id, Customer.name.label('customer_name'),
+            model.technician_id, User.email.label('technician_email'),
+            model.property_id, Property.address.label('property_address'),
+            model.price, model.duration_minutes, model.plan_id, db.literal(model is JobArchive).label('archived'),
+        ).join(Customer, Customer.id == model.customer_id)\
+            .outerjoin(User, User.id == model.technician_id)\
+            .outerjoin(Property, Property.id == model.property_id)
+        if start:
+            query = query.where(model.job_date >= start)
+        if args.get('end'):
+            query = query.where(model.job_date < parse_date_param(args['end']))
+        if args.get('technician_id'):
+            query = query.where(model.technician_id.in_([int(t) for t in args['technician_id'].split(',')]))
+        if args.get('status'):
+            query = query.where(model.status.in_(args['status'].split(',')))
+        if args.get('customer_id'):
+            query = query.where(model.customer_id == int(args['customer_id']))
+        selects.append(query)
+    if len(selects) == 1:
+        return selects[0].order_by(Job.job_date, Job.job_time, Job.id)
+    return db.union_all(*selects).order_by('job_date', 'job_time', 'id')
+
+def export_customers_statement(args):
+    query = db.select(*(getattr(Customer, name) for name, _ in EXPORT_COLUMNS['customers']))
+    if args.get('segment'):
+        query = query.where(Customer.segment.in_(args['segment'].split(',')))
+    if args.get('updated_since'):
+        query = query.where(Customer.updated_at >= datetime.datetime.fromisoformat(args['updated_since']))
+    return query.order_by(Customer.id)
+
+def export_inventory_statement(args):
+    query = db.select(*(getattr(Inventory, name) for name, _ in EXPORT_COLUMNS['inventory']))
+    if args.get('status'):
+        query = query.where(Inventory.stock_status.in_(args['status'].split(',')))
+    if args.get('category'):
+        query = query.where(Inventory.category.in_(args['category'].split(',')))
+    return query.order_by(Inventory.id)
+
+EXPORT_STATEMENTS = {
+    'jobs': export_jobs_statement,
+    'customers': export_customers_statement,
+    'inventory': export_inventory_statement,
+}
+
+def iter_export_batches(statement, size=EXPORT_BATCH_SIZE):
+    """Lists of up to `size` rows from a server-side cursor, on a connection
+    that is released as soon as the stream ends or is abandoned."""
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=size).execute(statement)
+        yield from result.partitions()
+
+def iter_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+class ParquetSink:
+    """Write-only file object whose contents are handed back by drain()."""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+def parquet_schema(columns):
+    types = {'int': pa.int64(), 'str': pa.string(), 'float': pa.float64(), 'bool': pa.bool_(),
+             'date': pa.date32(), 'time': pa.time64('us'), 'datetime': pa.timestamp('us')}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+def iter_parquet(columns, batches):
+    schema = parquet_schema(columns)
+    sink = ParquetSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd')
+    try:
+        for batch in batches:
+            values = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values[i], type=schema.field(i).type) for i in range(len(columns))], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
 
-class MarketingCampaign(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(150), nullable=False)
-    type = db.Column(db.String(50))
-    audience = db.Column(db.String(50))
-    status = db.Column(db.String(50), default='Draft')
-    sent = db.Column(db.Integer, default=0)
-    opened = db.Column(db.Integer, default=0)
-    clicked = db.Column(db.Integer, default=0)
-    revenue = db.Column(db.Float, default=0.0)
-    createdDate = db.Column(db.Date)
-    content_subject = db.Column(db.String(200))
-    content_body = db.Column(db.Text)
+# --- WIRE FORMATS / COMPRESSION ---
+# Responses are gzip- (or, with the brotli module, br-) encoded when the
+# client accepts it; streamed bodies are compressed chunk by chunk with a
+# sync flush so they still arrive progressively. Job lists can also be
+# requested as ?shape=normalized (nested customer/property/contact dicts
+# hoisted into id-keyed side tables) and as MessagePack (Accept:
+# application/msgpack or ?format=msgpack) when msgpack is installed.
+COMPRESS_RESPONSES = os.getenv('COMPRESS_RESPONSES', 'true').lower() == 'true'
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/msgpack', 'text/calendar', 'text/csv', 'text/plain')
+MSGPACK_MIMETYPE = 'application/msgpack'
 
-# --- HELPERS / SERIALIZERS ---
-def serialize_property(p: Property):
-    return {
-        "id": p.id,
-        "label": p.label,
-        "address": p.address,
-        "notes": p.notes,
-        "is_primary": bool(p.is_primary),
-    }
+def negotiated_encoding():
+    offered = ['br', 'gzip'] if brotli else ['gzip']
+    return request.accept_encodings.best_match(offered)
 
-def serialize_contact(c: Contact):
-    return {
-        "id": c.id,
-        "name": c.name,
-        "phone": c.phone,
-        "email": c.email,
-        "title": c.title,
-        "is_primary": bool(c.is_primary),
-    }
+class StreamCompressor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self.compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
 
-def format_job(job: Job):
-    customer = Customer.query.get(job.customer_id)
-    technician = User.query.get(job.technician_id) if job.technician_id else None
-    prop = Property.query.get(job.property_id) if job.property_id else None
-    contact = Contact.query.get(job.contact_id) if job.contact_id else None
+    def chunk(self, data):
+        if self.encoding == 'br':
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
 
-    start_datetime = datetime.datetime.combine(
-        job.job_date, job.job_time if job.job_time else datetime.time(9, 0)
-    )
-    payload = {
-        "id": job.id,
-        "title": f"{customer.name} - {job.description}",
-        "start": start_datetime.isoformat(),
-        "description": job.description,
-        "notes": job.notes,
-        "status": job.status,
-        "job_date": job.job_date.isoformat(),
-        "job_time": job.job_time.strftime('%H:%M') if job.job_time else None,
-        "customer": {
-            "id": customer.id,
-            "name": customer.name,
-            "address": customer.address,
-            "phone": customer.phone,
-            "email": customer.email,
-        },
-        "technician_id": job.technician_id,
-        "resourceId": job.technician_id,
-        "technician_name": technician.email.split('@')[0].capitalize() if technician else "Unassigned",
-        "color": 'green' if job.status == 'Completed' else 'blue',
-    }
+    def finish(self):
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush()
 
-    if prop:
-        payload["property"] = serialize_property(prop)
-    if contact:
-        payload["contact"] = serialize_contact(contact)
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL)
 
-    return payload
+def iter_compressed(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    for chunk in chunks:
+        data = compressor.chunk(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+@api.after_app_request
+def compress_response(response):
+    if not COMPRESS_RESPONSES or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiated_encoding()
+    if not encoding or response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    if response.is_streamed:
+        response.response = iter_compressed(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ, so a strong validator no longer applies;
+    # weak comparison still lets If-None-Match revalidate either encoding.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def wants_msgpack():
+    if request.args.get('format') == 'msgpack':
+        return True
+    accept = request.accept_mimetypes
+    return msgpack is not None and accept[MSGPACK_MIMETYPE] > accept['application/json']
+
+def api_response(payload, status=200):
+    """jsonify(payload), or MessagePack when the client negotiated it."""
+    if wants_msgpack():
+        if msgpack is None:
+            return jsonify({"error": "MessagePack output is not available on this server"}), 406
+        return Response(msgpack.packb(payload), status=status, mimetype=MSGPACK_MIMETYPE)
+    return jsonify(payload), status
+
+def wants_normalized():
+    return request.args.get('shape') == 'normalized'
+
+def normalize_jobs(payloads):
+    """{"jobs": [...], "customers": {id: ...}, "properties": {...}, "contacts": {...}}
+    with each job pointing at its customer/property/contact by id."""
+    tables = {"customers": {}, "properties": {}, "contacts": {}}
+    jobs = []
+    for payload in payloads:
+        job = dict(payload)
+        for key, table in (("customer", "customers"), ("property", "properties"), ("contact", "contacts")):
+            related = job.pop(key, None)
+            if related is not None:
+                tables[table][str(related["id"])] = related
+                job[f"{key}_id"] = related["id"]
+            elif key != "customer":
+                job[f"{key}_id"] = None
+        jobs.append(job)
+    return {"jobs": jobs, **tables}
 
 # --- API ENDPOINTS ---
 
-@app.route('/api/calendar/<int:technician_id>/feed.ics')
+@api.route('/api/calendar/<int:technician_id>/feed.ics')
+@read_replica
 def get_technician_calendar_feed(technician_id):
+    """Optional ?days=N limits the feed to jobs up to N days ahead."""
     technician = User.query.get_or_404(technician_id)
-    jobs = Job.query.filter_by(technician_id=technician.id).filter(Job.status != 'Completed').all()
-    cal = Calendar()
-    for job in jobs:
-        customer = Customer.query.get(job.customer_id)
-        prop = Property.query.get(job.property_id) if job.property_id else None
-        start_time = datetime.datetime.combine(job.job_date, job.job_time if job.job_time else datetime.time(9, 0))
-        end_time = start_time + datetime.timedelta(hours=1)
-        event = Event()
-        event.name = f"Job: {job.description}"
-        event.begin = start_time
-        event.end = end_time
-        loc_address = prop.address if prop else customer.address
-        event.description = (
-            f"Customer: {customer.name}\n"
-            f"Address: {loc_address}\n"
-            f"Phone: {customer.phone}\n"
-            f"Notes: {job.notes or 'N/A'}"
-        )
-        event.location = loc_address
-        cal.events.add(event)
-    return Response(str(cal), mimetype='text/calendar')
+    horizon_days = request.args.get('days', ICS_DEFAULT_HORIZON_DAYS, type=int)
+    feed_version = db.session.get(FeedVersion, technician.id)
+    version = feed_version.version if feed_version else 0
+    today = datetime.date.today()
+    key = (technician.id, horizon_days, today)
+
+    def conditional(response):
+        # The day is part of the tag because the horizon moves with it.
+        response.set_etag(f"{technician.id}-{version}-{horizon_days or 'all'}-{today.isoformat()}")
+        if feed_version and feed_version.updated_at:
+            response.last_modified = feed_version.updated_at.replace(tzinfo=datetime.timezone.utc)
+        return response.make_conditional(request)
+
+    cached = _ics_cache.get(key)
+    if cached and cached[0] == version:
+        return conditional(Response(cached[1], mimetype='text/calendar'))
+
+    response = conditional(Response(stream_with_context(iter_feed(technician.id, horizon_days, key, version)),
+                                    mimetype='text/calendar'))
+    if response.status_code == 304:
+        response.response = []
+    return response
 
-@app.route('/api/customers/bulk-upload', methods=['POST'])
+@api.route('/api/customers/bulk-upload', methods=['POST'])
 def bulk_upload_customers():
-    data = request.get_json()
-    customers_to_add = data.get('customers', [])
-    errors = []
-    added_count = 0
-    skipped_count = 0
-    for cust_data in customers_to_add:
-        name = cust_data.get('name')
-        address = cust_data.get('address')
-        if not name:
-            errors.append({"error": "Missing name", "data": cust_data})
-            continue
-        existing_customer = Customer.query.filter_by(name=name, address=address).first()
-        if existing_customer:
-            skipped_count += 1
-            continue
-        new_customer = Customer(
-            name=name,
-            address=address,
-            phone=cust_data.get('phone'),
-            email=cust_data.get('email')
-        )
-        db.session.add(new_customer)
-        added_count += 1
-    db.session.commit()
-    return jsonify({
-        "message": f"Processed {len(customers_to_add)} records. Added {added_count} new customers. Skipped {skipped_count} duplicates.",
-        "errors": errors
-    }), 200
+    """Accepts {"customers": [...]} JSON, text/csv or application/x-ndjson.
+    CSV and NDJSON bodies are read as a stream, so memory stays bounded by
+    the chunk size rather than the upload size. With ?async=1 (or Prefer:
+    respond-async) the body is spooled and imported by a background task."""
+    if wants_async():
+        path = spool_request_body('pestpro-import-')
+        return task_accepted(task_runner().submit('customer-import', {'spool': path, 'mimetype': request.mimetype}))
+    try:
+        return jsonify(run_customer_import(iter_import_rows(request.mimetype, request.stream))), 200
+    except ValueError as e:
+        return jsonify({"error": f"Invalid upload body: {e}"}), 400
 
-@app.route('/api/auth/login', methods=['POST'])
+@api.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
     user = User.query.filter_by(email=data.get('email')).first()
@@ -214,16 +3750,14 @@ def login():
         return jsonify({"message": "Login Successful", "user": {"email": user.email, "role": user.role}})
     return jsonify({"error": "User not found"}), 404
 
-@app.route('/api/users', methods=['GET'])
+@api.route('/api/users', methods=['GET'])
 def get_users():
     try:
-        users = User.query.all()
-        user_list = [{"id": u.id, "email": u.email, "role": u.role} for u in users]
-        return jsonify(user_list)
+        return jsonify(reference_cache.get('users', lambda: [user_summary(u) for u in User.query.all()]))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/users', methods=['POST'])
+@api.route('/api/users', methods=['POST'])
 def create_user():
     data = request.get_json()
     if not data or not data.get('email') or not data.get('role'):
@@ -239,7 +3773,7 @@ def create_user():
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/users/<int:user_id>', methods=['PUT', 'DELETE'])
+@api.route('/api/users/<int:user_id>', methods=['PUT', 'DELETE'])
 def update_user(user_id):
     user = User.query.get_or_404(user_id)
     if request.method == 'PUT':
@@ -255,16 +3789,20 @@ def update_user(user_id):
         db.session.commit()
         return jsonify({"message": "User deleted successfully"}), 200
 
-@app.route('/api/dashboard')
+@api.route('/api/dashboard')
+@read_replica
 def dashboard_data():
-    total_customers = Customer.query.count()
-    total_jobs = Job.query.count()
-    completed_jobs = Job.query.filter_by(status='Completed').count()
-    scheduled_jobs = Job.query.filter_by(status='Scheduled').count()
-    job_status_distribution = [
-        {'name': 'Completed', 'value': completed_jobs},
-        {'name': 'Scheduled', 'value': scheduled_jobs}
-    ]
+    today = datetime.date.today()
+    total_customers = row_count(Customer)
+    tomorrow = today + datetime.timedelta(days=1)
+    # Plan occurrences only reach the rollup once materialized, so count today's others directly.
+    jobs_today = (db.session.query(db.func.sum(JobDailyStat.job_count))
+                  .filter(JobDailyStat.day == today).scalar() or 0) \
+        + len(expand_plans(active_plans(today, tomorrow), today, tomorrow))
+    revenue_this_month = db.session.query(db.func.sum(JobDailyStat.revenue))\
+        .filter(JobDailyStat.status == 'Completed', JobDailyStat.day >= today.replace(day=1)).scalar() or 0
+    alerts = dict(db.session.query(Inventory.stock_status, db.func.count(Inventory.id))
+                  .filter(Inventory.stock_status.in_(ALERT_STATUSES)).group_by(Inventory.stock_status).all())
     recent_activity = [{
         "id": job.id, "type": "job",
         "description": f"Job #{job.id} ({job.description}) status: {job.status}"
@@ -272,25 +3810,20 @@ def dashboard_data():
     dashboard_payload = {
         "stats": {
             "totalCustomers": total_customers,
-            "jobsToday": total_jobs,
-            "revenueThisMonth": total_jobs * 150,
-            "inventoryAlerts": 3
+            "jobsToday": int(jobs_today),
+            "revenueThisMonth": round(revenue_this_month, 2),
+            "inventoryAlerts": sum(alerts.values()),
+            "lowStock": alerts.get('Low Stock', 0),
+            "outOfStock": alerts.get('Out of Stock', 0)
         },
-        "revenueTrend": [
-            {'name': 'Jan', 'revenue': 13000},
-            {'name': 'Feb', 'revenue': 15500},
-            {'name': 'Mar', 'revenue': 18000},
-            {'name': 'Apr', 'revenue': 15000},
-            {'name': 'May', 'revenue': 19000},
-            {'name': 'Jun', 'revenue': 26000}
-        ],
-        "jobStatusDistribution": job_status_distribution,
+        "revenueTrend": revenue_trend(),
+        "jobStatusDistribution": status_distribution(),
         "recentActivity": recent_activity
     }
     return jsonify(dashboard_payload)
 
 # --- JOBS ---
-@app.route('/api/jobs', methods=['GET', 'POST'])
+@api.route('/api/jobs', methods=['GET', 'POST'])
 def handle_jobs():
     if request.method == 'POST':
         data = request.get_json() or {}
@@ -312,6 +3845,8 @@ def handle_jobs():
             property_id = data.get('property_id')
             contact_id = data.get('contact_id')
             notes = data.get('notes')
+            price = data.get('price')
+            duration = data.get('duration_minutes')
 
             job_time = None
             if data.get('job_time'):
@@ -319,6 +3854,13 @@ def handle_jobs():
                 hh, mm = data['job_time'].split(':')
                 job_time = datetime.time(int(hh), int(mm))
 
+            # {"auto_assign": true} picks the best free technician by territory and nearby load
+            assignment = None
+            if not technician_id and data.get('auto_assign'):
+                assignment = auto_assign_technician(customer_id, property_id, job_date, job_time,
+                                                    int(duration) if duration else DEFAULT_JOB_MINUTES)
+                technician_id = assignment['technician_id'] if assignment else None
+
             new_job = Job(
                 customer_id=customer_id,
                 technician_id=technician_id,
@@ -328,24 +3870,116 @@ def handle_jobs():
                 notes=notes,
                 status='Scheduled',
                 job_date=job_date,
-                job_time=job_time
+                job_time=job_time,
+                price=float(price) if price is not None else None,
+                duration_minutes=int(duration) if duration else DEFAULT_JOB_MINUTES
             )
+            conflicts = find_conflicts(new_job)
+            if conflicts and not data.get('allow_overlap'):
+                return conflict_response(conflicts)
             db.session.add(new_job)
+            if 'materials' in data:
+                set_job_materials(new_job, data['materials'])
             db.session.commit()
-            return jsonify(format_job(new_job)), 201
+            payload = format_job(new_job)
+            payload["materials"] = job_materials(new_job)
+            if conflicts:
+                payload["conflicts"] = conflicts
+            if data.get('auto_assign'):
+                payload["assignment"] = assignment
+            return jsonify(payload), 201
         except Exception as e:
             db.session.rollback()
             return jsonify({"error": str(e)}), 400
 
-    # GET
-    jobs = Job.query.order_by(Job.job_date.desc()).all()
-    return jsonify([format_job(job) for job in jobs])
+    # GET: windowed + paged when any window parameter is given, otherwise the full list
+    if any(request.args.get(p) for p in JOB_WINDOW_PARAMS):
+        try:
+            jobs, next_cursor = query_job_window(request.args)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid window parameters: {e}"}), 400
+        payload = serialize_jobs(jobs)
+        response, status = api_response(normalize_jobs(payload) if wants_normalized() else payload)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, status
+
+    query = Job.query.order_by(Job.job_date.desc())
+    if wants_stream() and not (wants_normalized() or wants_msgpack()):
+        return stream_json_array(serialize_jobs(batch) for batch in iter_query_batches(query))
+    payload = serialize_jobs(query.all())
+    return api_response(normalize_jobs(payload) if wants_normalized() else payload)
 
-@app.route('/api/jobs/<int:job_id>', methods=['PUT'])
+@api.route('/api/jobs/<int:job_id>', methods=['PUT'])
 def update_job(job_id):
     job = Job.query.get_or_404(job_id)
-    data = request.get_json()
+    return apply_job_update(job, request.get_json())
+
+@api.route('/api/jobs/batch', methods=['POST'])
+def batch_update_jobs():
+    """Apply {"operations": [{"ids": [...] | "filter": {...}, "set": {...},
+    "shift_days": n}, ...]} in one transaction. Filters take technician_id,
+    customer_id, job_date, start/end and status, and also match service plan
+    occurrences in their date range; set takes job_date, technician_id and
+    status. Moved jobs are checked for double bookings
+    unless allow_overlap is set; dry_run reports without saving."""
+    data = request.get_json() or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_OPERATIONS} operations per batch"}), 400
+    parsed = []
+    for n, op in enumerate(operations):
+        try:
+            parsed.append(parse_batch_operation(op))
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({"error": f"operations[{n}]: {e}"}), 400
+    technician_ids = {values['technician_id'] for _, values, _ in parsed if values.get('technician_id') is not None}
+    missing = technician_ids - set(load_by_ids(User, technician_ids))
+    if missing:
+        return jsonify({"error": f"Unknown technician(s): {sorted(missing)}"}), 400
+
+    try:
+        counts, before, after = apply_job_batch(parsed)
+        conflicts = batch_conflicts(rescheduled_jobs(before, after))
+        if conflicts and not data.get('allow_overlap'):
+            db.session.rollback()
+            return jsonify({"error": "Technician is already booked at that time", "conflicts": conflicts}), 409
+        if data.get('dry_run'):
+            db.session.rollback()
+        else:
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    result = {"operations": counts, "updated": len(after), "ids": sorted(after), "dry_run": bool(data.get('dry_run'))}
+    if conflicts:
+        result["conflicts"] = conflicts
+    return jsonify(result)
+
+@api.route('/api/jobs/plan-<int:plan_id>-<string:occurrence>', methods=['PUT', 'DELETE'])
+def update_plan_occurrence(plan_id, occurrence):
+    """Edit one occurrence of a service plan (materializing it as a Job);
+    DELETE skips the occurrence by materializing it as Cancelled."""
+    plan = ServicePlan.query.get_or_404(plan_id)
+    try:
+        day = datetime.date.fromisoformat(occurrence)
+    except ValueError:
+        return jsonify({"error": "Invalid occurrence date"}), 400
+    if day not in plan_occurrence_dates(plan, day, day + datetime.timedelta(days=1)):
+        return jsonify({"error": "Not an occurrence of this plan"}), 404
+    job = materialize_occurrence(plan, day)
+    if request.method == 'DELETE':
+        job.status = 'Cancelled'
+        db.session.commit()
+        return jsonify(format_job(job))
+    return apply_job_update(job, request.get_json())
+
+def apply_job_update(job, data):
     try:
+        if 'materials' in data:
+            set_job_materials(job, data['materials'])  # a Completed job's usage follows at flush
         job.customer_id = data.get('customer_id', job.customer_id)
         job.description = data.get('description', job.description)
         job.notes = data.get('notes', job.notes)
@@ -353,6 +3987,8 @@ def update_job(job_id):
         if 'technician_id' in data: job.technician_id = data.get('technician_id')
         if 'property_id' in data: job.property_id = data.get('property_id')
         if 'contact_id' in data: job.contact_id = data.get('contact_id')
+        if 'price' in data: job.price = float(data['price']) if data['price'] is not None else None
+        if data.get('duration_minutes'): job.duration_minutes = int(data['duration_minutes'])
         if data.get('start'):
             new_start = datetime.datetime.fromisoformat(data['start'])
             job.job_date = new_start.date()
@@ -362,14 +3998,61 @@ def update_job(job_id):
         if data.get('job_time'):
             hh, mm = data['job_time'].split(':')
             job.job_time = datetime.time(int(hh), int(mm))
+        # Only a change to when/who re-checks the booking, so editing notes on
+        # an already overlapping job still works.
+        rescheduled = any(k in data for k in SCHEDULE_FIELDS)
+        conflicts = find_conflicts(job) if rescheduled else []
+        if conflicts and not data.get('allow_overlap'):
+            db.session.rollback()
+            return conflict_response(conflicts)
         db.session.commit()
-        return jsonify(format_job(job))
+        payload = format_job(job)
+        payload["materials"] = job_materials(job)
+        if conflicts:
+            payload["conflicts"] = conflicts
+        return jsonify(payload)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+# --- SERVICE PLANS ---
+@api.route('/api/plans', methods=['GET', 'POST'])
+def handle_plans():
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        plan = ServicePlan(active=True)
+        try:
+            apply_plan_fields(plan, data)
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e)}), 400
+        db.session.add(plan)
+        db.session.commit()
+        return jsonify(serialize_plan(plan)), 201
+
+    query = ServicePlan.query
+    if request.args.get('customer_id'):
+        query = query.filter_by(customer_id=request.args.get('customer_id', type=int))
+    return jsonify([serialize_plan(p) for p in query.order_by(ServicePlan.id).all()])
+
+@api.route('/api/plans/<int:plan_id>', methods=['GET', 'PUT', 'DELETE'])
+def handle_plan(plan_id):
+    plan = ServicePlan.query.get_or_404(plan_id)
+    if request.method == 'PUT':
+        # One row update reschedules every future, unmaterialized occurrence.
+        try:
+            apply_plan_fields(plan, request.get_json() or {})
+        except (ValueError, TypeError) as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 400
+        db.session.commit()
+    elif request.method == 'DELETE':
+        # Ends the plan; occurrences already materialized as jobs are kept.
+        plan.active = False
+        db.session.commit()
+    return jsonify(serialize_plan(plan))
+
 # --- CUSTOMERS (list/create) ---
-@app.route('/api/customers', methods=['GET', 'POST'])
+@api.route('/api/customers', methods=['GET', 'POST'])
 def handle_customers():
     if request.method == 'POST':
         data = request.get_json()
@@ -380,30 +4063,70 @@ def handle_customers():
             name=data['name'],
             address=data.get('address'),
             phone=data.get('phone'),
-            email=data.get('email')
+            email=data.get('email'),
+            segment=data.get('segment')
         )
         db.session.add(new_customer)
         db.session.commit()
 
-        return jsonify({
-            "id": new_customer.id, "name": new_customer.name,
-            "address": new_customer.address, "phone": new_customer.phone,
-            "email": new_customer.email
-        }), 201
+        return jsonify(serialize_customer(new_customer)), 201
+
+    query = Customer.query.order_by(Customer.name)
+    if wants_stream():
+        return stream_json_array([serialize_customer(c) for c in batch] for batch in iter_query_batches(query))
+    return jsonify([serialize_customer(c) for c in query.all()])
+
+@api.route('/api/customers/search')
+def customer_search():
+    """Ranked, prefix-as-you-type customer search: ?q=...&limit=N"""
+    limit = min(max(request.args.get('limit', CUSTOMER_SEARCH_LIMIT, type=int), 1), CUSTOMER_SEARCH_MAX_LIMIT)
+    customers = search_customers(request.args.get('q', ''), limit)
+    return jsonify([serialize_customer(c) for c in customers])
+
+@api.route('/api/customers/duplicates')
+def customer_duplicates():
+    """Likely duplicate pairs, best first: ?min_score=0.85&limit=100. A full
+    scan of a large customer table is better run with ?async=1."""
+    if np is None:
+        return jsonify({"error": "Duplicate detection requires NumPy"}), 501
+    min_score = min(max(request.args.get('min_score', DEDUPE_MIN_SCORE, type=float), 0.0), 1.0)
+    limit = min(max(request.args.get('limit', DEDUPE_DEFAULT_LIMIT, type=int), 1), DEDUPE_MAX_LIMIT)
+    if wants_async():
+        return task_accepted(task_runner().submit('find-duplicates', {'min_score': min_score, 'limit': limit}))
+    return jsonify(find_duplicate_customers(min_score, limit))
 
-    customers = Customer.query.order_by(Customer.name).all()
-    return jsonify([{
-        "id": c.id, "name": c.name, "address": c.address, "phone": c.phone, "email": c.email
-    } for c in customers])
+@api.route('/api/customers/merge', methods=['POST'])
+def merge_customer_records():
+    """{"survivor_id": 1, "duplicate_ids": [2, 3]}: move the duplicates' jobs,
+    properties, contacts and plans to the survivor and delete them."""
+    data = request.get_json() or {}
+    try:
+        survivor_id = int(data['survivor_id'])
+        duplicate_ids = sorted({int(i) for i in data.get('duplicate_ids') or []})
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "survivor_id and a list of duplicate_ids are required"}), 400
+    if not duplicate_ids or survivor_id in duplicate_ids:
+        return jsonify({"error": "duplicate_ids must name customers other than the survivor"}), 400
+    try:
+        moved = merge_customers(survivor_id, duplicate_ids)
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 404
+    db.session.commit()
+    return jsonify({"customer": serialize_customer(db.session.get(Customer, survivor_id)),
+                    "merged": duplicate_ids, "moved": moved})
 
 # --- CUSTOMER DETAIL / UPDATE / DELETE ---
-@app.route('/api/customers/<int:customer_id>', methods=['GET', 'PUT', 'DELETE'])
+@api.route('/api/customers/<int:customer_id>', methods=['GET', 'PUT', 'DELETE'])
 def handle_customer(customer_id):
     customer = Customer.query.get_or_404(customer_id)
 
     if request.method == 'GET':
-        jobs_query = Job.query.filter_by(customer_id=customer.id).order_by(Job.job_date.desc()).all()
-        jobs_list = [format_job(job) for job in jobs_query]
+        jobs, next_cursor = customer_job_history(customer.id)
+        jobs_list = serialize_jobs(jobs)
+        if wants_normalized():
+            # The customer, properties and contacts are already at the top level
+            jobs_list = normalize_jobs(jobs_list)["jobs"]
 
         props = Property.query.filter_by(customer_id=customer.id).all()
         contacts = Contact.query.filter_by(customer_id=customer.id).all()
@@ -414,11 +4137,14 @@ def handle_customer(customer_id):
             "address": customer.address,
             "phone": customer.phone,
             "email": customer.email,
+            "segment": customer.segment,
             "jobs": jobs_list,
+            "jobs_next": next_cursor,  # cursor for /api/customers/<id>/jobs
             "properties": [serialize_property(p) for p in props],
             "contacts": [serialize_contact(c) for c in contacts],
+            "plans": [serialize_plan(p) for p in ServicePlan.query.filter_by(customer_id=customer.id)],
         }
-        return jsonify(customer_details)
+        return api_response(customer_details)
 
     elif request.method == 'PUT':
         data = request.get_json()
@@ -426,21 +4152,39 @@ def handle_customer(customer_id):
         customer.address = data.get('address', customer.address)
         customer.phone = data.get('phone', customer.phone)
         customer.email = data.get('email', customer.email)
+        customer.segment = data.get('segment', customer.segment)
         db.session.commit()
-        return jsonify({
-            "id": customer.id, "name": customer.name,
-            "address": customer.address, "phone": customer.phone, "email": customer.email
-        })
+        return jsonify(serialize_customer(customer))
 
     elif request.method == 'DELETE':
         if Job.query.filter_by(customer_id=customer_id).first():
             return jsonify({"error": "Cannot delete customer with active jobs."}), 400
+        if JobArchive.query.filter_by(customer_id=customer_id).first():
+            return jsonify({"error": "Cannot delete customer with archived job history."}), 400
+        if ServicePlan.query.filter_by(customer_id=customer_id, active=True).first():
+            return jsonify({"error": "Cannot delete customer with active service plans."}), 400
         db.session.delete(customer)
         db.session.commit()
         return jsonify({"message": "Customer deleted successfully"}), 200
 
+@api.route('/api/customers/<int:customer_id>/jobs')
+def customer_jobs(customer_id):
+    """The customer's job history, newest first, including archived jobs;
+    page with ?cursor= from X-Next-Cursor (or the detail's jobs_next)."""
+    customer = Customer.query.get_or_404(customer_id)
+    try:
+        limit = min(max(request.args.get('limit', CUSTOMER_JOBS_PAGE_SIZE, type=int), 1), JOBS_MAX_PAGE_SIZE)
+        jobs, next_cursor = customer_job_history(customer.id, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid cursor: {e}"}), 400
+    payload = serialize_jobs(jobs)
+    response, status = api_response(normalize_jobs(payload) if wants_normalized() else payload)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, status
+
 # --- PROPERTIES (create minimal for now) ---
-@app.route('/api/customers/<int:customer_id>/properties', methods=['POST', 'GET'])
+@api.route('/api/customers/<int:customer_id>/properties', methods=['POST', 'GET'])
 def customer_properties(customer_id):
     Customer.query.get_or_404(customer_id)
 
@@ -460,7 +4204,9 @@ def customer_properties(customer_id):
             label=data.get('label'),
             address=address,
             notes=data.get('notes'),
-            is_primary=is_primary
+            is_primary=is_primary,
+            lat=data.get('lat'),
+            lng=data.get('lng')
         )
         db.session.add(prop)
         db.session.commit()
@@ -471,7 +4217,7 @@ def customer_properties(customer_id):
     return jsonify([serialize_property(p) for p in props])
 
 # --- CONTACTS (create minimal for now) ---
-@app.route('/api/customers/<int:customer_id>/contacts', methods=['POST', 'GET'])
+@api.route('/api/customers/<int:customer_id>/contacts', methods=['POST', 'GET'])
 def customer_contacts(customer_id):
     Customer.query.get_or_404(customer_id)
 
@@ -501,68 +4247,255 @@ def customer_contacts(customer_id):
     contacts = Contact.query.filter_by(customer_id=customer_id).all()
     return jsonify([serialize_contact(c) for c in contacts])
 
-@app.route('/api/technicians')
+@api.route('/api/technicians')
 def get_technicians():
-    technicians = User.query.filter_by(role='Technician').all()
-    return jsonify([{"id": tech.id, "title": tech.email.split('@')[0].capitalize()} for tech in technicians])
+    return jsonify(cached_technicians())
+
+@api.route('/api/technicians/suggest')
+def suggest_technician():
+    """Technicians ranked for a job: locate it with ?property_id=, ?customer_id=
+    or ?lat=&lng=, on ?date= (default today), optionally at ?time=HH:MM for
+    ?duration_minutes=."""
+    try:
+        lat, lng = resolve_point(request.args)
+        day = datetime.date.fromisoformat(request.args.get('date') or datetime.date.today().isoformat())
+        job_time = datetime.time.fromisoformat(request.args['time']) if request.args.get('time') else None
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    duration = request.args.get('duration_minutes', DEFAULT_JOB_MINUTES, type=int)
+    return jsonify({"lat": lat, "lng": lng, "date": day.isoformat(),
+                    "suggestions": suggest_technicians(lat, lng, day, job_time, duration)})
+
+# --- TERRITORIES ---
+@api.route('/api/territories', methods=['GET', 'POST'])
+def handle_territories():
+    if request.method == 'POST':
+        territory = Territory(active=True)
+        try:
+            apply_territory(territory, request.get_json() or {})
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid territory: {e}"}), 400
+        db.session.add(territory)
+        db.session.commit()
+        return jsonify(serialize_territory(territory)), 201
+    query = Territory.query.order_by(Territory.id)
+    if request.args.get('technician_id'):
+        query = query.filter(Territory.technician_id == request.args.get('technician_id', type=int))
+    return jsonify([serialize_territory(t) for t in query])
+
+@api.route('/api/territories/<int:territory_id>', methods=['GET', 'PUT', 'DELETE'])
+def handle_territory(territory_id):
+    territory = Territory.query.get_or_404(territory_id)
+    if request.method == 'PUT':
+        try:
+            apply_territory(territory, request.get_json() or {})
+        except (KeyError, TypeError, ValueError) as e:
+            db.session.rollback()
+            return jsonify({"error": f"Invalid territory: {e}"}), 400
+        db.session.commit()
+    elif request.method == 'DELETE':
+        db.session.delete(territory)
+        db.session.commit()
+        return jsonify({"message": "Territory deleted successfully"}), 200
+    return jsonify(serialize_territory(territory))
+
+@api.route('/api/territories/<int:territory_id>/jobs')
+def get_territory_jobs(territory_id):
+    """Open jobs inside the territory for ?date= or ?start=&end= (default today)."""
+    territory = serialize_territory(Territory.query.get_or_404(territory_id))
+    try:
+        start, end = parse_day_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return api_response(serialize_jobs(territory_jobs(territory, start, end)))
 
-@app.route('/api/agenda/<string:date_str>')
+@api.route('/api/jobs/nearby')
+def get_nearby_jobs():
+    """Open jobs within ?radius_km= (default 5) of ?lat=&lng=, ?property_id= or
+    ?customer_id=, for ?date= or ?start=&end= (default today), nearest first.
+    ?technician_id= narrows to one technician."""
+    try:
+        lat, lng = resolve_point(request.args)
+        start, end = parse_day_range(request.args)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    radius_km = min(max(request.args.get('radius_km', NEARBY_DEFAULT_RADIUS_KM, type=float), 0.0), NEARBY_MAX_RADIUS_KM)
+    found = nearby_jobs(lat, lng, radius_km, start, end, request.args.get('technician_id', type=int))
+    payload = serialize_jobs([job for _, job in found])
+    for item, (distance, _) in zip(payload, found):
+        item["distance_km"] = round(distance, 2)
+    return api_response(payload)
+
+@api.route('/api/agenda/<string:date_str>')
+@read_replica
 def get_daily_agenda(date_str):
     try:
         target_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
         jobs_for_day = Job.query.filter_by(job_date=target_date).order_by(Job.job_time).all()
-        return jsonify([format_job(job) for job in jobs_for_day])
+        next_day = target_date + datetime.timedelta(days=1)
+        others = expand_plans(active_plans(target_date, next_day), target_date, next_day)
+        if reaches_archive(target_date):
+            others += JobArchive.query.filter_by(job_date=target_date).all()
+        if others:
+            # untimed jobs first, as SQL orders NULL job_time
+            jobs_for_day = sorted(jobs_for_day + others,
+                                  key=lambda j: (j.job_time is not None, j.job_time or datetime.time(0, 0)))
+        return jsonify(serialize_jobs(jobs_for_day))
     except Exception as e:
         return jsonify({"error": "Invalid date format or server error", "details": str(e)}), 400
 
-@app.route('/api/inventory')
+def serialize_inventory(item: Inventory):
+    return {
+        "id": item.id, "name": item.name, "category": item.category,
+        "currentStock": item.currentStock, "minStock": item.minStock,
+        "maxStock": item.maxStock, "unitCost": item.unitCost,
+        "sellingPrice": item.sellingPrice, "supplier": item.supplier,
+        "lastOrdered": item.lastOrdered.isoformat() if item.lastOrdered else None,
+        "expirationDate": item.expirationDate.isoformat() if item.expirationDate else None,
+        "status": item.stock_status
+    }
+
+@api.route('/api/routes/<int:technician_id>/<string:date_str>', methods=['GET', 'POST'])
+def technician_route(technician_id, date_str):
+    """Suggested visit order for one technician's day. POST {"apply": true}
+    also rewrites the jobs' job_time values to the planned arrivals."""
+    if np is None:
+        return jsonify({"error": "Route planning requires NumPy"}), 501
+    User.query.get_or_404(technician_id)
+    try:
+        day = datetime.date.fromisoformat(date_str)
+        plan = route_for_technician(technician_id, day, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if request.method == 'POST' and (request.get_json(silent=True) or {}).get('apply'):
+        apply_route_times(plan)
+        plan["applied"] = True
+    return jsonify(route_response(plan))
+
+@api.route('/api/routes/<string:date_str>', methods=['GET', 'POST'])
+def daily_routes(date_str):
+    """Plan every technician with jobs on the date in one call."""
+    if np is None:
+        return jsonify({"error": "Route planning requires NumPy"}), 501
+    try:
+        day = datetime.date.fromisoformat(date_str)
+        route_speed(request.args)
+        tech_ids = [t for (t,) in db.session.query(Job.technician_id).distinct()
+                    .filter(Job.job_date == day, Job.technician_id.isnot(None)).all()]
+        plans = [route_for_technician(t, day, request.args) for t in sorted(tech_ids)]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if request.method == 'POST' and (request.get_json(silent=True) or {}).get('apply'):
+        for plan in plans:
+            apply_route_times(plan)
+    return jsonify([route_response(plan) for plan in plans])
+
+@api.route('/api/schedule/open-slots')
+def open_slots():
+    """Next free slots: ?duration=60&start=YYYY-MM-DD&end=YYYY-MM-DD&count=5
+    [&technician_id=1,2&day_start=08:00&day_end=17:00&step=15]"""
+    try:
+        duration = request.args.get('duration', DEFAULT_JOB_MINUTES, type=int)
+        start_day = parse_date_param(request.args['start']) if request.args.get('start') else datetime.date.today()
+        end_day = parse_date_param(request.args['end']) if request.args.get('end') \
+            else start_day + datetime.timedelta(days=14)
+        end_day = min(end_day, start_day + datetime.timedelta(days=OPEN_SLOTS_MAX_DAYS))
+        if request.args.get('technician_id'):
+            technician_ids = [int(t) for t in request.args['technician_id'].split(',')]
+        else:
+            technician_ids = [u.id for u in User.query.filter_by(role='Technician').order_by(User.id)]
+        slots = find_open_slots(
+            duration, start_day, end_day,
+            count=request.args.get('count', 5, type=int),
+            technician_ids=technician_ids,
+            day_start=minutes_of(datetime.time.fromisoformat(request.args.get('day_start', '08:00'))),
+            day_end=minutes_of(datetime.time.fromisoformat(request.args.get('day_end', '17:00'))),
+            step=max(request.args.get('step', 15, type=int), 1),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(slots)
+
+@api.route('/api/inventory')
 def get_inventory():
+    """?status=Low Stock,Out of Stock, ?category=, ?expiring_within=<days>;
+    ?limit= pages by id, with the next page's cursor in X-Next-Cursor."""
     try:
-        items = Inventory.query.all()
-        inventory_list = []
-        for item in items:
-            status = "In Stock"
-            if item.currentStock <= item.minStock: status = "Low Stock"
-            if item.currentStock == 0: status = "Out of Stock"
-            inventory_list.append({
-                "id": item.id, "name": item.name, "category": item.category,
-                "currentStock": item.currentStock, "minStock": item.minStock,
-                "maxStock": item.maxStock, "unitCost": item.unitCost,
-                "sellingPrice": item.sellingPrice, "supplier": item.supplier,
-                "lastOrdered": item.lastOrdered.isoformat() if item.lastOrdered else None,
-                "expirationDate": item.expirationDate.isoformat() if item.expirationDate else None,
-                "status": status
-            })
-        return jsonify(inventory_list)
+        query = Inventory.query
+        if request.args.get('status'):
+            query = query.filter(Inventory.stock_status.in_(request.args['status'].split(',')))
+        if request.args.get('category'):
+            query = query.filter(Inventory.category == request.args['category'])
+        if request.args.get('expiring_within'):
+            horizon = datetime.date.today() + datetime.timedelta(days=int(request.args['expiring_within']))
+            query = query.filter(Inventory.expirationDate <= horizon)
+        if request.args.get('cursor'):
+            query = query.filter(Inventory.id > int(request.args['cursor']))
+        query = query.order_by(Inventory.id)
+        if wants_stream():
+            return stream_json_array([serialize_inventory(i) for i in batch] for batch in iter_query_batches(query))
+        limit = parse_page_limit(request.args.get('limit'), None)
+        if limit is None:
+            return jsonify([serialize_inventory(item) for item in query.all()])
+        items = query.limit(limit + 1).all()
+        response = jsonify([serialize_inventory(item) for item in items[:limit]])
+        if len(items) > limit:
+            response.headers['X-Next-Cursor'] = str(items[limit - 1].id)
+        return response
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/reports')
+@api.route('/api/inventory/<int:item_id>/movements', methods=['GET', 'POST'])
+def inventory_movements(item_id):
+    """GET: the item's ledger, newest first. POST: record a receipt or a
+    manual adjustment ({quantity, kind, note})."""
+    item = Inventory.query.get_or_404(item_id)
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        kind = data.get('kind', 'receipt')
+        try:
+            quantity = int(data['quantity'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "quantity (integer) is required"}), 400
+        if kind not in MANUAL_MOVEMENT_KINDS:
+            return jsonify({"error": f"kind must be one of {', '.join(MANUAL_MOVEMENT_KINDS)}"}), 400
+        if quantity == 0 or (kind == 'receipt' and quantity < 0):
+            return jsonify({"error": "Receipts need a positive quantity, adjustments a non-zero one"}), 400
+        apply_stock_movements(db.session.connection(), [
+            {'inventory_id': item.id, 'quantity': quantity, 'kind': kind, 'note': data.get('note')}])
+        db.session.commit()
+        return jsonify(serialize_inventory(item)), 201
+
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    movements = StockMovement.query.filter_by(inventory_id=item.id)\
+        .order_by(StockMovement.created_at.desc(), StockMovement.id.desc()).limit(limit).all()
+    return jsonify([serialize_movement(m) for m in movements])
+
+@api.route('/api/inventory/reorder-suggestions')
+def get_reorder_suggestions():
+    lead_days = request.args.get('lead_days', REORDER_LEAD_DAYS, type=int)
+    return jsonify(reorder_suggestions(lead_days))
+
+@api.route('/api/reports')
+@read_replica
 def get_reports_data():
     try:
-        completed_jobs = Job.query.filter_by(status='Completed').count()
-        scheduled_jobs = Job.query.filter_by(status='Scheduled').count()
-        job_status_distribution = [
-            {'name': 'Completed', 'value': completed_jobs},
-            {'name': 'Scheduled', 'value': scheduled_jobs}
-        ]
-        revenue_trend = [
-            {'name': 'Jan', 'revenue': 13000},
-            {'name': 'Feb', 'revenue': 15500},
-            {'name': 'Mar', 'revenue': 18000},
-            {'name': 'Apr', 'revenue': 15000},
-            {'name': 'May', 'revenue': 19000},
-            {'name': 'Jun', 'revenue': 26000}
-        ]
-        jobs_per_technician = db.session.query(User.email, db.func.count(Job.id))\
-            .join(Job, User.id == Job.technician_id).group_by(User.email).all()
+        jobs_per_technician = db.session.query(User.email, db.func.sum(JobDailyStat.job_count))\
+            .join(JobDailyStat, User.id == JobDailyStat.technician_id)\
+            .group_by(User.email).having(db.func.sum(JobDailyStat.job_count) > 0).all()
         technician_performance = [
-            {'name': email.split('@')[0].capitalize(), 'jobs': count}
+            {'name': email.split('@')[0].capitalize(), 'jobs': int(count)}
             for email, count in jobs_per_technician
         ]
         reports_payload = {
-            "jobStatusDistribution": job_status_distribution,
-            "revenueTrend": revenue_trend,
+            "jobStatusDistribution": status_distribution(),
+            "revenueTrend": revenue_trend(),
             "technicianPerformance": technician_performance
         }
         return jsonify(reports_payload)
@@ -572,12 +4505,12 @@ def get_reports_data():
 def format_campaign(c: MarketingCampaign):
     return {
         "id": c.id, "name": c.name, "type": c.type, "audience": c.audience,
-        "status": c.status, "sent": c.sent, "opened": c.opened, "clicked": c.clicked,
+        "status": c.status, "sent": c.sent, "failed": c.failed or 0, "opened": c.opened, "clicked": c.clicked,
         "revenue": c.revenue, "createdDate": c.createdDate.isoformat() if c.createdDate else None,
         "content": {"subject": c.content_subject, "content": c.content_body}
     }
 
-@app.route('/api/marketing', methods=['GET', 'POST'])
+@api.route('/api/marketing', methods=['GET', 'POST'])
 def handle_marketing_campaigns():
     if request.method == 'POST':
         data = request.get_json()
@@ -589,80 +4522,703 @@ def handle_marketing_campaigns():
         db.session.add(new_campaign)
         db.session.commit()
         return jsonify(format_campaign(new_campaign)), 201
-    campaigns = MarketingCampaign.query.order_by(MarketingCampaign.createdDate.desc()).all()
-    return jsonify([format_campaign(c) for c in campaigns])
+    engagement.flush()  # show this worker's buffered opens/clicks
+    query = MarketingCampaign.query.order_by(MarketingCampaign.createdDate.desc())
+    if wants_stream():
+        return stream_json_array([format_campaign(c) for c in batch] for batch in iter_query_batches(query))
+    return jsonify([format_campaign(c) for c in query.all()])
 
-def create_initial_data():
-    with app.app_context():
-        db.drop_all()
-        db.create_all()
+@api.route('/api/marketing/<int:campaign_id>/send', methods=['POST'])
+def send_campaign(campaign_id):
+    """Queue the campaign's audience and start sending in the background.
+    On a 'Failed' or 'Partially Sent' campaign it retries the failed
+    recipients. A 'Sending' campaign is refused while its sender is working;
+    once its claims have gone stale (the sender died) it is resumed."""
+    campaign = MarketingCampaign.query.get_or_404(campaign_id)
+    status = campaign.status
+    if status == 'Sending':
+        released = release_stale_claims(campaign.id)
+        if released is None:
+            return jsonify({"error": "Campaign is already sending"}), 409
+        queued = released + db.session.query(db.func.count(CampaignRecipient.id))\
+            .filter_by(campaign_id=campaign.id, status='queued').scalar()
+    elif status in ('Draft',) + CAMPAIGN_RETRY_STATUSES:
+        if not start_campaign_send(campaign.id, (status,)):
+            return jsonify({"error": "Campaign is already sending"}), 409
+        if status == 'Draft':
+            try:
+                queued = queue_campaign(campaign)
+            except Exception:  # leave it a Draft rather than 'Sending' with nobody queued
+                db.session.rollback()
+                MarketingCampaign.query.filter_by(id=campaign.id, status='Sending').update({'status': 'Draft'})
+                db.session.commit()
+                raise
+        else:
+            queued = requeue_failed_recipients(campaign.id)
+    else:
+        return jsonify({"error": f"Campaign is {status}"}), 409
+    db.session.refresh(campaign)
+    base_url = os.getenv('PUBLIC_BASE_URL') or request.host_url.rstrip('/')
+    if not campaign_sender().start(campaign.id, base_url):
+        return jsonify({"error": "Campaign is already sending"}), 409
+    return jsonify({"campaign": format_campaign(campaign), "queued": queued,
+                    "recipients": recipient_counts(campaign.id)}), 202
 
-        today = datetime.date.today()
+@api.route('/api/marketing/track/<string:event_type>/<string:token>')
+def track_engagement(event_type, token):
+    if event_type not in ('open', 'click'):
+        return jsonify({"error": "Unknown event"}), 404
+    try:
+        campaign_id, _recipient_id = tracking_signer().loads(token)
+    except BadSignature:
+        return jsonify({"error": "Invalid tracking link"}), 404
+    if event_type == 'open':
+        engagement.record(campaign_id, 'opened')
+        return Response(TRACKING_PIXEL, mimetype='image/gif', headers={'Cache-Control': 'no-store'})
+    engagement.record(campaign_id, 'clicked')
+    return Response(status=302, headers={'Location': CAMPAIGN_LANDING_URL})
 
-        # Users
-        admin = User(email='admin@pestpro.com', role='Admin')
-        tech1 = User(email='tech@pestpro.com', role='Technician')
-        tech2 = User(email='dave@pestpro.com', role='Technician')
-        db.session.add_all([admin, tech1, tech2])
-        db.session.commit()
+# --- EXPORTS ---
+@api.route('/api/export/<string:entity>')
+def export_entity(entity):
+    """Stream jobs, customers or inventory as ?format=csv (default) or
+    parquet. Jobs take start/end, technician_id, status and customer_id;
+    customers segment and updated_since; inventory status and category."""
+    if entity not in EXPORT_STATEMENTS:
+        return jsonify({"error": f"Unknown export: {entity}"}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({"error": "format must be csv or parquet"}), 400
+    if fmt == 'parquet' and pa is None:
+        return jsonify({"error": "Parquet export is not available on this server"}), 501
+    try:
+        statement = EXPORT_STATEMENTS[entity](request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
+    columns = EXPORT_COLUMNS[entity]
+    encode = iter_csv if fmt == 'csv' else iter_parquet
+    db.session.close()  # the export reads on its own connection
+    response = Response(stream_with_context(encode(columns, iter_export_batches(statement))),
+                        mimetype=EXPORT_MIMETYPES[fmt])
+    filename = f"{entity}-{datetime.date.today().isoformat()}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+# --- TASKS ---
+@api.route('/api/tasks')
+def list_tasks():
+    """Most recent tasks first; ?status= and ?kind= filter, ?limit= caps (max 200)."""
+    query = Task.query
+    if request.args.get('status'):
+        query = query.filter(Task.status.in_(request.args['status'].split(',')))
+    if request.args.get('kind'):
+        query = query.filter(Task.kind == request.args['kind'])
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    return jsonify([serialize_task(t) for t in query.order_by(Task.id.desc()).limit(limit)])
 
-        # Customers
-        customer1 = Customer(name='John Doe', address='123 Main St, Cleveland, OH', phone='216-555-0101', email='john.doe@example.com')
-        customer2 = Customer(name='Jane Smith', address='456 Oak Ave, Cleveland, OH', phone='216-555-0102', email='jane.smith@example.com')
-        db.session.add_all([customer1, customer2])
+@api.route('/api/tasks/<int:task_id>', methods=['GET', 'DELETE'])
+def handle_task(task_id):
+    """GET polls a task; DELETE requests cancellation. A queued task is
+    cancelled at once, a running one at its next progress report."""
+    task = Task.query.get_or_404(task_id)
+    expire_stale_task(task)
+    if request.method == 'DELETE':
+        if task.status not in TASK_ACTIVE_STATUSES:
+            return jsonify({"error": f"Task is already {task.status}"}), 409
+        task.cancel_requested = True
+        if task.status == 'queued':
+            task.status, task.finished_at = 'cancelled', datetime.datetime.utcnow()
         db.session.commit()
+        return jsonify(serialize_task(task)), 202
+    return jsonify(serialize_task(task))
 
-        # Properties
-        c1_home = Property(customer_id=customer1.id, label='Home', address='123 Main St, Cleveland, OH', is_primary=True)
-        c2_home = Property(customer_id=customer2.id, label='Home', address='456 Oak Ave, Cleveland, OH', is_primary=True)
-        db.session.add_all([c1_home, c2_home])
+@api.route('/api/reports/rebuild', methods=['POST'])
+def rebuild_reports():
+    """Recount the job rollups behind the dashboard and reports in the background."""
+    return task_accepted(task_runner().submit('rebuild-rollups'))
 
-        # Contacts
-        c1_primary = Contact(customer_id=customer1.id, name='John Doe', phone='216-555-0101', email='john.doe@example.com', is_primary=True)
-        c2_primary = Contact(customer_id=customer2.id, name='Jane Smith', phone='216-555-0102', email='jane.smith@example.com', is_primary=True)
-        db.session.add_all([c1_primary, c2_primary])
-        db.session.commit()
+@api.route('/api/calendar/regenerate', methods=['POST'])
+def regenerate_calendar_feeds():
+    """Re-render every technician's ICS feed (optional ?days=N horizon) in the background."""
+    horizon_days = request.args.get('days', ICS_DEFAULT_HORIZON_DAYS, type=int)
+    return task_accepted(task_runner().submit('regenerate-feeds', {'horizon_days': horizon_days}))
 
-        # Jobs
-        job1 = Job(customer_id=customer1.id, technician_id=tech1.id, property_id=c1_home.id,
-                   contact_id=c1_primary.id, description='Standard ant treatment',
-                   job_date=today, job_time=datetime.time(9, 30), notes="Check under the sink.")
-        job2 = Job(customer_id=customer2.id, technician_id=tech2.id, property_id=c2_home.id,
-                   contact_id=c2_primary.id, description='Rodent inspection',
-                   status='Completed', job_date=today - datetime.timedelta(days=1),
-                   job_time=datetime.time(14, 0))
-        job3 = Job(customer_id=customer1.id, technician_id=tech1.id, property_id=c1_home.id,
-                   contact_id=c1_primary.id, description='Follow-up spider treatment',
-                   job_date=today, job_time=datetime.time(11, 0))
-        db.session.add_all([job1, job2, job3])
-
-        # Inventory
-        inv1 = Inventory(name='Termiticide Concentrate', category='Termiticides', currentStock=15, minStock=10, maxStock=50, unitCost=45.00, sellingPrice=75.00, supplier='PestChem Supply', lastOrdered=today - datetime.timedelta(days=15), expirationDate=today + datetime.timedelta(days=365))
-        inv2 = Inventory(name='Bed Bug Spray', category='Insecticides', currentStock=5, minStock=8, maxStock=30, unitCost=25.00, sellingPrice=45.00, supplier='BugBuster Inc', lastOrdered=today - datetime.timedelta(days=20), expirationDate=today + datetime.timedelta(days=180))
-        db.session.add_all([inv1, inv2])
-
-        # Campaigns
-        camp1 = MarketingCampaign(name='Summer Bed Bug Prevention', type='Email', audience='Residential', status='Active', sent=247, opened=98, clicked=23, revenue=3200, createdDate=today - datetime.timedelta(days=10))
-        camp2 = MarketingCampaign(name='Commercial Quarterly Service', type='SMS', audience='Commercial', status='Completed', sent=45, opened=42, clicked=18, revenue=5400, createdDate=today - datetime.timedelta(days=15))
-        db.session.add_all([camp1, camp2])
-        db.session.commit()
+# --- CHANGES ---
+@api.route('/api/changes')
+def get_changes():
+    """Inserts/updates/deletes after ?since=<token>, oldest first, for
+    ?entities=job,customer,property,contact (default all). Without `since`
+    only the current token is returned. 410 means the token predates the
+    retained log and the client has to reload."""
+    unavailable = change_feed_unavailable()
+    if unavailable:
+        return unavailable
+    try:
+        entities = parse_change_entities(request.args.get('entities'), ','.join(CHANGE_ENTITIES))
+        since = request.args.get('since', type=int)
+        limit = min(max(request.args.get('limit', CHANGE_PAGE_SIZE, type=int), 1), 5000)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if since is None:
+        return jsonify({"changes": [], "next": head_token(), "more": False})
+    if token_expired(since):
+        return jsonify({"error": "Sync token expired; reload and start from a fresh token"}), 410
+    changes, next_token, more = read_changes(since, entities, limit)
+    return jsonify({"changes": changes, "next": next_token, "more": more})
+
+@api.route('/api/changes/stream')
+def stream_changes():
+    """Server-Sent Events: one `change` event per changed row (default
+    ?entities=job), each page's last event carrying the resume token as its
+    id. Resumes from Last-Event-ID or ?since, else starts at the head."""
+    unavailable = change_feed_unavailable()
+    if unavailable:
+        return unavailable
+    try:
+        entities = parse_change_entities(request.args.get('entities'), 'job')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    if since is None:
+        since = head_token()
+    elif token_expired(since):
+        return jsonify({"error": "Sync token expired; reload and start from a fresh token"}), 410
+    db.session.close()
+
+    def generate():
+        token = since
+        started = quiet_since = time.monotonic()
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while time.monotonic() - started < SSE_MAX_SECONDS:
+            changes, token_after, more = read_changes(token, entities)
+            db.session.close()  # end the read transaction so the next poll sees new commits
+            for n, change in enumerate(changes, 1):
+                event_id = f"id: {token_after}\n" if n == len(changes) else ""
+                yield f"{event_id}event: change\ndata: {json.dumps(change)}\n\n"
+            token = token_after
+            if changes:
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since >= SSE_HEARTBEAT_SECONDS:
+                yield ": keepalive\n\n"
+                quiet_since = time.monotonic()
+            if not more:
+                time.sleep(CHANGE_POLL_SECONDS)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a proxy buffer the stream
+    return response
+
+# --- SCHEMA MIGRATIONS ---
+# Numbered, forward-only steps run by migrate_db(). A fresh database gets
+# the full schema from create_all() and then runs every step, each a no-op
+# for objects that already exist; an existing one runs only the steps it
+# has not seen yet.
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+def create_indexes(conn, *names):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(conn, checkfirst=True)
 
-        print("Database initialized with test data.")
+def rebuild_table(conn, model):
+    """Recreate a SQLite table from its model declaration, keeping the rows,
+    for table options ALTER TABLE can't change. The copy is built under a
+    temporary name and renamed, so other tables' references stay intact."""
+    table = model.__table__
+    scratch = db.MetaData()
+    for fk in table.foreign_keys:
+        fk.column.table.to_metadata(scratch)  # so the copy's foreign keys resolve
+    staging = table.to_metadata(scratch, name=f'{table.name}_rebuild')
+    columns = ', '.join(f'"{c.name}"' for c in table.columns)
+    conn.execute(db.schema.CreateTable(staging))
+    conn.exec_driver_sql(f'INSERT INTO "{staging.name}" ({columns}) SELECT {columns} FROM "{table.name}"')
+    conn.exec_driver_sql(f'DROP TABLE "{table.name}"')
+    conn.exec_driver_sql(f'ALTER TABLE "{staging.name}" RENAME TO "{table.name}"')
+    create_indexes(conn, *(index.name for index in table.indexes))
+
+def add_column(conn, model, column_name):
+    """ALTER TABLE ... ADD COLUMN for a column declared on `model`, if missing."""
+    table = model.__table__
+    if column_name in {c['name'] for c in inspect(conn).get_columns(table.name)}:
+        return
+    column = table.c[column_name]
+    ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(conn.dialect)}'
+    if column.server_default is not None:
+        ddl += " DEFAULT " + conn.dialect.ddl_compiler(conn.dialect, None).get_column_default_string(column)
+    conn.exec_driver_sql(ddl)
+
+@migration(1, "Technician feed versions")
+def _create_feed_version(conn):
+    FeedVersion.__table__.create(conn, checkfirst=True)
+
+@migration(2, "Hot-path composite indexes")
+def _create_hot_path_indexes(conn):
+    create_indexes(conn, 'ix_job_date_time', 'ix_job_tech_status_date', 'ix_job_customer_date',
+                   'ix_customer_name_address', 'ix_property_customer_primary',
+                   'ix_contact_customer_primary')
+
+@migration(3, "Job price and daily job rollups")
+def _create_job_rollups(conn):
+    add_column(conn, Job, 'price')
+    JobDailyStat.__table__.create(conn, checkfirst=True)
+    rebuild_rollups(conn, models=(Job,))  # job_archive arrives in migration 11
+
+@migration(4, "Customer full-text search index")
+def _create_customer_search(conn):
+    create_search_index(conn)
+
+@migration(5, "Property coordinates")
+def _add_property_coordinates(conn):
+    add_column(conn, Property, 'lat')
+    add_column(conn, Property, 'lng')
+
+@migration(6, "Job duration and technician/day index")
+def _add_job_duration(conn):
+    add_column(conn, Job, 'duration_minutes')
+    create_indexes(conn, 'ix_job_tech_date_time')
+
+@migration(7, "Recurring service plans")
+def _create_service_plans(conn):
+    ServicePlan.__table__.create(conn, checkfirst=True)
+    add_column(conn, Job, 'plan_id')
+    add_column(conn, Job, 'occurrence_date')
+    create_indexes(conn, 'ix_job_plan_occurrence')
+
+@migration(8, "Inventory stock ledger and job materials")
+def _create_stock_ledger(conn):
+    add_column(conn, Inventory, 'stock_status')
+    StockMovement.__table__.create(conn, checkfirst=True)
+    JobMaterial.__table__.create(conn, checkfirst=True)
+    create_indexes(conn, 'ix_inventory_status_expiration', 'ix_inventory_expiration')
+    open_stock_ledger(conn)
+
+@migration(9, "Customer segments and campaign recipients")
+def _create_campaign_recipients(conn):
+    add_column(conn, Customer, 'segment')
+    CampaignRecipient.__table__.create(conn, checkfirst=True)
+
+@migration(10, "Row versions and change log for delta sync")
+def _create_change_log(conn):
+    for model in (Job, Customer, Property, Contact):
+        add_column(conn, model, 'updated_at')
+        add_column(conn, model, 'row_version')
+    ChangeLog.__table__.create(conn, checkfirst=True)
+
+@migration(11, "Job archive")
+def _create_job_archive(conn):
+    JobArchive.__table__.create(conn, checkfirst=True)
+
+@migration(12, "Background tasks")
+def _create_tasks(conn):
+    Task.__table__.create(conn, checkfirst=True)
+
+@migration(13, "Territories and property grid index")
+def _create_territories(conn):
+    Territory.__table__.create(conn, checkfirst=True)
+    add_column(conn, Property, 'grid_cell')
+    create_indexes(conn, 'ix_property_grid_cell')
+    table = Property.__table__
+    conn.execute(table.update().where(table.c.lat.isnot(None), table.c.lng.isnot(None))
+                 .values(grid_cell=grid_cell_expression(table)))
+
+@migration(14, "Customer dedupe keys")
+def _add_customer_dedupe_keys(conn):
+    add_column(conn, Customer, 'dedupe_key')
+    table = Customer.__table__
+    last_id = 0
+    while True:
+        rows = conn.execute(db.select(table.c.id, table.c.name, table.c.address)
+                            .where(table.c.id > last_id).order_by(table.c.id).limit(IN_BATCH_SIZE * 10)).all()
+        if not rows:
+            break
+        conn.execute(table.update().where(table.c.id == db.bindparam('row_id'))
+                     .values(dedupe_key=db.bindparam('key')),
+                     [{'row_id': cid, 'key': customer_dedupe_key(name, address)} for cid, name, address in rows])
+        last_id = rows[-1][0]
+    create_indexes(conn, 'ix_customer_dedupe_key')
+
+@migration(15, "Campaign failed-send counts")
+def _add_campaign_failed_counts(conn):
+    add_column(conn, MarketingCampaign, 'failed')
+    recipients, campaigns = CampaignRecipient.__table__, MarketingCampaign.__table__
+    failed = db.select(db.func.count()).where(recipients.c.campaign_id == campaigns.c.id,
+                                              recipients.c.status == 'failed').scalar_subquery()
+    conn.execute(campaigns.update().values(failed=failed))
+
+@migration(16, "Campaign recipient claims")
+def _add_campaign_recipient_claims(conn):
+    add_column(conn, CampaignRecipient, 'claim')
+    add_column(conn, CampaignRecipient, 'claimed_at')
+
+@migration(17, "Stock ledger job index")
+def _create_stock_movement_job_index(conn):
+    create_indexes(conn, 'ix_stock_movement_job')
+
+@migration(18, "Table row counts")
+def _create_row_counts(conn):
+    RowCount.__table__.create(conn, checkfirst=True)
+    rebuild_row_counts(conn)
+
+@migration(19, "Never reuse archived job ids")
+def _autoincrement_job_ids(conn):
+    if conn.dialect.name != 'sqlite':
+        return  # sequences never hand out an id twice
+    ddl = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'job'").scalar()
+    if 'AUTOINCREMENT' not in ddl.upper():
+        rebuild_table(conn, Job)
+    # The newest jobs may have been archived or deleted already; start above every id seen
+    seen = conn.execute(db.select(db.func.max(JobArchive.id))).scalar() or 0
+    if not conn.exec_driver_sql("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'job'", (seen,)).rowcount:
+        conn.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) VALUES ('job', ?)", (seen,))
+
+def migrate_db():
+    """Bring the schema up to date in place. Returns the versions applied.
+
+    A fresh database gets create_all() first; every migration is written to
+    be a no-op for objects that already exist, so they then only add what
+    the models can't express (FTS tables, triggers, backfills)."""
+    applied = []
+    with db.engine.begin() as conn:
+        if not inspect(conn).has_table(Job.__tablename__):
+            db.metadata.create_all(conn)
+        SchemaVersion.__table__.create(conn, checkfirst=True)
+        current = conn.execute(db.select(db.func.max(SchemaVersion.version))).scalar() or 0
+    for version, description, fn in MIGRATIONS:
+        if version <= current:
+            continue
+        with db.engine.begin() as conn:
+            fn(conn)
+            conn.execute(SchemaVersion.__table__.insert().values(
+                version=version, description=description, applied_at=datetime.datetime.utcnow()))
+        applied.append(version)
+    return applied
+
+# Queries behind the hot endpoints; check_query_plans() fails if SQLite
+# would answer any of them by scanning a table.
+def hot_queries():
+    today = datetime.date.today()
+    queries = {
+        "agenda": Job.query.filter_by(job_date=today).order_by(Job.job_time),
+        "jobs window": Job.query.filter(Job.job_date >= today, Job.job_date < today + datetime.timedelta(days=7))
+            .order_by(Job.job_date, job_sort_time, Job.id),
+        "ics feed": feed_rows_query(1, None),
+        "customer job history": Job.query.filter_by(customer_id=1)
+            .order_by(Job.job_date.desc(), job_sort_time.desc(), Job.id.desc()),
+        "archived job history": JobArchive.query.filter_by(customer_id=1).order_by(JobArchive.job_date.desc()),
+        "archived jobs window": JobArchive.query.filter(JobArchive.job_date >= today, JobArchive.job_date < today + datetime.timedelta(days=7))
+            .order_by(JobArchive.job_date, JobArchive.job_time, JobArchive.id),
+        "conflict check": db.session.query(Job.id, Job.job_time, Job.duration_minutes)
+            .filter(Job.technician_id == 1, Job.job_date == today, Job.status != 'Cancelled'),
+        "customer properties": Property.query.filter_by(customer_id=1),
+        "customer contacts": Contact.query.filter_by(customer_id=1),
+        "inventory alerts": db.session.query(Inventory.stock_status, db.func.count(Inventory.id))
+            .filter(Inventory.stock_status.in_(ALERT_STATUSES)).group_by(Inventory.stock_status),
+        "inventory expiring": Inventory.query.filter(Inventory.expirationDate <= today),
+        "stock ledger": StockMovement.query.filter_by(inventory_id=1).order_by(StockMovement.created_at.desc()),
+        "recent usage": db.session.query(StockMovement.inventory_id, db.func.sum(StockMovement.quantity))
+            .filter(StockMovement.kind.in_(USAGE_KINDS), StockMovement.created_at >= today)
+            .group_by(StockMovement.inventory_id),
+        "job materials": JobMaterial.query.filter_by(job_id=1),
+        "job usage": db.session.query(StockMovement.inventory_id, db.func.sum(StockMovement.quantity))
+            .filter(StockMovement.job_id.in_([1, 2]), StockMovement.kind.in_(USAGE_KINDS))
+            .group_by(StockMovement.job_id, StockMovement.inventory_id),
+        "change feed": ChangeLog.query.filter(ChangeLog.id > 0, ChangeLog.entity.in_(['job']))
+            .order_by(ChangeLog.id),
+        "campaign send queue": CampaignRecipient.query.filter(
+            CampaignRecipient.campaign_id == 1, CampaignRecipient.status == 'queued', CampaignRecipient.id > 0
+        ).order_by(CampaignRecipient.id),
+        "audience contacts": db.session.query(Contact.customer_id, Contact.email)
+            .filter(Contact.customer_id.in_([1, 2]), Contact.is_primary.is_(True)),
+        "bulk import dedupe": db.session.query(Customer.dedupe_key)
+            .filter(Customer.dedupe_key.in_(['a|', 'b|'])),
+        "jobs near point": db.session.query(Job.id, Property.lat, Property.lng)
+            .join(Property, Property.id == Job.property_id)
+            .filter(db.or_(*(Property.grid_cell.between(lo, hi) for lo, hi in grid_ranges(radius_box(41.5, -81.7, 5)))),
+                    Job.job_date >= today, Job.job_date < today + datetime.timedelta(days=1)),
+    }
+    if search_index_available():
+        queries["customer search"] = db.session.query(db.literal_column('rowid'))\
+            .select_from(db.table('customer_search')).filter(db.text("customer_search MATCH 'main*'"))
+    return queries
+
+def check_query_plans():
+    """Return {name: [plan lines]} for every hot query whose plan scans a table."""
+    if db.engine.dialect.name != 'sqlite':
+        return {}
+    failures = {}
+    with db.engine.connect() as conn:
+        for name, query in hot_queries().items():
+            sql = str(query.statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+            plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+            # FTS lookups report as "SCAN ... VIRTUAL TABLE INDEX", which is an index probe
+            if any(line.startswith('SCAN') and 'VIRTUAL TABLE INDEX' not in line for line in plan):
+                failures[name] = plan
+    return failures
+
+@api.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations."""
+    applied = migrate_db()
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+
+@api.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the job rollups and row counts from the tables."""
+    with db.engine.begin() as conn:
+        rebuild_rollups(conn)
+        rebuild_row_counts(conn)
+    print("Job rollups rebuilt.")
+
+@api.cli.command('archive-jobs')
+@click.option('--days', default=ARCHIVE_AFTER_DAYS, show_default=True)
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True)
+def archive_jobs_command(days, batch_size):
+    """Move closed jobs older than --days to the job archive."""
+    print(f"Archived {archive_jobs(days, batch_size)} jobs.")
+
+@api.cli.command('prune-changes')
+@click.option('--days', default=CHANGE_LOG_RETENTION_DAYS, show_default=True)
+def prune_changes_command(days):
+    """Delete change log entries older than --days."""
+    print(f"Pruned {prune_change_log(days)} change log entries.")
+
+@api.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Exit non-zero if a hot endpoint's query plan falls back to a scan."""
+    failures = check_query_plans()
+    for name, plan in failures.items():
+        print(f"{name}: " + " | ".join(plan))
+    if failures:
+        raise SystemExit(1)
+    print("All hot queries use an index.")
+
+def create_initial_data():
+    """Reset the current app's database to the demo data."""
+    with db.engine.begin() as conn:
+        drop_search_index(conn)
+    db.drop_all(bind_key=None)  # the primary only; a read replica follows it
+    migrate_db()
+    reference_cache.clear()
+
+    today = datetime.date.today()
+
+    # Users
+    admin = User(email='admin@pestpro.com', role='Admin')
+    tech1 = User(email='tech@pestpro.com', role='Technician')
+    tech2 = User(email='dave@pestpro.com', role='Technician')
+    db.session.add_all([admin, tech1, tech2])
+    db.session.commit()
+
+    # Customers
+    customer1 = Customer(name='John Doe', address='123 Main St, Cleveland, OH', phone='216-555-0101', email='john.doe@example.com')
+    customer2 = Customer(name='Jane Smith', address='456 Oak Ave, Cleveland, OH', phone='216-555-0102', email='jane.smith@example.com')
+    db.session.add_all([customer1, customer2])
+    db.session.commit()
+
+    # Properties
+    c1_home = Property(customer_id=customer1.id, label='Home', address='123 Main St, Cleveland, OH', is_primary=True)
+    c2_home = Property(customer_id=customer2.id, label='Home', address='456 Oak Ave, Cleveland, OH', is_primary=True)
+    db.session.add_all([c1_home, c2_home])
+
+    # Contacts
+    c1_primary = Contact(customer_id=customer1.id, name='John Doe', phone='216-555-0101', email='john.doe@example.com', is_primary=True)
+    c2_primary = Contact(customer_id=customer2.id, name='Jane Smith', phone='216-555-0102', email='jane.smith@example.com', is_primary=True)
+    db.session.add_all([c1_primary, c2_primary])
+    db.session.commit()
+
+    # Jobs
+    job1 = Job(customer_id=customer1.id, technician_id=tech1.id, property_id=c1_home.id,
+               contact_id=c1_primary.id, description='Standard ant treatment',
+               job_date=today, job_time=datetime.time(9, 30), notes="Check under the sink.")
+    job2 = Job(customer_id=customer2.id, technician_id=tech2.id, property_id=c2_home.id,
+               contact_id=c2_primary.id, description='Rodent inspection',
+               status='Completed', job_date=today - datetime.timedelta(days=1),
+               job_time=datetime.time(14, 0))
+    job3 = Job(customer_id=customer1.id, technician_id=tech1.id, property_id=c1_home.id,
+               contact_id=c1_primary.id, description='Follow-up spider treatment',
+               job_date=today, job_time=datetime.time(11, 0))
+    db.session.add_all([job1, job2, job3])
+
+    # Inventory
+    inv1 = Inventory(name='Termiticide Concentrate', category='Termiticides', currentStock=15, minStock=10, maxStock=50, unitCost=45.00, sellingPrice=75.00, supplier='PestChem Supply', lastOrdered=today - datetime.timedelta(days=15), expirationDate=today + datetime.timedelta(days=365))
+    inv2 = Inventory(name='Bed Bug Spray', category='Insecticides', currentStock=5, minStock=8, maxStock=30, unitCost=25.00, sellingPrice=45.00, supplier='BugBuster Inc', lastOrdered=today - datetime.timedelta(days=20), expirationDate=today + datetime.timedelta(days=180))
+    db.session.add_all([inv1, inv2])
+
+    # Campaigns
+    camp1 = MarketingCampaign(name='Summer Bed Bug Prevention', type='Email', audience='Residential', status='Active', sent=247, opened=98, clicked=23, revenue=3200, createdDate=today - datetime.timedelta(days=10))
+    camp2 = MarketingCampaign(name='Commercial Quarterly Service', type='SMS', audience='Commercial', status='Completed', sent=45, opened=42, clicked=18, revenue=5400, createdDate=today - datetime.timedelta(days=15))
+    db.session.add_all([camp1, camp2])
+    db.session.commit()
+
+    print("Database initialized with test data.")
+
+# --- SYNTHETIC DATA ---
+# Realistic-scale fixtures for load and benchmark runs (bench.py). Rows go in
+# through executemany on the core tables in chunks, so nothing is held in
+# memory beyond one chunk and the ORM flush hooks are bypassed; the search
+# index and job rollups are rebuilt once at the end instead of per row.
+DATASET_SCALES = {
+    'small':  dict(technicians=5,  customers=2_000,   jobs=20_000,    inventory=50,  campaigns=20),
+    'medium': dict(technicians=20, customers=20_000,  jobs=200_000,   inventory=100, campaigns=50),
+    'large':  dict(technicians=50, customers=200_000, jobs=2_000_000, inventory=200, campaigns=100),
+}
+GENERATOR_CHUNK_SIZE = 5000
+_STREETS = ['Main St', 'Oak Ave', 'Elm St', 'Lake Rd', 'Maple Dr', 'Cedar Ln', 'Park Blvd', 'Hill Rd', 'River Way', 'Euclid Ave']
+_CITIES = ['Cleveland', 'Lakewood', 'Parma', 'Euclid', 'Strongsville', 'Westlake', 'Mentor', 'Solon']
+_FIRST = ['John', 'Jane', 'Maria', 'David', 'Linda', 'James', 'Sarah', 'Robert', 'Karen', 'Michael', 'Lisa', 'Chen', 'Priya', 'Omar']
+_LAST = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Lopez', 'Wilson', 'Nguyen', 'Patel', 'Kim']
+_SERVICES = ['General pest treatment', 'Termite inspection', 'Rodent exclusion', 'Bed bug treatment', 'Mosquito barrier', 'Ant treatment', 'Wasp nest removal']
+
+def _next_id(conn, model):
+    return (conn.execute(db.select(db.func.max(model.id))).scalar() or 0) + 1
+
+def _insert_chunks(conn, model, rows):
+    for chunk in iter_chunks(rows, GENERATOR_CHUNK_SIZE):
+        conn.execute(model.__table__.insert(), chunk)
+
+def generate_dataset(technicians, customers, jobs, inventory=100, campaigns=50, years=3, seed=42):
+    """Append a synthetic dataset to the current database. Jobs are spread
+    over `years` years ending one year from today; past jobs are mostly
+    completed. Returns the number of rows inserted per model."""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    first_day = today - datetime.timedelta(days=365 * (years - 1))
+    span_days = 365 * years
+    counts = {}
+    with db.engine.begin() as conn:
+        drop_search_index(conn)
+
+        user_id = _next_id(conn, User)
+        tech_ids = list(range(user_id, user_id + technicians))
+        _insert_chunks(conn, User, ({'id': i, 'email': f'tech{i}@bench.pestpro.com', 'role': 'Technician'}
+                                    for i in tech_ids))
+
+        customer_id, property_id, contact_id = (_next_id(conn, m) for m in (Customer, Property, Contact))
+        customer_ids = range(customer_id, customer_id + customers)
+        sites = []  # (customer_id, property_id, contact_id) per property, for jobs
+
+        for chunk in iter_chunks(customer_ids, GENERATOR_CHUNK_SIZE):
+            customer_batch, properties, contacts = [], [], []
+            for cid in chunk:
+                name = f'{rng.choice(_FIRST)} {rng.choice(_LAST)}'
+                address = f'{rng.randint(1, 9999)} {rng.choice(_STREETS)}, {rng.choice(_CITIES)}, OH'
+                phone = f'216-555-{rng.randint(0, 9999):04d}'
+                email = f"{name.lower().replace(' ', '.')}{cid}@example.com"
+                customer_batch.append({'id': cid, 'name': name, 'address': address, 'phone': phone, 'email': email,
+                                       'segment': 'Commercial' if rng.random() < 0.15 else 'Residential',
+                                       'dedupe_key': customer_dedupe_key(name, address)})
+                contacts.append({'id': contact_id, 'customer_id': cid, 'name': name, 'phone': phone,
+                                 'email': email, 'title': None, 'is_primary': True})
+                for n in range(1 if rng.random() < 0.8 else 2):
+                    if n:
+                        address = f'{rng.randint(1, 9999)} {rng.choice(_STREETS)}, {rng.choice(_CITIES)}, OH'
+                    properties.append({'id': property_id, 'customer_id': cid, 'label': 'Rental' if n else 'Home',
+                                       'address': address, 'notes': None, 'is_primary': n == 0,
+                                       'lat': 41.50 + rng.uniform(-0.15, 0.15), 'lng': -81.69 + rng.uniform(-0.25, 0.25)})
+                    properties[-1]['grid_cell'] = grid_cell(properties[-1]['lat'], properties[-1]['lng'])
+                    sites.append((cid, property_id, contact_id))
+                    property_id += 1
+                contact_id += 1
+            conn.execute(Customer.__table__.insert(), customer_batch)
+            conn.execute(Property.__table__.insert(), properties)
+            conn.execute(Contact.__table__.insert(), contacts)
+        counts.update(technicians=technicians, customers=customers, properties=len(sites))
+
+        def job_rows():
+            for _ in range(jobs):
+                cid, pid, ctid = rng.choice(sites)
+                day = first_day + datetime.timedelta(days=rng.randrange(span_days))
+                if day < today:
+                    status = 'Completed' if rng.random() < 0.9 else 'Cancelled'
+                else:
+                    status = 'Scheduled'
+                yield {'customer_id': cid, 'technician_id': rng.choice(tech_ids) if rng.random() < 0.97 else None,
+                       'property_id': pid, 'contact_id': ctid, 'description': rng.choice(_SERVICES),
+                       'notes': None, 'status': status, 'job_date': day,
+                       'job_time': datetime.time(rng.randint(7, 17), rng.choice((0, 30))),
+                       'price': float(rng.choice((95, 125, 150, 175, 250, 400))),
+                       'duration_minutes': rng.choice((30, 60, 60, 90, 120)),
+                       'plan_id': None, 'occurrence_date': None}
+
+        _insert_chunks(conn, Job, job_rows())
+        counts['jobs'] = jobs
+
+        _insert_chunks(conn, Inventory, ({
+            'name': f'{rng.choice(_SERVICES).split()[0]} product {n}', 'category': rng.choice(['Insecticides', 'Termiticides', 'Rodenticides', 'Equipment']),
+            'currentStock': rng.randint(0, 60), 'minStock': 10, 'maxStock': 60,
+            'unitCost': round(rng.uniform(5, 80), 2), 'sellingPrice': round(rng.uniform(10, 150), 2),
+            'supplier': rng.choice(['PestChem Supply', 'BugBuster Inc', 'AgriPro']),
+            'lastOrdered': today - datetime.timedelta(days=rng.randrange(90)),
+            'expirationDate': today + datetime.timedelta(days=rng.randrange(30, 720)),
+        } for n in range(inventory)))
+        _insert_chunks(conn, MarketingCampaign, ({
+            'name': f'Campaign {n}', 'type': rng.choice(['Email', 'SMS']), 'audience': rng.choice(['Residential', 'Commercial']),
+            'status': rng.choice(['Draft', 'Active', 'Completed']), 'sent': (sent := rng.randint(0, 5000)),
+            'opened': (opened := rng.randint(0, sent)), 'clicked': rng.randint(0, opened),
+            'revenue': round(rng.uniform(0, 10000), 2), 'createdDate': today - datetime.timedelta(days=rng.randrange(365)),
+            'content_subject': None, 'content_body': None,
+        } for n in range(campaigns)))
+        counts.update(inventory=inventory, campaigns=campaigns)
+
+        open_stock_ledger(conn)
+        create_search_index(conn)
+        rebuild_rollups(conn)
+        rebuild_row_counts(conn)
+    _ics_cache.clear()
+    reference_cache.clear()
+    return counts
+
+@api.cli.command('seed-large')
+@click.option('--scale', type=click.Choice(sorted(DATASET_SCALES)), default='small')
+@click.option('--years', default=3, show_default=True)
+@click.option('--seed', default=42, show_default=True)
+def seed_large_command(scale, years, seed):
+    """Append a synthetic dataset of the given scale to the database."""
+    migrate_db()
+    started = time.perf_counter()
+    counts = generate_dataset(**DATASET_SCALES[scale], years=years, seed=seed)
+    print(f"Inserted {counts} in {time.perf_counter() - started:.1f}s.")
+
+# --- APP FACTORY ---
+def create_app(config=None):
+    """WSGI entry point, e.g. `gunicorn -c gunicorn.conf.py 'main:create_app()'`.
+    Builds an app from the environment plus `config` overrides, binds the
+    database (engine options follow the final database URL) and brings the
+    schema up to date; an empty database is seeded with the demo data."""
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    replica_url = app.config.get('READ_DATABASE_URL')
+    if replica_url:
+        app.config.setdefault('SQLALCHEMY_BINDS', {'replica': {"url": replica_url, **engine_options(replica_url)}})
+    CORS(app, origins=["http://localhost:5173"], supports_credentials=True,
+         expose_headers=["X-Query-Count", "X-Next-Cursor", "Location"])
+    db.init_app(app)
+    app.register_blueprint(api)
+    if app.config.get('AUTO_MIGRATE', True):
+        with app.app_context():
+            if not inspect(db.engine).has_table(Job.__tablename__):
+                create_initial_data()
+            else:
+                applied = migrate_db()
+                if applied:
+                    print(f"Applied schema migrations: {applied}")
+    return app
 
 # --- MAIN EXECUTION ---
 if __name__ == '__main__':
-    with app.app_context():
-        db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-        if not os.path.exists(db_path):
-            create_initial_data()
-        else:
-            try:
-                # quick sanity checks; recreate if tables/cols missing
-                Customer.query.with_entities(Customer.id).limit(1).all()
-                Property.query.with_entities(Property.id).limit(1).all()
-                Contact.query.with_entities(Contact.id).limit(1).all()
-                Job.query.with_entities(Job.id).limit(1).all()
-            except Exception:
-                print("Schema appears outdated. Recreating database.")
-                create_initial_data()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server; use gunicorn.conf.py in production.
+    app = create_app()
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG', 'true').lower() == 'true')
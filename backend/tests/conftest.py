@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    path = tmp_path_factory.mktemp('db') / 'pestpro.db'
+    return main.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'TESTING': True})
+
+
+@pytest.fixture
+def db(app):
+    """The demo data, freshly reset for each test, with an app context pushed."""
+    with app.app_context():
+        main.create_initial_data()
+        main._ics_cache.clear()
+        yield main.db
+        main.db.session.remove()
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
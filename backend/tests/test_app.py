@@ -0,0 +1,23 @@
+import main
+
+
+def test_sqlite_connections_are_tuned(db):
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == int(main.SQLITE_PRAGMAS['busy_timeout'])
+
+
+def test_only_server_databases_get_a_sized_pool():
+    assert main.engine_options('sqlite:///pestpro.db') == {'pool_pre_ping': True}
+    assert main.engine_options('postgresql://db/pestpro')['pool_size'] == 10
+
+
+def test_read_only_routes_use_the_replica(tmp_path):
+    replica = tmp_path / 'replica.db'
+    main.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{replica}'})
+    primary = main.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "primary.db"}',
+                               'READ_DATABASE_URL': f'sqlite:///{replica}'})
+    client = primary.test_client()
+    client.post('/api/customers', json={'name': 'Primary Only'})
+    assert len(client.get('/api/customers').get_json()) == 3
+    assert client.get('/api/dashboard').get_json()['stats']['totalCustomers'] == 2
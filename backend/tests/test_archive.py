@@ -0,0 +1,24 @@
+import datetime
+
+import main
+
+LAST_YEAR = (datetime.date.today() - datetime.timedelta(days=400)).isoformat()
+
+
+def test_archive_moves_closed_jobs_and_their_ids_are_not_reused(client, db, monkeypatch):
+    monkeypatch.setattr(main, 'ARCHIVE_PAUSE_SECONDS', 0)
+    response = client.post('/api/jobs', json={'customer_id': 1, 'description': 'Old inspection',
+                                              'job_date': LAST_YEAR})
+    old_id = response.get_json()['id']
+    client.put(f'/api/jobs/{old_id}', json={'status': 'Completed'})
+
+    assert main.archive_jobs() == 1
+    db.session.remove()
+    assert db.session.get(main.Job, old_id) is None
+    assert db.session.get(main.JobArchive, old_id).description == 'Old inspection'
+
+    new_id = client.post('/api/jobs', json={'customer_id': 1, 'description': 'New inspection',
+                                            'job_date': LAST_YEAR}).get_json()['id']
+    assert new_id > old_id
+    history = client.get('/api/customers/1').get_json()
+    assert old_id in [job['id'] for job in history['jobs']]
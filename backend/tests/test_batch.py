@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+
+import main
+
+TODAY = datetime.date.today()
+D = TODAY + datetime.timedelta(days=7)
+
+
+@pytest.fixture
+def tech(db):
+    return main.User.query.filter_by(email='tech@pestpro.com').one().id
+
+
+@pytest.fixture
+def plan(client, tech):
+    response = client.post('/api/plans', json={
+        'customer_id': 1, 'property_id': 1, 'technician_id': tech, 'description': 'Monthly perimeter spray',
+        'rrule': 'FREQ=DAILY', 'start_date': TODAY.isoformat(), 'job_time': '15:00', 'duration_minutes': 30})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def agenda_ids(client, day):
+    return [j['id'] for j in client.get(f'/api/agenda/{day.isoformat()}').get_json()]
+
+
+def batch(client, *operations, **options):
+    return client.post('/api/jobs/batch', json={'operations': list(operations), **options})
+
+
+def test_shift_by_ids_moves_jobs_and_rollups(client, db):
+    job_id = main.Job.query.filter_by(job_date=TODAY).order_by(main.Job.id).first().id
+    response = batch(client, {'ids': [job_id], 'shift_days': 3})
+    assert response.status_code == 200
+    assert response.get_json()['operations'] == [{'matched': 1, 'updated': 1}]
+    db.session.remove()
+    assert db.session.get(main.Job, job_id).job_date == TODAY + datetime.timedelta(days=3)
+    moved_day = main.JobDailyStat.query.filter_by(day=TODAY + datetime.timedelta(days=3)).all()
+    assert sum(r.job_count for r in moved_day) == 1
+
+
+def test_filter_moves_unmaterialized_plan_occurrences(client, plan, tech):
+    occurrence = main.occurrence_id(plan, D)
+    assert occurrence in agenda_ids(client, D)
+    response = batch(client, {'filter': {'technician_id': tech, 'job_date': D.isoformat()}, 'shift_days': 1},
+                     allow_overlap=True)
+    assert response.status_code == 200
+    assert response.get_json()['operations'] == [{'matched': 1, 'updated': 1}]
+    assert occurrence not in agenda_ids(client, D)
+    moved = main.Job.query.filter_by(plan_id=plan, occurrence_date=D).one()
+    assert moved.job_date == D + datetime.timedelta(days=1)
+
+
+def test_dry_run_leaves_occurrences_unmaterialized(client, plan, tech):
+    response = batch(client, {'filter': {'technician_id': tech, 'job_date': D.isoformat()}, 'shift_days': 1},
+                     dry_run=True, allow_overlap=True)
+    assert response.get_json()['updated'] == 1
+    assert not main.Job.query.filter_by(plan_id=plan).count()
+
+
+def test_unbounded_filter_over_plans_is_refused(client, plan, tech):
+    response = batch(client, {'filter': {'technician_id': tech}, 'set': {'status': 'Cancelled'}})
+    assert response.status_code == 400
+    assert 'service plans' in response.get_json()['error']
+
+
+def test_status_filter_that_excludes_scheduled_skips_occurrences(client, plan, tech):
+    response = batch(client, {'filter': {'technician_id': tech, 'status': 'Completed'}, 'set': {'status': 'Cancelled'}})
+    assert response.status_code == 200
+    assert not main.Job.query.filter_by(plan_id=plan).count()
+
+
+def test_reassigning_onto_a_booked_slot_is_a_conflict(client, tech):
+    other = main.User.query.filter_by(email='dave@pestpro.com').one().id
+    job = client.post('/api/jobs', json={'customer_id': 2, 'technician_id': other, 'description': 'Wasp nest',
+                                         'job_date': TODAY.isoformat(), 'job_time': '09:30'}).get_json()
+    response = batch(client, {'ids': [job['id']], 'set': {'technician_id': tech}})
+    assert response.status_code == 409
+    assert response.get_json()['conflicts'][0]['id'] == job['id']
+    main.db.session.remove()
+    assert main.db.session.get(main.Job, job['id']).technician_id == other
+
+
+@pytest.mark.parametrize('operations, message', [
+    ([], 'non-empty'),
+    ([{'ids': [1], 'filter': {'job_date': '2024-01-01'}, 'set': {'status': 'Completed'}}], 'exactly one'),
+    ([{'filter': {'status': 'Scheduled'}, 'set': {'status': 'Completed'}}], 'criterion'),
+    ([{'ids': [1], 'set': {'price': 5}}], 'cannot set price'),
+    ([{'ids': [1], 'set': {'job_date': '2024-01-01'}, 'shift_days': 1}], 'either'),
+    ([{'ids': [1], 'set': {'technician_id': 999}}], 'Unknown technician'),
+])
+def test_invalid_operations_are_rejected(client, operations, message):
+    response = batch(client, *operations)
+    assert response.status_code == 400
+    assert message in response.get_json()['error']
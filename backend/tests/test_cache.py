@@ -0,0 +1,66 @@
+import os
+import runpy
+import sqlite3
+import time
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    """The app's reference cache on a SQLite file, as a second worker would see it too."""
+    path = str(tmp_path / 'cache.db')
+    monkeypatch.setattr(main.reference_cache, 'backend', main.SqliteCache(path))
+    return main.ReferenceCache(main.SqliteCache(path))
+
+
+def test_local_cache_expires_and_evicts():
+    cache = main.LocalCache(ttl=60, max_entries=2)
+    cache.set_many({'a': 1, 'b': 2})
+    cache.get_many(['a'])
+    cache.set_many({'c': 3})
+    assert cache.get_many(['a', 'b', 'c']) == {'a': 1, 'c': 3}
+    cache.ttl = 0
+    cache.set_many({'d': 4})
+    assert cache.get_many(['d']) == {}
+
+
+def test_sqlite_cache_prunes_expired_rows_on_write(tmp_path):
+    cache = main.SqliteCache(str(tmp_path / 'cache.db'), ttl=0.01)
+    cache.set_many({f'user:{i}': {'id': i} for i in range(10)})
+    time.sleep(0.02)
+    cache.set_many({'user:99': {'id': 99}})
+    conn = sqlite3.connect(tmp_path / 'cache.db')
+    assert [k for k, in conn.execute("SELECT key FROM cache")] == ['user:99']
+
+
+def test_job_payloads_are_served_from_the_cache(client):
+    client.get('/api/jobs')
+    misses = main.reference_cache.misses['customer']
+    client.get('/api/jobs')
+    assert main.reference_cache.misses['customer'] == misses
+
+
+def test_commit_invalidates_edited_customer_for_every_worker(client, shared_cache):
+    client.get('/api/jobs')  # fill the shared cache
+    assert shared_cache.backend.get_many(['customer:1'])
+    response = client.put('/api/customers/1', json={'name': 'Johnathan Doe'})
+    assert response.status_code == 200
+    assert not shared_cache.backend.get_many(['customer:1'])
+    names = {j['customer']['name'] for j in client.get('/api/jobs').get_json() if j['customer']['id'] == 1}
+    assert names == {'Johnathan Doe'}
+
+
+def test_multi_worker_gunicorn_config_shares_the_cache(monkeypatch):
+    monkeypatch.delenv('CACHE_URL', raising=False)
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    config = runpy.run_path(os.path.join(os.path.dirname(main.__file__), 'gunicorn.conf.py'))
+    assert config['workers'] == 4
+    assert os.environ['CACHE_URL'].startswith('sqlite:///')
+
+
+def test_unknown_cache_url_is_rejected():
+    with pytest.raises(ValueError):
+        main.cache_backend('memcached://localhost')
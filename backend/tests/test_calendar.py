@@ -0,0 +1,37 @@
+import datetime
+
+TODAY = datetime.date.today().isoformat()
+
+
+def feed(client, technician_id=2, **headers):
+    return client.get(f'/api/calendar/{technician_id}/feed.ics', headers=headers)
+
+
+def test_feed_lists_the_technicians_jobs(client, db):
+    body = feed(client).get_data(as_text=True)
+    assert body.startswith('BEGIN:VCALENDAR')
+    assert 'Standard ant treatment' in body and 'Follow-up spider treatment' in body
+    assert 'Rodent inspection' not in body
+
+
+def test_unchanged_feed_answers_304(client, db):
+    etag = feed(client).headers['ETag']
+    response = feed(client, **{'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+
+def test_job_edits_invalidate_only_the_affected_feeds(client, db):
+    mine, theirs = feed(client, 2).headers['ETag'], feed(client, 3).headers['ETag']
+    job_id = next(j['id'] for j in client.get('/api/jobs').get_json() if j['description'] == 'Standard ant treatment')
+    client.put(f'/api/jobs/{job_id}', json={'description': 'Ant barrier treatment'})
+    response = feed(client, 2, **{'If-None-Match': mine})
+    assert response.status_code == 200
+    assert 'Ant barrier treatment' in response.get_data(as_text=True)
+    assert feed(client, 3, **{'If-None-Match': theirs}).status_code == 304
+
+
+def test_feed_includes_plan_occurrences(client, db):
+    client.post('/api/plans', json={'customer_id': 2, 'technician_id': 2, 'description': 'Monthly bait check',
+                                    'rrule': 'FREQ=MONTHLY;COUNT=2', 'start_date': TODAY})
+    assert feed(client).get_data(as_text=True).count('Monthly bait check') == 2
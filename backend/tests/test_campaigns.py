@@ -0,0 +1,141 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+import main
+
+
+class RecordingTransport:
+    def __init__(self, fail=lambda message: False, delay=0.0):
+        self.fail, self.delay = fail, delay
+        self.messages = []
+        self.lock = threading.Lock()
+
+    def send(self, campaign_id, message):
+        time.sleep(self.delay)
+        if self.fail(message):
+            raise OSError('relay refused')
+        with self.lock:
+            self.messages.append(message['to'])
+
+
+@pytest.fixture
+def campaign(db):
+    main.generate_dataset(technicians=1, customers=30, jobs=0, inventory=0, campaigns=0)
+    c = main.MarketingCampaign(name='Spring', type='Email', audience='All', status='Draft',
+                               createdDate=datetime.date.today(), content_subject='Hi', content_body='Body')
+    db.session.add(c)
+    db.session.commit()
+    return c
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    transport = RecordingTransport()
+    monkeypatch.setattr(main, '_campaign_sender', main.CampaignSender(transport, rate=10_000))
+    return transport
+
+
+def wait_for_sender():
+    deadline = time.monotonic() + 10
+    while main.campaign_sender().active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    main.db.session.remove()  # requests share the test's session; see the sender's writes
+
+
+def campaign_state(client, campaign_id):
+    return next(c for c in client.get('/api/marketing').get_json() if c['id'] == campaign_id)
+
+
+def test_concurrent_senders_deliver_each_recipient_once(app, campaign):
+    queued = main.queue_campaign(campaign)
+    assert main.start_campaign_send(campaign.id, ('Draft',))
+    transport = RecordingTransport(delay=0.001)
+    senders = [main.CampaignSender(transport, rate=10_000) for _ in range(2)]
+
+    def send(sender):
+        with app.app_context():
+            sender.send_queued(campaign.id, 'http://test')
+
+    threads = [threading.Thread(target=send, args=(s,)) for s in senders]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(transport.messages) == queued
+    assert len(set(transport.messages)) == queued
+    main.db.session.refresh(campaign)
+    assert (campaign.status, campaign.sent) == ('Completed', queued)
+
+
+def test_claimed_rows_are_not_handed_out_again(campaign):
+    main.queue_campaign(campaign)
+    first = main.claim_recipients(campaign.id, limit=5)
+    second = main.claim_recipients(campaign.id, limit=5)
+    assert len(first) == len(second) == 5
+    assert not {r.id for r in first} & {r.id for r in second}
+    assert main.recipient_counts(campaign.id)['sending'] == 10
+
+
+def test_send_completes_and_refuses_a_second_send(client, campaign, transport):
+    response = client.post(f'/api/marketing/{campaign.id}/send')
+    assert response.status_code == 202
+    queued = response.get_json()['queued']
+    wait_for_sender()
+    state = campaign_state(client, campaign.id)
+    assert (state['status'], state['sent'], state['failed']) == ('Completed', queued, 0)
+    assert client.post(f'/api/marketing/{campaign.id}/send').status_code == 409
+
+
+def test_failed_sends_mark_the_campaign_and_retry_only_those(client, campaign, transport):
+    transport.fail = lambda message: True
+    queued = client.post(f'/api/marketing/{campaign.id}/send').get_json()['queued']
+    wait_for_sender()
+    assert campaign_state(client, campaign.id)['status'] == 'Failed'
+
+    transport.fail = lambda message: message['to'] < 'm'
+    assert client.post(f'/api/marketing/{campaign.id}/send').get_json()['queued'] == queued
+    wait_for_sender()
+    state = campaign_state(client, campaign.id)
+    assert state['status'] == 'Partially Sent'
+    assert state['sent'] + state['failed'] == queued
+
+    transport.fail = lambda message: False
+    retried = client.post(f'/api/marketing/{campaign.id}/send').get_json()['queued']
+    assert retried == state['failed']
+    wait_for_sender()
+    state = campaign_state(client, campaign.id)
+    assert (state['status'], state['sent'], state['failed']) == ('Completed', queued, 0)
+    assert sorted(transport.messages) == sorted(set(transport.messages))
+
+
+def test_sending_campaign_is_refused_until_its_claims_go_stale(client, campaign, transport):
+    main.queue_campaign(campaign)
+    main.start_campaign_send(campaign.id, ('Draft',))
+    main.claim_recipients(campaign.id, limit=5)
+    assert client.post(f'/api/marketing/{campaign.id}/send').status_code == 409
+
+    stale = datetime.datetime.utcnow() - datetime.timedelta(seconds=main.CAMPAIGN_CLAIM_TIMEOUT_SECONDS + 1)
+    main.CampaignRecipient.query.filter_by(campaign_id=campaign.id, status='sending')\
+        .update({'claimed_at': stale})
+    main.db.session.commit()
+    response = client.post(f'/api/marketing/{campaign.id}/send')
+    assert response.status_code == 202
+    wait_for_sender()
+    assert campaign_state(client, campaign.id)['status'] == 'Completed'
+    assert len(transport.messages) == main.recipient_counts(campaign.id)['sent']
+
+
+def test_concurrent_start_lets_one_request_through(campaign):
+    assert main.start_campaign_send(campaign.id, ('Draft',))
+    assert not main.start_campaign_send(campaign.id, ('Draft',))
+
+
+def test_completed_campaign_cannot_be_sent(client, campaign, transport):
+    campaign.status = 'Completed'
+    main.db.session.commit()
+    response = client.post(f'/api/marketing/{campaign.id}/send')
+    assert response.status_code == 409
+    assert response.get_json() == {"error": "Campaign is Completed"}
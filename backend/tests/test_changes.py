@@ -0,0 +1,65 @@
+import types
+
+import main
+
+
+def head(client):
+    return client.get('/api/changes').get_json()['next']
+
+
+def test_changes_since_a_token(client):
+    token = head(client)
+    client.put('/api/customers/1', json={'name': 'Johnny Doe'})
+    created = client.post('/api/customers', json={'name': 'New Customer', 'address': '9 Pine St'}).get_json()
+    body = client.get(f'/api/changes?since={token}&entities=customer').get_json()
+    ops = {(c['id'], c['op']) for c in body['changes']}
+    assert ops == {(1, 'update'), (created['id'], 'insert')}
+    assert body['next'] > token and body['more'] is False
+    assert client.get(f"/api/changes?since={body['next']}").get_json()['changes'] == []
+
+
+def test_deleted_rows_are_reported_as_deletes(client, db):
+    job_id = main.Job.query.first().id
+    token = head(client)
+    client.post('/api/jobs/batch', json={'operations': [{'ids': [job_id], 'set': {'status': 'Cancelled'}}]})
+    main.archive_jobs(days=-30)
+    changes = client.get(f'/api/changes?since={token}&entities=job').get_json()['changes']
+    assert {'entity': 'job', 'id': job_id, 'op': 'delete', 'version': None, 'data': None} in changes
+
+
+def test_paging_with_limit(client):
+    token = head(client)
+    for n in range(3):
+        client.put('/api/customers/1', json={'phone': f'216-555-010{n}'})
+        client.put('/api/customers/2', json={'phone': f'216-555-020{n}'})
+    first = client.get(f'/api/changes?since={token}&limit=2').get_json()
+    assert first['more'] is True
+    rest = client.get(f"/api/changes?since={first['next']}").get_json()
+    assert rest['more'] is False
+
+
+def test_invalid_and_expired_tokens(client, db):
+    assert client.get('/api/changes?entities=invoice').status_code == 400
+    assert client.get('/api/changes?limit=abc').status_code == 200  # falls back to the default page size
+    client.put('/api/customers/1', json={'name': 'A'})
+    client.put('/api/customers/1', json={'name': 'B'})
+    client.put('/api/customers/1', json={'name': 'C'})
+    oldest = db.session.query(db.func.min(main.ChangeLog.id)).scalar()
+    main.ChangeLog.query.filter(main.ChangeLog.id <= oldest + 1).delete()
+    db.session.commit()
+    assert client.get(f'/api/changes?since={oldest}').status_code == 410
+
+
+def test_feed_is_refused_where_ids_may_commit_out_of_order(client, monkeypatch):
+    monkeypatch.setattr(main, 'CHANGE_FEED_DIALECTS', ('postgresql',))
+    assert client.get('/api/changes?since=0').status_code == 501
+    assert client.get('/api/changes/stream').status_code == 501
+
+
+def test_postgres_writers_serialize_on_an_advisory_lock():
+    statements = []
+    connection = types.SimpleNamespace(dialect=types.SimpleNamespace(name='postgresql'),
+                                       execute=lambda statement, *params: statements.append(str(statement)))
+    main._write_change_log(connection, [('job', 1, 'update')])
+    assert 'pg_advisory_xact_lock' in statements[0]
+    assert statements[1].startswith('INSERT INTO change_log')
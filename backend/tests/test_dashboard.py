@@ -0,0 +1,60 @@
+import datetime
+
+import main
+
+TODAY = datetime.date.today().isoformat()
+
+
+def stats(client):
+    return client.get('/api/dashboard').get_json()['stats']
+
+
+def test_customer_total_follows_creates_imports_merges_and_deletes(client, db):
+    total = main.Customer.query.count()
+    assert stats(client)['totalCustomers'] == total
+    created = client.post('/api/customers', json={'name': 'Dana Reyes', 'address': '9 Elm St'}).get_json()
+    client.post('/api/customers/bulk-upload', json={'customers': [
+        {'name': 'Lee Park', 'address': '1 Oak Ave'}, {'name': 'Lee Park', 'address': '1 Oak Ave'},
+        {'name': 'Sam Cole', 'address': '2 Oak Ave'}]})
+    assert stats(client)['totalCustomers'] == total + 3
+    survivor = client.post('/api/customers', json={'name': 'Dana Reyes Jr', 'address': '9 Elm St'}).get_json()
+    client.post('/api/customers/merge', json={'survivor_id': survivor['id'], 'duplicate_ids': [created['id']]})
+    client.delete(f"/api/customers/{survivor['id']}")
+    assert stats(client)['totalCustomers'] == total + 2 == main.Customer.query.count()
+
+
+def test_rebuilt_row_counts_match_the_table(client, db):
+    with db.engine.begin() as conn:
+        conn.execute(main.RowCount.__table__.update().values(row_count=0))
+        main.rebuild_row_counts(conn)
+    assert stats(client)['totalCustomers'] == main.Customer.query.count()
+
+
+def test_jobs_today_counts_plan_occurrences(client, db):
+    before = stats(client)['jobsToday']
+    plan = client.post('/api/plans', json={'customer_id': 1, 'description': 'Monthly spray',
+                                           'rrule': 'FREQ=MONTHLY', 'start_date': TODAY}).get_json()
+    assert stats(client)['jobsToday'] == before + 1
+    client.put(f"/api/jobs/plan-{plan['id']}-{TODAY}", json={'notes': 'Gate code 1234'})
+    assert stats(client)['jobsToday'] == before + 1
+
+
+def rollup_rows(db):
+    return sorted(db.session.query(main.JobDailyStat.day, main.JobDailyStat.technician_id, main.JobDailyStat.status,
+                                   main.JobDailyStat.job_count, main.JobDailyStat.revenue)
+                  .filter(main.JobDailyStat.job_count != 0).all())
+
+
+def test_rollups_follow_job_edits_and_match_a_rebuild(client, db):
+    job_id = client.post('/api/jobs', json={'customer_id': 1, 'technician_id': 3, 'description': 'Spray',
+                                            'job_date': TODAY, 'job_time': '15:00', 'price': 80}).get_json()['id']
+    client.put(f'/api/jobs/{job_id}', json={'status': 'Completed', 'price': 120})
+    revenue = client.get('/api/dashboard').get_json()['stats']['revenueThisMonth']
+    assert revenue >= 120
+    report = client.get('/api/reports').get_json()
+    assert {'name': 'Dave', 'jobs': 2} in report['technicianPerformance']
+    incremental = rollup_rows(db)
+    with db.engine.begin() as conn:
+        main.rebuild_rollups(conn)
+    db.session.remove()
+    assert rollup_rows(db) == incremental
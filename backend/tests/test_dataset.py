@@ -0,0 +1,29 @@
+import bench
+import main
+
+
+def test_generated_dataset_is_consistent(client, db):
+    before = main.Customer.query.count()
+    counts = main.generate_dataset(technicians=2, customers=30, jobs=200, inventory=3, campaigns=2, years=1)
+    assert counts['jobs'] == 200 and counts['customers'] == 30
+    assert main.Job.query.count() == 203
+    rolled_up = db.session.query(db.func.sum(main.JobDailyStat.job_count)).scalar()
+    assert rolled_up == 203
+    assert client.get('/api/dashboard').get_json()['stats']['totalCustomers'] == before + 30
+    assert main.check_query_plans() == {}
+
+
+def test_generator_is_deterministic_per_seed(db):
+    main.generate_dataset(technicians=1, customers=5, jobs=10, inventory=1, campaigns=1, seed=7)
+    first = [(c.name, c.address) for c in main.Customer.query.order_by(main.Customer.id).all()[-5:]]
+    main.create_initial_data()
+    main.generate_dataset(technicians=1, customers=5, jobs=10, inventory=1, campaigns=1, seed=7)
+    assert [(c.name, c.address) for c in main.Customer.query.order_by(main.Customer.id).all()[-5:]] == first
+
+
+def test_bench_flags_query_latency_and_memory_regressions():
+    baseline = {'jobs': {'queries': 4, 'p95_ms': 10.0, 'peak_kb': 100}}
+    assert bench.regressions({'jobs': {'queries': 4, 'p95_ms': 19.0, 'peak_kb': 300}}, baseline) == []
+    problems = bench.regressions({'jobs': {'queries': 5, 'p95_ms': 30.0, 'peak_kb': 900},
+                                  'new route': {'queries': 50, 'p95_ms': 1.0, 'peak_kb': 1}}, baseline)
+    assert [p.split(':')[0] for p in problems] == ['jobs', 'jobs', 'jobs']
@@ -0,0 +1,55 @@
+import pytest
+
+import main
+
+pytest.importorskip('numpy')
+
+
+def add_customer(client, **fields):
+    response = client.post('/api/customers', json=fields)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['id']
+
+
+def test_duplicates_are_found_across_spelling_and_format_differences(client, db):
+    doe = add_customer(client, name='Doe, John', address='123 Main Street, Cleveland, OH', phone='(216) 555-0101')
+    add_customer(client, name='Priya Patel', address='88 Lake Rd, Euclid, OH')
+    pairs = client.get('/api/customers/duplicates').get_json()
+    assert len(pairs) == 1
+    assert sorted(c['id'] for c in pairs[0]['customers']) == [1, doe]
+    assert pairs[0]['score'] >= main.DEDUPE_MIN_SCORE and pairs[0]['reasons']
+
+
+def test_merge_moves_everything_to_the_survivor(client, db):
+    dup = add_customer(client, name='Johnny Doe', email='jd@example.com')
+    client.post(f'/api/customers/{dup}/properties', json={'address': '9 Side St', 'is_primary': True})
+    job_id = client.post('/api/jobs', json={'customer_id': dup, 'technician_id': 2, 'description': 'Spray',
+                                            'job_date': '2030-01-02', 'job_time': '15:00'}).get_json()['id']
+    etag = client.get('/api/calendar/2/feed.ics').headers['ETag']
+
+    response = client.post('/api/customers/merge', json={'survivor_id': 1, 'duplicate_ids': [dup]})
+    assert response.status_code == 200
+    assert response.get_json()['moved'] == {'job': 1, 'job_archive': 0, 'property': 1, 'contact': 0, 'service_plan': 0}
+    db.session.remove()
+    assert db.session.get(main.Customer, dup) is None
+    assert db.session.get(main.Job, job_id).customer_id == 1
+    survivor = db.session.get(main.Customer, 1)
+    assert survivor.email == 'john.doe@example.com'
+    primaries = main.Property.query.filter_by(customer_id=1, is_primary=True).count()
+    assert primaries == 1
+    assert client.get('/api/calendar/2/feed.ics', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_merge_fills_blank_survivor_fields(client, db):
+    survivor = add_customer(client, name='Blank Co')
+    dup = add_customer(client, name='Blank Co.', phone='216-555-0100', address='4 Oak Ave')
+    client.post('/api/customers/merge', json={'survivor_id': survivor, 'duplicate_ids': [dup]})
+    merged = client.get(f'/api/customers/{survivor}').get_json()
+    assert (merged['phone'], merged['address']) == ('216-555-0100', '4 Oak Ave')
+
+
+def test_bad_merges_are_rejected(client, db):
+    assert client.post('/api/customers/merge', json={'survivor_id': 1}).status_code == 400
+    assert client.post('/api/customers/merge', json={'survivor_id': 1, 'duplicate_ids': [1]}).status_code == 400
+    assert client.post('/api/customers/merge', json={'survivor_id': 1, 'duplicate_ids': [999]}).status_code == 404
+    assert db.session.get(main.Customer, 1) is not None
@@ -0,0 +1,60 @@
+import csv
+import datetime
+import io
+
+import main
+
+
+def export_rows(client, entity, **params):
+    response = client.get(f'/api/export/{entity}', query_string=params)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.headers['Content-Disposition'].startswith(f'attachment; filename="{entity}-')
+    return list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_job_export_is_flat_and_filterable(client, db):
+    rows = export_rows(client, 'jobs')
+    assert [name for name, _ in main.EXPORT_COLUMNS['jobs']] == list(rows[0])
+    assert len(rows) == 3
+    ant = next(r for r in rows if r['description'] == 'Standard ant treatment')
+    assert (ant['customer_name'], ant['technician_email'], ant['property_address']) == \
+        ('John Doe', 'tech@pestpro.com', '123 Main St, Cleveland, OH')
+    assert {r['description'] for r in export_rows(client, 'jobs', status='Completed')} == {'Rodent inspection'}
+
+
+def test_job_export_reaches_archived_jobs(client, db, monkeypatch):
+    monkeypatch.setattr(main, 'ARCHIVE_PAUSE_SECONDS', 0)
+    old = (datetime.date.today() - datetime.timedelta(days=400)).isoformat()
+    job_id = client.post('/api/jobs', json={'customer_id': 1, 'description': 'Old spray', 'job_date': old}).get_json()['id']
+    client.put(f'/api/jobs/{job_id}', json={'status': 'Completed'})
+    main.archive_jobs()
+    rows = export_rows(client, 'jobs')
+    assert [(r['id'], r['archived']) for r in rows if r['description'] == 'Old spray'] == [(str(job_id), 'True')]
+    assert [r['description'] for r in export_rows(client, 'jobs')][0] == 'Old spray'
+
+
+def test_customer_and_inventory_exports(client, db):
+    assert [r['name'] for r in export_rows(client, 'customers')] == ['John Doe', 'Jane Smith']
+    assert [r['name'] for r in export_rows(client, 'inventory', status='Low Stock')] == ['Bed Bug Spray']
+
+
+def test_export_reads_in_batches(db):
+    db.session.add_all([main.Customer(name=f'Export {n}') for n in range(25)])
+    db.session.commit()
+    batches = list(main.iter_export_batches(main.export_customers_statement({}), size=10))
+    assert [len(batch) for batch in batches] == [10, 10, 7]
+
+
+def test_bad_export_requests(client, db):
+    assert client.get('/api/export/users').status_code == 404
+    assert client.get('/api/export/jobs?format=xlsx').status_code == 400
+    assert client.get('/api/export/jobs?technician_id=dave').status_code == 400
+
+
+def test_parquet_export(client, db):
+    response = client.get('/api/export/jobs?format=parquet')
+    if main.pa is None:
+        assert response.status_code == 501
+        return
+    table = main.pq.read_table(io.BytesIO(response.get_data()))
+    assert table.num_rows == 3 and table.schema.names == [name for name, _ in main.EXPORT_COLUMNS['jobs']]
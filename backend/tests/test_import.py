@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import main
+
+
+def upload(client, body, content_type):
+    response = client.post('/api/customers/bulk-upload', data=body, content_type=content_type)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_csv_import_skips_duplicates_within_and_across_uploads(client, db):
+    body = ('name,address,phone,email\n'
+            'Acme Pest Co.,12 Oak Avenue,216-555-0199,ops@acme.test\n'
+            'ACME PEST,12 Oak Ave,,\n'
+            'John Doe,"123 Main Street, Cleveland, OH",,\n'
+            'Rita Moreno,7 Lake Rd,,\n')
+    result = upload(client, body, 'text/csv')
+    assert (result['processed'], result['added'], result['skipped']) == (4, 2, 2)
+    assert upload(client, body, 'text/csv')['added'] == 0
+    assert main.Customer.query.filter_by(dedupe_key='acme pest|12 oak ave').count() == 1
+
+
+def test_ndjson_import_reports_bad_rows_and_keeps_the_rest(client, db):
+    lines = [json.dumps({'name': 'Ola Berg', 'address': '3 Pine St'}), '{not json', json.dumps({'address': 'nameless'})]
+    result = upload(client, '\n'.join(lines) + '\n', 'application/x-ndjson')
+    assert (result['added'], result['errorCount']) == (1, 2)
+    assert [e['error'] for e in result['errors']][1] == 'Missing name'
+
+
+def test_import_commits_chunk_by_chunk(client, db, monkeypatch):
+    monkeypatch.setattr(main, 'IMPORT_CHUNK_SIZE', 2)
+    result = upload(client, json.dumps({'customers': [{'name': f'Chunk {n}'} for n in range(5)]}), 'application/json')
+    assert [c['added'] for c in result['chunks']] == [2, 2, 1]
+
+
+def test_malformed_json_upload_is_a_400(client, db):
+    response = client.post('/api/customers/bulk-upload', data='{"customers": [', content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('name,address,key', [
+    ('ACME Pest Co.', '12 Oak Avenue', 'acme pest|12 oak ave'),
+    ('  Jane   Smith ', None, 'jane smith|'),
+])
+def test_dedupe_key_normalizes_names_and_addresses(name, address, key):
+    assert main.customer_dedupe_key(name, address) == key
@@ -0,0 +1,87 @@
+import datetime
+
+import pytest
+
+import main
+
+TODAY = datetime.date.today().isoformat()
+
+
+def stock(client, item_id):
+    return next(i for i in client.get('/api/inventory').get_json() if i['id'] == item_id)['currentStock']
+
+
+def usage(db, job_id):
+    return db.session.query(db.func.coalesce(db.func.sum(main.StockMovement.quantity), 0))\
+        .filter(main.StockMovement.job_id == job_id).scalar()
+
+
+def create_job(client, **fields):
+    body = {'customer_id': 1, 'description': 'Termite treatment', 'job_date': TODAY, 'job_time': '16:00', **fields}
+    response = client.post('/api/jobs', json=body)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['id']
+
+
+def test_completing_a_job_posts_usage_and_reopening_reverses_it(client, db):
+    job_id = create_job(client, materials=[{'inventory_id': 1, 'quantity': 3}])
+    assert stock(client, 1) == 15
+    client.put(f'/api/jobs/{job_id}', json={'status': 'Completed'})
+    assert stock(client, 1) == 12
+    client.put(f'/api/jobs/{job_id}', json={'status': 'Scheduled'})
+    assert stock(client, 1) == 15
+    assert usage(db, job_id) == 0
+
+
+def test_occurrence_completed_with_materials_posts_them(client, db):
+    plan = client.post('/api/plans', json={'customer_id': 1, 'description': 'Quarterly spray',
+                                           'rrule': 'FREQ=MONTHLY', 'start_date': TODAY}).get_json()
+    response = client.put(f"/api/jobs/plan-{plan['id']}-{TODAY}",
+                          json={'status': 'Completed', 'materials': [{'inventory_id': 1, 'quantity': 4}]})
+    assert response.status_code == 200
+    assert stock(client, 1) == 11
+    assert usage(db, response.get_json()['id']) == -4
+
+
+def test_material_changes_on_a_completed_job_are_posted(client, db):
+    job_id = create_job(client)
+    client.put(f'/api/jobs/{job_id}', json={'status': 'Completed'})
+    client.put(f'/api/jobs/{job_id}', json={'materials': [{'inventory_id': 1, 'quantity': 2},
+                                                          {'inventory_id': 2, 'quantity': 1}]})
+    assert (stock(client, 1), stock(client, 2)) == (13, 4)
+    client.put(f'/api/jobs/{job_id}', json={'materials': [{'inventory_id': 1, 'quantity': 5}]})
+    assert (stock(client, 1), stock(client, 2)) == (10, 5)
+    client.put(f'/api/jobs/{job_id}', json={'materials': []})
+    assert (stock(client, 1), stock(client, 2)) == (15, 5)
+
+
+def test_batch_completion_posts_usage(client, db):
+    job_id = create_job(client, materials=[{'inventory_id': 2, 'quantity': 5}])
+    client.post('/api/jobs/batch', json={'operations': [{'ids': [job_id], 'set': {'status': 'Completed'}}]})
+    assert stock(client, 2) == 0
+    assert next(i for i in client.get('/api/inventory').get_json() if i['id'] == 2)['status'] == 'Out of Stock'
+
+
+def test_inventory_paging(client):
+    first = client.get('/api/inventory?limit=1')
+    assert len(first.get_json()) == 1
+    rest = client.get(f"/api/inventory?limit=1&cursor={first.headers['X-Next-Cursor']}").get_json()
+    assert [i['id'] for i in rest] == [2]
+
+
+@pytest.mark.parametrize('limit', ['0', '-1', 'abc'])
+def test_bad_inventory_limit_is_a_400(client, limit):
+    response = client.get(f'/api/inventory?limit={limit}')
+    assert response.status_code == 400
+    assert 'limit' in response.get_json()['error']
+
+
+def test_movements_limit_has_a_floor(client):
+    client.post('/api/inventory/1/movements', json={'quantity': 5, 'kind': 'receipt'})
+    assert len(client.get('/api/inventory/1/movements?limit=-5').get_json()) == 1
+
+
+@pytest.mark.parametrize('body', [{'quantity': 0}, {'quantity': -1, 'kind': 'receipt'},
+                                  {'quantity': 2, 'kind': 'usage'}, {'kind': 'receipt'}])
+def test_invalid_movements_are_rejected(client, body):
+    assert client.post('/api/inventory/1/movements', json=body).status_code == 400
@@ -0,0 +1,85 @@
+import datetime
+
+import main
+
+TODAY = datetime.date.today()
+
+
+def add_jobs(db, count, day=TODAY):
+    customers = [main.Customer(name=f'Customer {n}', address=f'{n} Elm St') for n in range(count)]
+    db.session.add_all(customers)
+    db.session.flush()
+    props = [main.Property(customer_id=c.id, label='Home', address=c.address, is_primary=True) for c in customers]
+    contacts = [main.Contact(customer_id=c.id, name=c.name, is_primary=True) for c in customers]
+    db.session.add_all(props + contacts)
+    db.session.flush()
+    db.session.add_all([
+        main.Job(customer_id=c.id, property_id=p.id, contact_id=ct.id, technician_id=2 + n % 2,
+                 description='Spray', job_date=day, job_time=datetime.time(8 + n % 10, 0))
+        for n, (c, p, ct) in enumerate(zip(customers, props, contacts))])
+    db.session.commit()
+
+
+def query_count(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return int(response.headers['X-Query-Count'])
+
+
+def test_job_list_query_count_does_not_grow_with_jobs(client, db):
+    client.get('/api/jobs')
+    few = query_count(client, '/api/jobs')
+    add_jobs(db, 40)
+    client.get('/api/jobs')
+    assert query_count(client, '/api/jobs') == few
+
+
+def test_serialized_job_carries_its_related_rows(client, db):
+    job = next(j for j in client.get('/api/jobs').get_json() if j['description'] == 'Standard ant treatment')
+    assert job['customer']['name'] == 'John Doe'
+    assert job['property']['address'] == '123 Main St, Cleveland, OH'
+    assert job['contact']['name'] == 'John Doe'
+    assert job['technician_name'] == 'Tech'
+    assert job['start'].endswith('09:30:00') and job['end'].endswith('10:30:00')
+
+
+def window(client, **params):
+    response = client.get('/api/jobs', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json(), response.headers.get('X-Next-Cursor')
+
+
+def test_job_window_pages_in_order_with_a_cursor(client, db):
+    day = TODAY + datetime.timedelta(days=60)
+    add_jobs(db, 25, day)
+    end = day + datetime.timedelta(days=1)
+    seen, cursor = [], None
+    while True:
+        params = {'start': day.isoformat(), 'end': end.isoformat(), 'limit': 10}
+        page, cursor = window(client, **params, **({'cursor': cursor} if cursor else {}))
+        seen += page
+        if not cursor:
+            break
+    assert len(seen) == 25 == len({j['id'] for j in seen})
+    assert [(j['job_date'], j['job_time'], j['id']) for j in seen] == \
+        sorted((j['job_date'], j['job_time'], j['id']) for j in seen)
+
+
+def test_job_window_filters_by_technician_and_status(client, db):
+    jobs, _ = window(client, start=TODAY.isoformat(), end=(TODAY + datetime.timedelta(days=1)).isoformat(),
+                     technician_id='2', status='Scheduled')
+    assert {j['description'] for j in jobs} == {'Standard ant treatment', 'Follow-up spider treatment'}
+
+
+def test_job_window_includes_plan_occurrences(client, db):
+    start = TODAY + datetime.timedelta(days=90)
+    client.post('/api/plans', json={'customer_id': 2, 'description': 'Weekly bait check',
+                                    'rrule': 'FREQ=WEEKLY', 'start_date': start.isoformat()})
+    jobs, _ = window(client, start=start.isoformat(), end=(start + datetime.timedelta(days=21)).isoformat())
+    assert [j['virtual'] for j in jobs] == [True, True, True]
+
+
+def test_job_window_rejects_bad_parameters(client, db):
+    for params in ({'start': 'soon'}, {'start': TODAY.isoformat(), 'limit': '0'},
+                   {'start': TODAY.isoformat(), 'limit': 'many'}, {'cursor': 'bogus'}):
+        assert client.get('/api/jobs', query_string=params).status_code == 400
@@ -0,0 +1,37 @@
+import main
+
+
+def test_responses_carry_their_query_count(client, db):
+    response = client.get('/api/inventory')
+    assert int(response.headers['X-Query-Count']) >= 1
+
+
+def test_metrics_report_latency_and_statements_per_route(client, db):
+    client.get('/api/inventory').close()  # requests are recorded once the body is done
+    body = client.get('/api/metrics').get_data(as_text=True)
+    labels = 'method="GET",route="/api/inventory"'
+    assert f'pestpro_http_request_duration_seconds_count{{{labels},status="200"}}' in body
+    assert f'pestpro_db_statements_per_request_count{{{labels}}}' in body
+    assert 'pestpro_db_slow_queries_total' in body
+
+
+def test_slow_statements_are_counted_and_logged(client, db, monkeypatch, caplog):
+    monkeypatch.setattr(main, 'SLOW_QUERY_MS', 0)
+    before = main.metrics.slow_queries
+    client.get('/api/inventory')
+    assert main.metrics.slow_queries > before
+    assert any('Slow query' in r.message and '/api/inventory' in r.message for r in caplog.records)
+
+
+def test_histogram_buckets_are_cumulative():
+    hist = main.Histogram((1, 5))
+    for value in (0.5, 3, 3, 9):
+        hist.observe(value)
+    lines = list(hist.render('m', 'r="x"'))
+    assert lines[:3] == ['m_bucket{r="x",le="1"} 1', 'm_bucket{r="x",le="5"} 3', 'm_bucket{r="x",le="+Inf"} 4']
+    assert lines[-1] == 'm_count{r="x"} 4'
+
+
+def test_metrics_endpoint_is_off_when_disabled(client, db, monkeypatch):
+    monkeypatch.setattr(main, 'METRICS_ENABLED', False)
+    assert client.get('/api/metrics').status_code == 404
@@ -0,0 +1,77 @@
+"""Schema upgrade tests, run against throwaway copies of a database."""
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import main
+
+SHIPPED_DB = os.path.join(os.path.dirname(main.__file__), 'instance', 'pestpro.db')
+
+
+def upgrade(db_path):
+    app = main.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'AUTO_MIGRATE': False})
+    with app.app_context():
+        applied = main.migrate_db()
+        db = main.db
+        report = {
+            "applied": applied,
+            "plans": main.check_query_plans(),
+            "jobs": db.session.query(db.func.count(main.Job.id)).scalar(),
+            "rollup_jobs": int(db.session.query(db.func.sum(main.JobDailyStat.job_count)).scalar() or 0),
+        }
+        db.session.remove()
+        db.engine.dispose()
+    return report
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """A copy of the shipped database, which predates every migration."""
+    if not os.path.exists(SHIPPED_DB):
+        pytest.skip('no shipped database')
+    path = tmp_path / 'baseline.db'
+    shutil.copyfile(SHIPPED_DB, path)
+    with sqlite3.connect(path) as conn:
+        assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'schema_version'").fetchone()
+    return path
+
+
+def test_baseline_database_upgrades_through_every_migration(baseline_db):
+    report = upgrade(baseline_db)
+    assert report["applied"] == [version for version, _, _ in main.MIGRATIONS]
+    assert report["plans"] == {}
+    assert report["rollup_jobs"] == report["jobs"]
+
+
+def test_upgraded_database_is_left_alone(baseline_db):
+    upgrade(baseline_db)
+    assert upgrade(baseline_db)["applied"] == []
+
+
+def test_create_app_binds_the_configured_database(tmp_path, app):
+    other = main.create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "other.db"}'})
+    with other.app_context():
+        assert main.db.engine.url.database == str(tmp_path / 'other.db')
+        main.db.session.add(main.User(email='only-here@pestpro.com', role='Admin'))
+        main.db.session.commit()
+        main.db.session.remove()
+    with app.app_context():
+        assert main.db.engine.url.database != str(tmp_path / 'other.db')
+        assert not main.User.query.filter_by(email='only-here@pestpro.com').first()
+        main.db.session.remove()
+
+
+def test_upgrade_keeps_jobs_and_stops_reusing_archived_ids(baseline_db):
+    with sqlite3.connect(baseline_db) as conn:
+        jobs = conn.execute("SELECT * FROM job ORDER BY id").fetchall()
+    upgrade(baseline_db)
+    with sqlite3.connect(baseline_db) as conn:
+        assert 'AUTOINCREMENT' in conn.execute("SELECT sql FROM sqlite_master WHERE name = 'job'").fetchone()[0]
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(job)")]
+        assert conn.execute(f"SELECT {', '.join(columns[:len(jobs[0])])} FROM job ORDER BY id").fetchall() == jobs
+        newest = jobs[-1][0]
+        conn.execute("DELETE FROM job WHERE id = ?", (newest,))
+        conn.execute("INSERT INTO job (customer_id, job_date, duration_minutes) VALUES (1, '2024-01-01', 60)")
+        assert conn.execute("SELECT max(id) FROM job").fetchone()[0] == newest + 1
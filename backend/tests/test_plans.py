@@ -0,0 +1,62 @@
+import datetime
+
+import main
+
+START = datetime.date.today() + datetime.timedelta(days=10)
+
+
+def create_plan(client, **fields):
+    body = {'customer_id': 1, 'technician_id': 2, 'description': 'Quarterly spray', 'rrule': 'FREQ=WEEKLY;COUNT=4',
+            'start_date': START.isoformat(), 'job_time': '10:00', **fields}
+    response = client.post('/api/plans', json=body)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+
+def occurrences(client, days=35):
+    end = START + datetime.timedelta(days=days)
+    jobs = client.get('/api/jobs', query_string={'start': START.isoformat(), 'end': end.isoformat()}).get_json()
+    return [j for j in jobs if j.get('plan_id')]
+
+
+def test_plan_expands_lazily_without_job_rows(client, db):
+    plan = create_plan(client)
+    assert plan['end_date'] == (START + datetime.timedelta(weeks=3)).isoformat()
+    assert [j['job_date'] for j in occurrences(client)] == \
+        [(START + datetime.timedelta(weeks=n)).isoformat() for n in range(4)]
+    assert main.Job.query.filter_by(plan_id=plan['id']).count() == 0
+
+
+def test_editing_an_occurrence_materializes_only_that_one(client, db):
+    plan = create_plan(client)
+    second = (START + datetime.timedelta(weeks=1)).isoformat()
+    response = client.put(f"/api/jobs/plan-{plan['id']}-{second}", json={'job_time': '14:00'})
+    assert response.status_code == 200
+    assert main.Job.query.filter_by(plan_id=plan['id']).count() == 1
+    listed = occurrences(client)
+    assert len(listed) == 4
+    assert [(j['job_date'], j['job_time'], j.get('virtual', False)) for j in listed][1] == (second, '14:00', False)
+
+
+def test_skipping_an_occurrence_cancels_it(client, db):
+    plan = create_plan(client)
+    response = client.delete(f"/api/jobs/plan-{plan['id']}-{START.isoformat()}")
+    assert response.get_json()['status'] == 'Cancelled'
+
+
+def test_plan_edits_move_future_occurrences_and_delete_ends_the_plan(client, db):
+    plan = create_plan(client)
+    client.put(f"/api/plans/{plan['id']}", json={'job_time': '07:30'})
+    assert {j['job_time'] for j in occurrences(client)} == {'07:30'}
+    client.delete(f"/api/plans/{plan['id']}")
+    assert occurrences(client) == []
+
+
+def test_bad_plans_and_occurrences_are_rejected(client, db):
+    assert client.post('/api/plans', json={'customer_id': 1, 'description': 'x', 'rrule': 'FREQ=SOMETIMES',
+                                           'start_date': START.isoformat()}).status_code == 400
+    assert client.post('/api/plans', json={'customer_id': 1, 'rrule': 'FREQ=DAILY'}).status_code == 400
+    plan = create_plan(client)
+    off_day = (START + datetime.timedelta(days=1)).isoformat()
+    assert client.put(f"/api/jobs/plan-{plan['id']}-{off_day}", json={}).status_code == 404
+    assert client.put(f"/api/jobs/plan-{plan['id']}-tomorrow", json={}).status_code == 400
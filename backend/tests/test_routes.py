@@ -0,0 +1,41 @@
+import datetime
+
+import pytest
+
+import main
+
+pytest.importorskip('numpy')
+
+DAY = (datetime.date.today() + datetime.timedelta(days=30)).isoformat()
+
+
+@pytest.fixture
+def technician_day(client, db):
+    """Two located stops ~1.1 km apart for a technician on an otherwise empty day."""
+    tech_id = main.User.query.first().id
+    for lat, time in ((-33.86, '10:00'), (-33.87, '09:00')):
+        prop = client.post('/api/customers/1/properties',
+                           json={'address': f'{lat} Test St', 'lat': lat, 'lng': 151.2}).get_json()
+        response = client.post('/api/jobs', json={'customer_id': 1, 'property_id': prop['id'],
+                                                  'technician_id': tech_id, 'description': 'Inspection',
+                                                  'job_date': DAY, 'job_time': time})
+        assert response.status_code == 201, response.get_json()
+    return tech_id
+
+
+def test_route_orders_stops_and_times_arrivals(client, technician_day):
+    plan = client.get(f'/api/routes/{technician_day}/{DAY}?speed_kmh=60&service_minutes=30').get_json()
+    assert [stop['arrival'] for stop in plan['stops']] == ['08:00', '08:31']
+    assert plan['total_km'] == pytest.approx(1.11, abs=0.01)
+    assert plan['unlocated'] == []
+
+
+@pytest.mark.parametrize('speed', ['0', '-40', 'nan'])
+def test_route_rejects_non_positive_speeds(client, technician_day, speed):
+    assert client.get(f'/api/routes/{technician_day}/{DAY}?speed_kmh={speed}').status_code == 400
+    assert client.get(f'/api/routes/{DAY}?speed_kmh={speed}').status_code == 400
+
+
+def test_daily_routes_rejects_bad_speed_without_jobs(client, db):
+    assert client.get('/api/routes/2001-01-01?speed_kmh=0').status_code == 400
+    assert client.get('/api/routes/2001-01-01').get_json() == []
@@ -0,0 +1,51 @@
+import datetime
+
+import main
+
+DAY = (datetime.date.today() + datetime.timedelta(days=45)).isoformat()
+
+
+def book(client, time, technician_id=2, duration=60, **fields):
+    return client.post('/api/jobs', json={'customer_id': 1, 'technician_id': technician_id, 'description': 'Spray',
+                                          'job_date': DAY, 'job_time': time, 'duration_minutes': duration, **fields})
+
+
+def test_day_intervals_find_overlaps_and_gaps():
+    day = main.DayIntervals([(540, 600, 1), (560, 700, 2), (800, 830, 3)])
+    assert day.conflicts(590, 610) == [1, 2]
+    assert day.conflicts(700, 800) == []
+    assert day.conflicts(560, 620, exclude_id=2) == [1]
+    assert list(day.gaps(480, 900)) == [(480, 540), (700, 800), (830, 900)]
+
+
+def test_overlapping_booking_is_refused_unless_allowed(client, db):
+    first = book(client, '09:00').get_json()['id']
+    response = book(client, '09:30')
+    assert response.status_code == 409
+    assert [c['id'] for c in response.get_json()['conflicts']] == [first]
+    second = book(client, '10:00').get_json()['id']
+    assert book(client, '09:30', technician_id=3).status_code == 201
+    allowed = book(client, '09:30', allow_overlap=True)
+    assert allowed.status_code == 201 and allowed.get_json()['conflicts'] == [first, second]
+
+
+def test_plan_occurrences_count_as_bookings(client, db):
+    plan = client.post('/api/plans', json={'customer_id': 2, 'technician_id': 2, 'description': 'Bait check',
+                                           'rrule': 'FREQ=WEEKLY;COUNT=1', 'start_date': DAY,
+                                           'job_time': '13:00', 'duration_minutes': 30}).get_json()
+    response = book(client, '12:45')
+    assert response.status_code == 409
+    assert response.get_json()['conflicts'][0]['id'] == f"plan-{plan['id']}-{DAY}"
+
+
+def test_open_slots_skip_booked_time(client, db):
+    book(client, '08:30', duration=90)
+    next_day = (datetime.date.fromisoformat(DAY) + datetime.timedelta(days=1)).isoformat()
+    slots = client.get('/api/schedule/open-slots', query_string={
+        'start': DAY, 'technician_id': '2', 'duration': 60, 'count': 2, 'step': 30}).get_json()
+    assert [(s['date'], s['start'], s['end']) for s in slots] == [(DAY, '10:00', '11:00'), (next_day, '08:00', '09:00')]
+
+
+def test_open_slots_reject_bad_parameters(client, db):
+    for params in ({'start': 'someday'}, {'technician_id': 'two'}, {'day_start': '8am'}):
+        assert client.get('/api/schedule/open-slots', query_string=params).status_code == 400
@@ -0,0 +1,45 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def many_smiths(db):
+    main.generate_dataset(technicians=1, customers=1000, jobs=0, inventory=0, campaigns=0)
+    return main.Customer.query.filter(main.Customer.name.like('% Smith')).count()
+
+
+def search(client, q, **params):
+    response = client.get('/api/customers/search', query_string={'q': q, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_prefix_matches_name_words(client):
+    assert [c['name'] for c in search(client, 'jan')] == ['Jane Smith']
+    assert [c['name'] for c in search(client, 'Do')] == ['John Doe']
+
+
+def test_matches_phone_and_email(client):
+    assert [c['id'] for c in search(client, '2165550102')] == [2]
+    assert [c['id'] for c in search(client, 'john.doe')] == [1]
+
+
+def test_blank_query_returns_nothing(client):
+    assert search(client, '   ') == []
+
+
+def test_limit_is_capped(client, many_smiths):
+    assert many_smiths > main.CUSTOMER_SEARCH_MAX_LIMIT
+    assert len(search(client, 'smith', limit=1000)) == main.CUSTOMER_SEARCH_MAX_LIMIT
+    assert len(search(client, 'smith', limit=3)) == 3
+
+
+@pytest.mark.parametrize('limit', [0, -5])
+def test_non_positive_limit_does_not_lift_the_cap(client, many_smiths, limit):
+    assert len(search(client, 'smith', limit=limit)) == 1
+
+
+def test_without_the_fts_index_falls_back_to_like(client, db, monkeypatch):
+    monkeypatch.setattr(main, 'search_index_available', lambda: False)
+    assert [c['name'] for c in search(client, 'Jane')] == ['Jane Smith']
@@ -0,0 +1,30 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize('url', ['/api/jobs', '/api/customers', '/api/inventory', '/api/marketing'])
+def test_streamed_list_matches_the_buffered_one(client, db, url):
+    buffered = client.get(url)
+    streamed = client.get(url, query_string={'stream': '1'})
+    assert streamed.is_streamed
+    assert streamed.get_data() == buffered.get_data()
+
+
+def test_stream_spans_several_batches(client, db):
+    db.session.add_all([main.Customer(name=f'Batch {n:04d}') for n in range(main.STREAM_BATCH_SIZE * 2 + 1)])
+    db.session.commit()
+    streamed = client.get('/api/customers?stream=1')
+    assert streamed.get_data() == client.get('/api/customers').get_data()
+    assert len(streamed.get_json()) == main.STREAM_BATCH_SIZE * 2 + 3
+
+
+def test_streamed_empty_list_is_valid_json(client, db):
+    db.session.query(main.MarketingCampaign).delete()
+    db.session.commit()
+    assert client.get('/api/marketing?stream=1').get_json() == []
+
+
+def test_pretty_printed_stream_matches_jsonify(app, client, db, monkeypatch):
+    monkeypatch.setattr(app.json, 'compact', False)
+    assert client.get('/api/customers?stream=1').get_data() == client.get('/api/customers').get_data()
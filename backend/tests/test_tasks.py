@@ -0,0 +1,85 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+import main
+
+
+def wait_for(client, task_id, statuses=('succeeded', 'failed', 'cancelled')):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        main.db.session.remove()
+        task = client.get(f'/api/tasks/{task_id}').get_json()
+        if task['status'] in statuses:
+            return task
+        time.sleep(0.02)
+    raise AssertionError(f"task {task_id} stuck in {task['status']}")
+
+
+def make_task(db, status, age_seconds):
+    stamp = datetime.datetime.utcnow() - datetime.timedelta(seconds=age_seconds)
+    task = main.Task(kind='rebuild-rollups', status=status, params='{}', created_at=stamp, updated_at=stamp)
+    db.session.add(task)
+    db.session.commit()
+    return task.id
+
+
+def test_rollup_rebuild_runs_in_the_background(client):
+    response = client.post('/api/reports/rebuild')
+    assert response.status_code == 202
+    assert response.headers['Location'] == f"/api/tasks/{response.get_json()['task']['id']}"
+    task = wait_for(client, response.get_json()['task']['id'])
+    assert task['status'] == 'succeeded'
+    assert task['result']['rollup_rows'] > 0
+
+
+def test_async_customer_import_reports_progress(client):
+    body = 'name,address\n' + ''.join(f'Async {i},{i} Elm St\n' for i in range(50))
+    response = client.post('/api/customers/bulk-upload?async=1', data=body, content_type='text/csv')
+    assert response.status_code == 202
+    task = wait_for(client, response.get_json()['task']['id'])
+    assert task['status'] == 'succeeded'
+    assert task['progress'] == 50
+
+
+def test_queued_task_never_expires(client, db):
+    task_id = make_task(db, 'queued', main.TASK_STALE_SECONDS + 60)
+    assert client.get(f'/api/tasks/{task_id}').get_json()['status'] == 'queued'
+
+
+def test_silent_running_task_is_reported_failed(client, db):
+    task_id = make_task(db, 'running', main.TASK_STALE_SECONDS + 60)
+    task = client.get(f'/api/tasks/{task_id}').get_json()
+    assert task['status'] == 'failed'
+    assert 'Interrupted' in task['error']
+
+
+def test_heartbeat_keeps_a_silent_handler_alive(client, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setitem(main.TASK_HANDLERS, 'test-silent', lambda ctx: release.wait(5) and {"ok": True})
+    monkeypatch.setattr(main, 'TASK_HEARTBEAT_SECONDS', 0.05)
+    with client.application.test_request_context():
+        task_id = main.task_runner().submit('test-silent').id
+    first = wait_for(client, task_id, ('running',))
+    time.sleep(0.3)
+    main.db.session.remove()
+    task = main.db.session.get(main.Task, task_id)
+    assert task.updated_at > datetime.datetime.fromisoformat(first['started_at'])
+    release.set()
+    assert wait_for(client, task_id)['status'] == 'succeeded'
+
+
+def test_cancelling_a_queued_task(client, db):
+    task_id = make_task(db, 'queued', 0)
+    response = client.delete(f'/api/tasks/{task_id}')
+    assert response.status_code == 202
+    assert response.get_json()['status'] == 'cancelled'
+    assert client.delete(f'/api/tasks/{task_id}').status_code == 409
+
+
+@pytest.mark.parametrize('query', ['status=succeeded', 'kind=rebuild-rollups', 'limit=0'])
+def test_task_list_filters(client, db, query):
+    make_task(db, 'succeeded', 0)
+    assert client.get(f'/api/tasks?{query}').status_code == 200
@@ -0,0 +1,69 @@
+import datetime
+
+import pytest
+
+import main
+
+DAY = (datetime.date.today() + datetime.timedelta(days=20)).isoformat()
+DOWNTOWN, SUBURB = (41.50, -81.69), (41.60, -81.40)  # ~26 km apart
+
+
+@pytest.fixture
+def sites(client, db):
+    """A job downtown for technician 2 and one in the suburbs for technician 3."""
+    ids = {}
+    for name, (lat, lng), tech_id, time in (('downtown', DOWNTOWN, 2, '09:00'), ('suburb', SUBURB, 3, '11:00')):
+        prop = client.post('/api/customers/1/properties',
+                           json={'address': f'1 {name} Rd', 'lat': lat, 'lng': lng}).get_json()
+        job = client.post('/api/jobs', json={'customer_id': 1, 'property_id': prop['id'], 'technician_id': tech_id,
+                                             'description': f'{name} spray', 'job_date': DAY, 'job_time': time})
+        ids[name] = job.get_json()['id']
+    return ids
+
+
+def test_radius_and_polygon_territories_select_their_jobs(client, sites):
+    circle = client.post('/api/territories', json={'name': 'Downtown', 'center_lat': 41.5, 'center_lng': -81.69,
+                                                   'radius_km': 3}).get_json()
+    square = client.post('/api/territories', json={'name': 'East', 'polygon': [[41.55, -81.5], [41.65, -81.5],
+                                                                               [41.65, -81.3], [41.55, -81.3]]}).get_json()
+    assert [j['id'] for j in client.get(f"/api/territories/{circle['id']}/jobs?date={DAY}").get_json()] == [sites['downtown']]
+    assert [j['id'] for j in client.get(f"/api/territories/{square['id']}/jobs?date={DAY}").get_json()] == [sites['suburb']]
+
+
+def test_nearby_jobs_are_nearest_first_within_the_radius(client, sites):
+    found = client.get('/api/jobs/nearby', query_string={'lat': 41.51, 'lng': -81.69, 'date': DAY,
+                                                         'radius_km': 50}).get_json()
+    assert [j['id'] for j in found] == [sites['downtown'], sites['suburb']]
+    assert found[0]['distance_km'] == pytest.approx(1.11, abs=0.01)
+    close = client.get('/api/jobs/nearby', query_string={'lat': 41.51, 'lng': -81.69, 'date': DAY}).get_json()
+    assert [j['id'] for j in close] == [sites['downtown']]
+
+
+def test_grid_cell_follows_coordinate_edits(client, db):
+    prop = client.post('/api/customers/1/properties', json={'address': 'Moving', 'lat': 41.5, 'lng': -81.69}).get_json()
+    row = db.session.get(main.Property, prop['id'])
+    assert row.grid_cell == main.grid_cell(41.5, -81.69)
+    row.lat, row.lng = 41.6, -81.4
+    db.session.commit()
+    assert row.grid_cell == main.grid_cell(41.6, -81.4) != main.grid_cell(41.5, -81.69)
+
+
+def test_suggestions_prefer_free_technicians_who_cover_the_area(client, sites):
+    client.post('/api/territories', json={'name': 'Downtown', 'technician_id': 3, 'center_lat': 41.5,
+                                          'center_lng': -81.69, 'radius_km': 5})
+    ranked = client.get('/api/technicians/suggest', query_string={'lat': 41.5, 'lng': -81.69, 'date': DAY}).get_json()
+    assert ranked['suggestions'][0]['technician_id'] == 3
+    busy = client.get('/api/technicians/suggest', query_string={'lat': 41.5, 'lng': -81.69, 'date': DAY,
+                                                                'time': '11:30'}).get_json()['suggestions']
+    assert [(s['technician_id'], s['available']) for s in busy][-1] == (3, False)
+
+
+@pytest.mark.parametrize('body', [
+    {'center_lat': 41.5, 'center_lng': -81.69, 'radius_km': 3},
+    {'name': 'No shape'},
+    {'name': 'Line', 'polygon': [[41.5, -81.6], [41.6, -81.6]]},
+    {'name': 'Nowhere', 'center_lat': 141.5, 'center_lng': -81.69, 'radius_km': 3},
+    {'name': 'Ghost', 'technician_id': 999, 'center_lat': 41.5, 'center_lng': -81.69, 'radius_km': 3},
+])
+def test_invalid_territories_are_rejected(client, db, body):
+    assert client.post('/api/territories', json=body).status_code == 400
@@ -0,0 +1,60 @@
+import gzip
+import json
+
+import pytest
+
+import main
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+@pytest.fixture
+def many_customers(db):
+    db.session.add_all([main.Customer(name=f'Wire {n:03d}', address=f'{n} Elm St') for n in range(50)])
+    db.session.commit()
+
+
+def test_large_bodies_are_gzipped(client, many_customers):
+    plain = client.get('/api/customers')
+    response = client.get('/api/customers', headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+
+
+def test_streamed_bodies_are_compressed_chunk_by_chunk(client, many_customers):
+    response = client.get('/api/customers?stream=1', headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip' and 'Content-Length' not in response.headers
+    assert json.loads(gzip.decompress(response.get_data())) == client.get('/api/customers').get_json()
+
+
+def test_small_bodies_and_unwilling_clients_get_plain_json(client, db):
+    assert 'Content-Encoding' not in client.get('/api/users', headers=GZIP).headers
+    assert 'Content-Encoding' not in client.get('/api/customers').headers
+
+
+def test_compressed_feed_keeps_a_weak_etag_that_revalidates(client, db, monkeypatch):
+    monkeypatch.setattr(main, 'COMPRESS_MIN_BYTES', 0)
+    response = client.get('/api/calendar/2/feed.ics', headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].startswith('W/')
+    revalidated = client.get('/api/calendar/2/feed.ics', headers={**GZIP, 'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_normalized_jobs_hoist_related_rows(client, db):
+    jobs = client.get('/api/jobs').get_json()
+    shaped = client.get('/api/jobs?shape=normalized&start=2000-01-01').get_json()
+    assert len(shaped['jobs']) == len(jobs)
+    job = shaped['jobs'][0]
+    assert 'customer' not in job and str(job['customer_id']) in shaped['customers']
+    assert shaped['properties'][str(job['property_id'])]['address']
+
+
+def test_msgpack_is_negotiated_when_available(client, db):
+    if main.msgpack is None:
+        assert client.get('/api/jobs?format=msgpack').status_code == 406
+        return
+    response = client.get('/api/jobs', headers={'Accept': 'application/msgpack'})
+    assert response.mimetype == 'application/msgpack'
+    assert main.msgpack.unpackb(response.get_data()) == client.get('/api/jobs').get_json()
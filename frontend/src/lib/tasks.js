@@ -0,0 +1,15 @@
+import axios from 'axios';
+import { API_URL } from './api';
+
+const TERMINAL = ['succeeded', 'failed', 'cancelled'];
+
+// Poll a background task (the Location of a 202 response) until it finishes.
+// onProgress receives the task on every poll so callers can show progress.
+export const waitForTask = async (location, onProgress, intervalMs = 1000) => {
+  for (;;) {
+    const { data: task } = await axios.get(`${API_URL}${location}`);
+    if (onProgress) onProgress(task);
+    if (TERMINAL.includes(task.status)) return task;
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+};
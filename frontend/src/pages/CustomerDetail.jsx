@@ -41,6 +41,8 @@ export default function CustomerDetail() {
 
   const [customer, setCustomer] = useState(null);
   const [jobs, setJobs] = useState([]);
+  const [jobsNext, setJobsNext] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [properties, setProperties] = useState([]);
   const [contacts, setContacts] = useState([]);
   const [technicians, setTechnicians] = useState([]);
@@ -108,6 +110,7 @@ export default function CustomerDetail() {
         address: c.address,
       });
       setJobs(c.jobs || []);
+      setJobsNext(c.jobs_next || null);
       setProperties(c.properties || []);
       setContacts(c.contacts || []);
       setTechnicians(techRes.data || []);
@@ -145,6 +148,25 @@ export default function CustomerDetail() {
     }
   };
 
+  // The detail carries the newest page of jobs; older ones (including
+  // archived history) are fetched a page at a time.
+  const loadOlderJobs = async () => {
+    if (!jobsNext) return;
+    setLoadingOlder(true);
+    try {
+      const res = await axios.get(`${API_URL}/api/customers/${customerId}/jobs`, {
+        params: { cursor: jobsNext },
+      });
+      setJobs((prev) => [...prev, ...res.data]);
+      setJobsNext(res.headers["x-next-cursor"] || null);
+    } catch (e) {
+      setError("Could not load older jobs.");
+      console.error(e);
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   useEffect(() => {
     loadDetail();
     // eslint-disable-next-line react-hooks/exhaustive-deps
@@ -586,6 +608,13 @@ export default function CustomerDetail() {
               </tbody>
             </table>
           </div>
+          {jobsNext && (
+            <div className="mt-4 text-center">
+              <button className="btn-secondary" onClick={loadOlderJobs} disabled={loadingOlder}>
+                {loadingOlder ? "Loading…" : "Load older jobs"}
+              </button>
+            </div>
+          )}
         </div>
       </div>
 
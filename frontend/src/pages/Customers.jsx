@@ -5,6 +5,7 @@ import { Plus, Search, Edit, Trash2, Mail, MapPin, UploadCloud } from 'lucide-re
 import { Link, useNavigate } from 'react-router-dom';
 
 import { API_URL } from '../lib/api';
+import { waitForTask } from '../lib/tasks';
 
 
 const Customers = ( ) => {
@@ -21,6 +22,7 @@ const Customers = ( ) => {
   const [isUploadModalOpen, setIsUploadModalOpen] = useState(false);
   const [uploadFile, setUploadFile] = useState(null);
   const [uploading, setUploading] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState('');
   const [uploadResult, setUploadResult] = useState(null);
 
   const navigate = useNavigate();
@@ -178,14 +180,22 @@ const Customers = ( ) => {
             return;
         }
         try {
-          const response = await axios.post(`${API_URL}/api/customers/bulk-upload`, { customers: processedCustomers });
-          console.log("DEBUG: Bulk upload API response:", response.data);
-          if (response.data && response.data.errors && response.data.errors.length > 0) {
+          // Large files import in the background; poll the task for the summary.
+          const response = await axios.post(`${API_URL}/api/customers/bulk-upload`, { customers: processedCustomers },
+                                            { headers: { Prefer: 'respond-async' } });
+          const task = await waitForTask(response.headers.location,
+                                         t => setUploadProgress(t.message ? `${t.progress} processed, ${t.message}` : ''));
+          if (task.status !== 'succeeded') {
+            throw new Error(task.error || `Import ${task.status}`);
+          }
+          const result = task.result;
+          console.log("DEBUG: Bulk upload task result:", result);
+          if (result && result.errors && result.errors.length > 0) {
             setError('Some records failed to upload. See details below.');
           } else {
             setError('');
           }
-          setUploadResult(response.data);
+          setUploadResult(result);
           await fetchCustomers('Bulk Upload');
         } catch (err) {
           console.error("FATAL DEBUG: Error during bulk upload:", err);
@@ -193,6 +203,7 @@ const Customers = ( ) => {
           setUploadResult({ message: "An error occurred during upload.", errors: [{ error: err.message }] });
         } finally {
           setUploading(false);
+          setUploadProgress('');
         }
       }
     });
@@ -414,7 +425,7 @@ const Customers = ( ) => {
                 Close
               </button>
               <button type="button" className="btn-primary" onClick={handleUpload} disabled={!uploadFile || uploading}>
-                {uploading ? 'Uploading...' : 'Upload and Process'}
+                {uploading ? (uploadProgress || 'Uploading...') : 'Upload and Process'}
               </button>
             </div>
           </div>
@@ -54,7 +54,7 @@ const Dashboard = () => {
         <StatCard title="Total Customers" value={data.stats.totalCustomers} icon={<Users className="text-blue-500" />} subtext="+18 new this month" />
         <StatCard title="Jobs Today" value={data.stats.jobsToday} icon={<Calendar className="text-green-500" />} subtext="34 this week" />
         <StatCard title="Revenue This Month" value={`$${data.stats.revenueThisMonth.toLocaleString()}`} icon={<DollarSign className="text-yellow-500" />} subtext="15% increase from last month" />
-        <StatCard title="Inventory Alerts" value={data.stats.inventoryAlerts} icon={<Archive className="text-red-500" />} subtext="2 low stock, 1 reorder" />
+        <StatCard title="Inventory Alerts" value={data.stats.inventoryAlerts} icon={<Archive className="text-red-500" />} subtext={`${data.stats.lowStock} low stock, ${data.stats.outOfStock} out of stock`} />
       </div>
 
       {/* Charts */}
@@ -7,6 +7,7 @@ import { API_URL } from '../lib/api';
 
 const Inventory = ( ) => {
   const [products, setProducts] = useState([]);
+  const [suggestions, setSuggestions] = useState([]);
   const [searchTerm, setSearchTerm] = useState('');
   const [categoryFilter, setCategoryFilter] = useState('all');
   const [error, setError] = useState(''); // <-- Good practice to have an error state
@@ -15,8 +16,12 @@ const Inventory = ( ) => {
   useEffect(() => {
     const fetchInventory = async () => {
       try {
-        const response = await axios.get(`${API_URL}/api/inventory`);
+        const [response, reorder] = await Promise.all([
+          axios.get(`${API_URL}/api/inventory`),
+          axios.get(`${API_URL}/api/inventory/reorder-suggestions`),
+        ]);
         setProducts(response.data);
+        setSuggestions(reorder.data);
       } catch (err) {
         console.error("Failed to fetch inventory", err);
         setError('Could not load inventory data. Please ensure the backend server is running.');
@@ -52,8 +57,8 @@ const Inventory = ( ) => {
     return matchesSearch && matchesCategory;
   });
 
-  const lowStockItems = products.filter(p => p.currentStock <= p.minStock);
-  const reorderItems = products.filter(p => p.status === 'Reorder');
+  const lowStockItems = products.filter(p => p.status === 'Low Stock' || p.status === 'Out of Stock');
+  const reorderQuantities = Object.fromEntries(suggestions.map(s => [s.item.id, s.suggestedQuantity]));
   const totalValue = products.reduce((sum, p) => sum + (p.currentStock * p.unitCost), 0);
 
   return (
@@ -88,7 +93,7 @@ const Inventory = ( ) => {
         </div>
         <div className="card">
           <div className="text-center">
-            <p className="text-2xl font-semibold text-red-600">{reorderItems.length}</p>
+            <p className="text-2xl font-semibold text-red-600">{suggestions.length}</p>
             <p className="text-sm text-gray-500">Need Reorder</p>
           </div>
         </div>
@@ -215,9 +220,9 @@ const Inventory = ( ) => {
                   </td>
                   <td className="px-6 py-4 whitespace-nowrap text-sm font-medium">
                     <div className="flex space-x-2">
-                      {product.status === 'Reorder' && (
+                      {reorderQuantities[product.id] && (
                         <button className="bg-blue-600 text-white text-xs px-2 py-1 rounded hover:bg-blue-700">
-                          Reorder
+                          Reorder {reorderQuantities[product.id]}
                         </button>
                       )}
                       <button className="btn-secondary text-xs px-2 py-1">
@@ -65,12 +65,25 @@ const Marketing = ( ) => {
     }
   };
 
+  // --- HANDLE SENDING A CAMPAIGN (delivery runs in the background) ---
+  const handleSendCampaign = async (campaignId) => {
+    try {
+      const response = await axios.post(`${API_URL}/api/marketing/${campaignId}/send`);
+      setCampaigns(campaigns.map(c => (c.id === campaignId ? response.data.campaign : c)));
+    } catch (err) {
+      console.error("Failed to send campaign", err);
+      setError(err.response?.data?.error || "Could not send campaign. Please try again.");
+    }
+  };
+
   const getStatusColor = (status) => {
     switch (status) {
       case 'Active': return 'bg-green-100 text-green-800';
       case 'Completed': return 'bg-blue-100 text-blue-800';
       case 'Scheduled': return 'bg-yellow-100 text-yellow-800';
       case 'Draft': return 'bg-gray-100 text-gray-800';
+      case 'Partially Sent': return 'bg-orange-100 text-orange-800';
+      case 'Failed': return 'bg-red-100 text-red-800';
       default: return 'bg-gray-100 text-gray-800';
     }
   };
@@ -143,10 +156,10 @@ const Marketing = ( ) => {
                   <tr key={campaign.id} className="hover:bg-gray-50">
                     <td className="px-6 py-4 whitespace-nowrap"><div><div className="text-sm font-medium text-gray-900">{campaign.name}</div><div className="text-sm text-gray-500">Created: {campaign.createdDate}</div></div></td>
                     <td className="px-6 py-4 whitespace-nowrap"><div><div className="text-sm text-gray-900">{campaign.type}</div><div className="text-sm text-gray-500">{campaign.audience}</div></div></td>
-                    <td className="px-6 py-4 whitespace-nowrap"><div><div className="text-sm text-gray-900">Sent: {campaign.sent} | Opened: {campaign.opened}</div><div className="text-sm text-gray-500">Clicked: {campaign.clicked} | Rate: {campaign.sent > 0 ? Math.round((campaign.opened / campaign.sent) * 100) : 0}%</div></div></td>
+                    <td className="px-6 py-4 whitespace-nowrap"><div><div className="text-sm text-gray-900">Sent: {campaign.sent} | Opened: {campaign.opened}{campaign.failed > 0 && (<span className="text-red-600"> | Failed: {campaign.failed}</span>)}</div><div className="text-sm text-gray-500">Clicked: {campaign.clicked} | Rate: {campaign.sent > 0 ? Math.round((campaign.opened / campaign.sent) * 100) : 0}%</div></div></td>
                     <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">${campaign.revenue.toLocaleString()}</td>
                     <td className="px-6 py-4 whitespace-nowrap"><span className={`inline-flex px-2 py-1 text-xs font-semibold rounded-full ${getStatusColor(campaign.status)}`}>{campaign.status}</span></td>
-                    <td className="px-6 py-4 whitespace-nowrap text-sm font-medium"><div className="flex space-x-2"><button className="text-primary-600 hover:text-primary-900">Edit</button><button className="text-blue-600 hover:text-blue-900">View</button>{campaign.status === 'Draft' && (<button className="text-green-600 hover:text-green-900">Send</button>)}</div></td>
+                    <td className="px-6 py-4 whitespace-nowrap text-sm font-medium"><div className="flex space-x-2"><button className="text-primary-600 hover:text-primary-900">Edit</button><button className="text-blue-600 hover:text-blue-900">View</button>{campaign.status === 'Draft' && (<button className="text-green-600 hover:text-green-900" onClick={() => handleSendCampaign(campaign.id)}>Send</button>)}{(campaign.status === 'Failed' || campaign.status === 'Partially Sent') && (<button className="text-orange-600 hover:text-orange-900" onClick={() => handleSendCampaign(campaign.id)}>Retry</button>)}</div></td>
                   </tr>
                 ))}
               </tbody>
@@ -51,6 +51,7 @@ export default function NewJob() {
 
   // Data
   const [customers, setCustomers] = useState([]);
+  const [customerQuery, setCustomerQuery] = useState('');
   const [techs, setTechs] = useState([]);
 
   // Selected/loaded customer (for big contact card)
@@ -86,22 +87,56 @@ export default function NewJob() {
 
   const update = (k, v) => setForm((p) => ({ ...p, [k]: v }));
 
-  // Load technicians + customers; then hydrate customer if preselected
+  // Load technicians
   useEffect(() => {
     (async () => {
       try {
-        const [t, c] = await Promise.all([
-          axios.get(`${API_URL}/api/technicians`),
-          axios.get(`${API_URL}/api/customers`),
-        ]);
+        const t = await axios.get(`${API_URL}/api/technicians`);
         setTechs(t.data || []);
-        setCustomers(c.data || []);
       } catch (e) {
         console.error(e);
       }
     })();
   }, []);
 
+  // Suggest a technician from territories and that day's nearby jobs
+  const [suggestion, setSuggestion] = useState(null);
+  useEffect(() => {
+    if (!customerId || !form.job_date) {
+      setSuggestion(null);
+      return;
+    }
+    const params = { customer_id: customerId, date: form.job_date };
+    if (form.job_time) params.time = form.job_time;
+    axios.get(`${API_URL}/api/technicians/suggest`, { params })
+      .then((res) => setSuggestion(res.data.suggestions.find((s) => s.available !== false) || null))
+      .catch(() => setSuggestion(null)); // customer has no located property
+  }, [customerId, form.job_date, form.job_time]);
+
+  // Search customers as the user types instead of loading the whole list
+  useEffect(() => {
+    const q = customerQuery.trim();
+    if (!q) {
+      setCustomers([]);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const res = await axios.get(`${API_URL}/api/customers/search`, { params: { q, limit: 20 } });
+        setCustomers(res.data || []);
+      } catch (e) {
+        console.error(e);
+      }
+    }, 200);
+    return () => clearTimeout(timer);
+  }, [customerQuery]);
+
+  // Keep the selected customer in the picker even when it isn't in the results
+  const customerOptions = useMemo(() => {
+    if (customer && !customers.some((c) => c.id === customer.id)) return [customer, ...customers];
+    return customers;
+  }, [customers, customer]);
+
   // When customerId changes, load that customer's detail for the contact card
   useEffect(() => {
     if (!customerId) {
@@ -198,6 +233,12 @@ export default function NewJob() {
               <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
                 <div>
                   <label className="block text-sm font-medium text-gray-700">Customer</label>
+                  <input
+                    className="input mt-1"
+                    placeholder="Search by name, address, phone or email…"
+                    value={customerQuery}
+                    onChange={(e) => setCustomerQuery(e.target.value)}
+                  />
                   <select
                     className="input mt-1"
                     value={customerId}
@@ -205,7 +246,7 @@ export default function NewJob() {
                     required
                   >
                     <option value="">Select a customer…</option>
-                    {customers.map((c) => (
+                    {customerOptions.map((c) => (
                       <option key={c.id} value={c.id}>
                         {c.name} {c.address ? `• ${c.address}` : ''}
                       </option>
@@ -227,6 +268,18 @@ export default function NewJob() {
                       </option>
                     ))}
                   </select>
+                  {suggestion && String(suggestion.technician_id) !== String(form.technician_id) && (
+                    <p className="text-xs text-gray-600 mt-1">
+                      Suggested: <span className="font-medium">{suggestion.title}</span>
+                      {suggestion.territories.length > 0 && ` · ${suggestion.territories.join(', ')}`}
+                      {` · ${suggestion.nearby_jobs} job${suggestion.nearby_jobs === 1 ? '' : 's'} nearby that day`}
+                      {' '}
+                      <button type="button" className="text-blue-600 hover:underline"
+                              onClick={() => update('technician_id', String(suggestion.technician_id))}>
+                        Use
+                      </button>
+                    </p>
+                  )}
                 </div>
               </div>
 
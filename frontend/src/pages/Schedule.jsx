@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import FullCalendar from '@fullcalendar/react';
 import resourceTimelinePlugin from '@fullcalendar/resource-timeline';
@@ -8,29 +8,58 @@ import { API_URL } from '../lib/api';
 
 
 const Schedule = ( ) => {
-  const [events, setEvents] = useState([]);
   const [resources, setResources] = useState([]);
   const [error, setError] = useState('');
+  const calendarRef = useRef(null);
 
-  const fetchData = async () => {
+  useEffect(() => {
+    axios.get(`${API_URL}/api/technicians`)
+      .then(res => setResources(res.data))
+      .catch(err => {
+        setError('Failed to fetch schedule data.');
+        console.error(err);
+      });
+  }, []);
+
+  // Patch in other dispatchers' changes as they happen instead of refetching.
+  // EventSource reconnects by itself and resumes from the last event id.
+  useEffect(() => {
+    const source = new EventSource(`${API_URL}/api/changes/stream?entities=job`);
+    source.addEventListener('change', (e) => {
+      const change = JSON.parse(e.data);
+      const api = calendarRef.current?.getApi();
+      if (!api) return;
+      const existing = api.getEventById(String(change.id));
+      if (existing) existing.remove();
+      if (change.op !== 'delete') {
+        api.addEvent(change.data, api.getEventSources()[0]);
+      }
+    });
+    return () => source.close();
+  }, []);
+
+  // Only load the jobs for the visible range, following the keyset cursor
+  // until the window is exhausted.
+  const fetchEvents = async (fetchInfo) => {
     try {
-      const [jobsResponse, techsResponse] = await Promise.all([
-        axios.get(`${API_URL}/api/jobs`),
-        axios.get(`${API_URL}/api/technicians`)
-      ]);
-      setEvents(jobsResponse.data);
-      setResources(techsResponse.data);
+      const jobs = [];
+      let cursor = null;
+      do {
+        const params = { start: fetchInfo.startStr, end: fetchInfo.endStr };
+        if (cursor) params.cursor = cursor;
+        const res = await axios.get(`${API_URL}/api/jobs`, { params });
+        jobs.push(...res.data);
+        cursor = res.headers['x-next-cursor'];
+      } while (cursor);
       setError('');
+      return jobs;
     } catch (err) {
       setError('Failed to fetch schedule data.');
       console.error(err);
+      throw err;
     }
   };
 
-  useEffect(() => {
-    fetchData();
-  }, []);
-
   // --- THIS IS THE NEW FUNCTION FOR DRAG-AND-DROP ---
   const handleEventDrop = async (dropInfo) => {
     const { event } = dropInfo;
@@ -42,18 +71,13 @@ const Schedule = ( ) => {
     };
 
     try {
-      // Send the update to the backend
+      // Send the update to the backend; FullCalendar already shows the moved event
       await axios.put(`${API_URL}/api/jobs/${event.id}`, updatedJobPayload);
-      
-      // Optimistically update the UI right away for a smooth experience
-      setEvents(prevEvents => prevEvents.map(e => 
-        e.id === parseInt(event.id) 
-          ? { ...e, start: event.start.toISOString(), resourceId: newResourceId } 
-          : e
-      ));
 
     } catch (err) {
-      setError('Failed to update job. Please try again.');
+      setError(err.response?.status === 409
+        ? 'That technician is already booked at that time.'
+        : 'Failed to update job. Please try again.');
       console.error(err);
       // If the API call fails, revert the change in the UI
       dropInfo.revert();
@@ -72,6 +96,7 @@ const Schedule = ( ) => {
 
       <div className="bg-white p-4 rounded-lg shadow-lg">
         <FullCalendar
+          ref={calendarRef}
           plugins={[resourceTimelinePlugin, interactionPlugin]}
           initialView="resourceTimelineDay"
           schedulerLicenseKey="GPL-My-Project-Is-Open-Source"
@@ -83,7 +108,7 @@ const Schedule = ( ) => {
           }}
           editable={true}
           resources={resources}
-          events={events}
+          events={fetchEvents}
           eventDrop={handleEventDrop} // <-- ADD THIS HANDLER
         />
       </div>